@@ -83,7 +83,9 @@ class AnacondaProject(object):
                                 env_spec_name=None,
                                 command_name=None,
                                 command=None,
-                                extra_command_args=None):
+                                extra_command_args=None,
+                                use_cache=False,
+                                parallel_provide=False):
         """Prepare a project to run one of its commands.
 
         "Locally" means a machine where development will go on,
@@ -123,6 +125,8 @@ class AnacondaProject(object):
             command_name (str): which named command to choose from the project, None for default
             command (ProjectCommand): a command object (alternative to command_name)
             extra_command_args (list): extra args to include in the returned command argv
+            use_cache (bool): True to reuse an earlier identical prepare if nothing it used has changed
+            parallel_provide (bool): True to provide independent requirements at the same time
 
         Returns:
             a ``PrepareResult`` instance, which has a ``failed`` flag
@@ -134,7 +138,9 @@ class AnacondaProject(object):
                                                    env_spec_name=env_spec_name,
                                                    command_name=command_name,
                                                    command=command,
-                                                   extra_command_args=extra_command_args)
+                                                   extra_command_args=extra_command_args,
+                                                   use_cache=use_cache,
+                                                   parallel_provide=parallel_provide)
 
     def prepare_project_production(self,
                                    project,
@@ -142,7 +148,9 @@ class AnacondaProject(object):
                                    env_spec_name=None,
                                    command_name=None,
                                    command=None,
-                                   extra_command_args=None):
+                                   extra_command_args=None,
+                                   use_cache=False,
+                                   parallel_provide=False):
         """Prepare a project to run one of its commands.
 
         "Production" means some sort of production deployment, so
@@ -166,6 +174,8 @@ class AnacondaProject(object):
             command_name (str): which named command to choose from the project, None for default
             command (ProjectCommand): a command object (alternative to command_name)
             extra_command_args (list): extra args to include in the returned command argv
+            use_cache (bool): True to reuse an earlier identical prepare if nothing it used has changed
+            parallel_provide (bool): True to provide independent requirements at the same time
 
         Returns:
             a ``PrepareResult`` instance, which has a ``failed`` flag
@@ -177,7 +187,9 @@ class AnacondaProject(object):
                                                    env_spec_name=env_spec_name,
                                                    command_name=command_name,
                                                    command=command,
-                                                   extra_command_args=extra_command_args)
+                                                   extra_command_args=extra_command_args,
+                                                   use_cache=use_cache,
+                                                   parallel_provide=parallel_provide)
 
     def prepare_project_check(self,
                               project,
@@ -185,7 +197,9 @@ class AnacondaProject(object):
                               env_spec_name=None,
                               command_name=None,
                               command=None,
-                              extra_command_args=None):
+                              extra_command_args=None,
+                              use_cache=False,
+                              parallel_provide=False):
         """Prepare a project to run one of its commands.
 
         This version only checks the status of the project's
@@ -204,6 +218,8 @@ class AnacondaProject(object):
             command_name (str): which named command to choose from the project, None for default
             command (ProjectCommand): a command object (alternative to command_name)
             extra_command_args (list): extra args to include in the returned command argv
+            use_cache (bool): True to reuse an earlier identical prepare if nothing it used has changed
+            parallel_provide (bool): True to provide independent requirements at the same time
 
         Returns:
             a ``PrepareResult`` instance, which has a ``failed`` flag
@@ -215,7 +231,9 @@ class AnacondaProject(object):
                                                    env_spec_name=env_spec_name,
                                                    command_name=command_name,
                                                    command=command,
-                                                   extra_command_args=extra_command_args)
+                                                   extra_command_args=extra_command_args,
+                                                   use_cache=use_cache,
+                                                   parallel_provide=parallel_provide)
 
     def prepare_project_browser(self,
                                 project,
@@ -511,6 +529,23 @@ class AnacondaProject(object):
         """
         return project_ops.remove_packages(project=project, env_spec_name=env_spec_name, packages=packages)
 
+    def prepare_all_env_specs(self, project, max_workers=None):
+        """Create or update the environments for every env spec in the project.
+
+        Unlike the other prepare calls, which set up only the env
+        spec needed by one command, this provisions all of them.
+        Env specs which don't inherit from one another are
+        provisioned in parallel.
+
+        Args:
+            project (Project): the project
+            max_workers (int): maximum number of environments to update at once, None for a default
+
+        Returns:
+            ``Status`` instance
+        """
+        return project_ops.prepare_all_env_specs(project=project, max_workers=max_workers)
+
     def add_command(self, project, name, command_type, command, env_spec_name=None, supports_http_options=None):
         """Add a command to anaconda-project.yml.
 
@@ -628,26 +663,61 @@ class AnacondaProject(object):
         """
         return project_ops.clean(project=project, prepare_result=prepare_result)
 
-    def archive(self, project, filename):
+    def archive(self,
+                project,
+                filename,
+                compression_level=None,
+                threads=None,
+                fileobj=None,
+                reproducible=False,
+                delta=False,
+                record_manifest=False):
         """Make an archive of the non-ignored files in the project.
 
+        Files which are already compressed, such as images or zip files,
+        are stored in zip archives without compressing them again.
+
         Args:
             project (``Project``): the project
-            filename (str): name of a zip, tar.gz, or tar.bz2 archive file
+            filename (str): name of a zip, tar.gz, tar.bz2, or tar.xz archive file
+            compression_level (int): 0 (fastest) to 9 (smallest), None for the format's default
+            threads (int): most threads to compress with, None for a default
+            fileobj (file): write the archive here, such as to a pipe, rather than to filename;
+                filename then only picks the format
+            reproducible (bool): give every file the same time, owner, and permissions (but for
+                being executable), so unchanged files always make the same archive
+            delta (bool): only archive the files changed or added since the last archive of
+                the project with a recorded manifest, and a list of the files deleted since;
+                ``unarchive`` with apply_delta applies it on top of the project unpacked from
+                that last archive
+            record_manifest (bool): remember which files were archived, so the next archive
+                can be a delta; this hashes every file changed since the last recorded manifest
 
         Returns:
             a ``Status``, if failed has ``errors``
         """
-        return project_ops.archive(project=project, filename=filename)
-
-    def unarchive(self, filename, project_dir, parent_dir=None):
+        return project_ops.archive(project=project,
+                                   filename=filename,
+                                   compression_level=compression_level,
+                                   threads=threads,
+                                   fileobj=fileobj,
+                                   reproducible=reproducible,
+                                   delta=delta,
+                                   record_manifest=record_manifest)
+
+    def unarchive(self, filename, project_dir, parent_dir=None, apply_delta=False):
         """Unpack an archive of the project.
 
+        With apply_delta, a delta archive (see ``archive``) is applied
+        to the existing project_dir instead of unpacking a fresh copy.
+        Without it, delta archives are refused.
+
         The archive can be untrusted (we will safely defeat attempts
         to put evil links in it, for example), but this function
         doesn't load or validate the unpacked project.
 
-        The target directory must not exist or it's an error.
+        The target directory must not exist or it's an error, unless
+        applying a delta archive.
 
         project_dir can be None to auto-choose one.
 
@@ -655,17 +725,21 @@ class AnacondaProject(object):
         if project_dir is None.
 
         Args:
-            filename (str): name of a zip, tar.gz, or tar.bz2 archive file
+            filename (str): name of a zip, tar.gz, tar.bz2, or tar.xz archive file
             project_dir (str): the directory to place the project inside
             parent_dir (str): directory to place project_dir within
+            apply_delta (bool): apply a delta archive to the existing project_dir
 
         Returns:
             a ``Status``, if failed has ``errors``, on success has ``project_dir`` property.
 
         """
-        return project_ops.unarchive(filename=filename, project_dir=project_dir, parent_dir=parent_dir)
+        return project_ops.unarchive(filename=filename,
+                                     project_dir=project_dir,
+                                     parent_dir=parent_dir,
+                                     apply_delta=apply_delta)
 
-    def upload(self, project, site=None, username=None, token=None, log_level=None):
+    def upload(self, project, site=None, username=None, token=None, log_level=None, force=False):
         """Upload the project to the Anaconda server.
 
         Args:
@@ -674,8 +748,14 @@ class AnacondaProject(object):
             username (str): Anaconda username
             token (str): Anaconda auth token
             log_level (str): Anaconda log level
+            force (bool): upload even if the project hasn't changed since the last upload
 
         Returns:
             a ``Status``, if failed has ``errors``
         """
-        return project_ops.upload(project=project, site=site, username=username, token=token, log_level=log_level)
+        return project_ops.upload(project=project,
+                                  site=site,
+                                  username=username,
+                                  token=token,
+                                  log_level=log_level,
+                                  force=force)
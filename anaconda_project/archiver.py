@@ -7,65 +7,271 @@
 """Bundle up a project for shipment."""
 from __future__ import absolute_import, print_function
 
+import bz2
 import codecs
+import collections
 import errno
-import fnmatch
+import hashlib
+import json
+import math
 import os
 import platform
+import posixpath
+import re
 import shutil
+import stat
+import struct
 import subprocess
 import tarfile
 import tempfile
+import time
 import uuid
 import zipfile
+import zlib
 
 from anaconda_project.internal import logged_subprocess
 from anaconda_project.internal.simple_status import SimpleStatus
 from anaconda_project.internal.directory_contains import subdirectory_relative_to_directory
+from anaconda_project.internal.download_cache import format_size
 from anaconda_project.internal.rename import rename_over_existing
 from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.parallel import parallel_imap, parallel_map
+from anaconda_project.internal import parallel_xz
+from anaconda_project.internal import ziputils
+from anaconda_project.internal.parallel_gzip import ParallelGzipWriter
+from anaconda_project.internal.parallel_xz import ParallelXzWriter
+from anaconda_project.internal.scandir import scandir
+from anaconda_project.internal.user_cache import user_cache_directory
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# zip members bigger than this wait on disk to be written
+_ZIP_SPOOL_SIZE = 8 * 1024 * 1024
+
+# the zip records we write, laid out as in the zip spec (APPNOTE.TXT)
+_ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_ZIP_CENTRAL_DIRECTORY_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = struct.Struct('<4sLQL')
+_ZIP_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4s4H2LH')
+
+# sizes and offsets bigger than this, or more members than
+# _ZIP_COUNT_LIMIT, need the zip64 extensions
+_ZIP64_LIMIT = zipfile.ZIP64_LIMIT
+_ZIP_COUNT_LIMIT = 0xffff
+
+# 1980-01-01, the earliest time a zip can hold
+_ZIP_EPOCH = 315532800
+
+# in a delta archive, lists the files to delete before unpacking the
+# rest, and which version of the project the delta goes on top of
+_DELTA_FILENAME = ".anaconda-project-delta.json"
+
+# in an unpacked project, identifies the version of the project it
+# is, so we only apply a delta archive made from that version
+_MANIFEST_DIGEST_FILENAME = ".anaconda-project-manifest-digest.json"
+
+# how many paths to give git at once when looking for empty directories
+_GIT_PATHSPECS_PER_COMMAND = 100
+
+# formats which are already compressed, so deflating them again is a waste of time
+_INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.7z', '.bz2', '.conda', '.egg', '.gz', '.jar', '.lz', '.lzma', '.nupkg', '.rar', '.tbz2', '.tgz', '.txz', '.whl',
+    '.xz', '.z', '.zip', '.zst', '.avif', '.gif', '.heic', '.jpeg', '.jpg', '.png', '.webp', '.aac', '.flac', '.m4a',
+    '.mp3', '.ogg', '.opus', '.avi', '.m4v', '.mkv', '.mov', '.mp4', '.webm', '.docx', '.odt', '.pptx', '.xlsx',
+    '.parquet', '.pdf'
+])
+
+# how much of a file to look at when guessing whether it's compressible
+_ENTROPY_SAMPLE_SIZE = 64 * 1024
+# a sample smaller than this can't look random even if it is
+_MIN_ENTROPY_SAMPLE_SIZE = 4 * 1024
+# bits per byte above which data is probably compressed or encrypted
+_INCOMPRESSIBLE_ENTROPY = 7.5
 
 
 class _FileInfo(object):
-    def __init__(self, project_directory, filename, is_directory):
-        self.full_path = os.path.abspath(filename)
-        self.relative_path = os.path.relpath(self.full_path, start=project_directory)
+    # there's one of these for every file in the project, so keep them small
+    __slots__ = ('full_path', 'relative_path', 'unixified_relative_path', 'is_directory', 'is_leaf', '_entry',
+                 '_stat')
+
+    def __init__(self, full_path, relative_path, is_directory, entry=None):
+        self.full_path = full_path
+        self.relative_path = relative_path
         if platform.system() == 'Windows':
-            self.unixified_relative_path = self.relative_path.replace("\\", "/")
+            self.unixified_relative_path = relative_path.replace("\\", "/")
         else:
-            self.unixified_relative_path = self.relative_path
-        self.basename = os.path.basename(self.full_path)
+            self.unixified_relative_path = relative_path
         self.is_directory = is_directory
+        # a directory is a leaf if nothing inside it is in the project
+        self.is_leaf = True
+        # the scandir DirEntry, if we have one
+        self._entry = entry
+        self._stat = None
+
+    @property
+    def basename(self):
+        if self._entry is not None:
+            return self._entry.name
+        return os.path.basename(self.full_path)
+
+    @property
+    def stat(self):
+        if self._stat is None:
+            if self._entry is not None:
+                # scandir may already have this
+                self._stat = self._entry.stat()
+            else:
+                self._stat = os.stat(self.full_path)
+        return self._stat
+
+
+def _walk_directory(directory, ignore_filter, parent):
+    # each item is (directory info, or None for the project, scandir iterator)
+    stack = [(parent, scandir(directory))]
+    while len(stack) > 0:
+        (parent, entries) = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            if parent is not None:
+                yield parent
+            continue
 
+        if parent is None:
+            relative_path = entry.name
+        else:
+            relative_path = os.path.join(parent.relative_path, entry.name)
+        # like os.walk, a symlink to a directory counts as a directory but we don't follow it
+        info = _FileInfo(entry.path, relative_path, is_directory=entry.is_dir(), entry=entry)
+        if ignore_filter(info):
+            continue
+        if parent is not None:
+            parent.is_leaf = False
 
-def _list_project(project_directory, ignore_filter, errors):
-    try:
-        file_infos = []
-        for root, dirs, files in os.walk(project_directory):
-            filtered_dirs = []
-            for d in dirs:
-                info = _FileInfo(project_directory=project_directory, filename=os.path.join(root, d), is_directory=True)
-                if ignore_filter(info):
-                    continue
-                else:
-                    filtered_dirs.append(d)
-                    file_infos.append(info)
-
-            # don't even recurse into filtered-out directories, mostly because recursing into
-            # "envs" is very slow
-            dirs[:] = filtered_dirs
-
-            for f in files:
-                info = _FileInfo(project_directory=project_directory,
-                                 filename=os.path.join(root, f),
-                                 is_directory=False)
-                if not ignore_filter(info):
-                    file_infos.append(info)
-
-        return file_infos
-    except OSError as e:
-        errors.append("Could not list files in %s: %s." % (project_directory, str(e)))
-        return None
+        if info.is_directory and not entry.is_symlink():
+            try:
+                stack.append((info, scandir(info.full_path)))
+            except OSError:
+                yield info
+        else:
+            yield info
+
+
+def _walk_project(project_directory, ignore_filter):
+    """Generate a ``_FileInfo`` for each file and directory which isn't ignored.
+
+    Directories come after everything inside them, so their
+    ``is_leaf`` is known by the time they're generated. Ignored
+    directories are not walked into, mostly because walking "envs"
+    is very slow. Directories we can't read are skipped, like
+    ``os.walk`` does, but failing to read project_directory itself
+    raises ``OSError``.
+    """
+    return _walk_directory(os.path.abspath(project_directory), ignore_filter, parent=None)
+
+
+def _git_project_infos(project_directory, ignore_filter, git_paths):
+    """Generate a ``_FileInfo`` for each file git listed which isn't ignored.
+
+    Git only lists files, so we check each file's parent
+    directories against ignore_filter too (once per directory),
+    and generate them after everything inside them as
+    ``_walk_project`` does. Anything git lists which is a
+    directory, such as a submodule or an empty directory, is
+    walked.
+    """
+    project_directory = os.path.abspath(project_directory)
+    directory_ignored = dict()
+
+    def is_directory_ignored(relative_path):
+        if relative_path == '':
+            return False
+        if relative_path not in directory_ignored:
+            info = _FileInfo(os.path.join(project_directory, relative_path), relative_path, is_directory=True)
+            directory_ignored[relative_path] = (is_directory_ignored(os.path.dirname(relative_path)) or
+                                                ignore_filter(info))
+        return directory_ignored[relative_path]
+
+    # the parent directories of the current path; git sorts the
+    # paths, so everything inside a directory comes together
+    parents = []
+
+    for git_path in git_paths:
+        relative_path = os.path.normpath(git_path)
+        full_path = os.path.join(project_directory, relative_path)
+        try:
+            st = os.lstat(full_path)
+        except OSError:
+            # deleted, but still in git's index
+            continue
+        is_symlink = stat.S_ISLNK(st.st_mode)
+        is_directory = stat.S_ISDIR(st.st_mode) or (is_symlink and os.path.isdir(full_path))
+        parent_path = os.path.dirname(relative_path)
+        if is_directory_ignored(parent_path):
+            continue
+        info = _FileInfo(full_path, relative_path, is_directory=is_directory)
+        if ignore_filter(info):
+            continue
+
+        while len(parents) > 0 and not (parent_path + os.sep).startswith(parents[-1].relative_path + os.sep):
+            yield parents.pop()
+        ancestors = []
+        while parent_path != '' and (len(parents) == 0 or parent_path != parents[-1].relative_path):
+            ancestors.append(parent_path)
+            parent_path = os.path.dirname(parent_path)
+        for ancestor in reversed(ancestors):
+            parent = _FileInfo(os.path.join(project_directory, ancestor), ancestor, is_directory=True)
+            parent.is_leaf = False
+            parents.append(parent)
+
+        if is_directory and not is_symlink:
+            try:
+                for child in _walk_directory(full_path, ignore_filter, parent=info):
+                    yield child
+            except OSError:
+                yield info
+        else:
+            yield info
+
+    while len(parents) > 0:
+        yield parents.pop()
+
+
+def _glob_to_regex(pattern):
+    # the same translation fnmatch.translate does, but without the
+    # anchors and flags it adds, so we can combine patterns.
+    i = 0
+    n = len(pattern)
+    result = ''
+    while i < n:
+        c = pattern[i]
+        i = i + 1
+        if c == '*':
+            result = result + '.*'
+        elif c == '?':
+            result = result + '.'
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j = j + 1
+            if j < n and pattern[j] == ']':
+                j = j + 1
+            while j < n and pattern[j] != ']':
+                j = j + 1
+            if j >= n:
+                result = result + '\\['
+            else:
+                stuff = pattern[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] == '^':
+                    stuff = '\\' + stuff
+                result = '%s[%s]' % (result, stuff)
+        else:
+            result = result + re.escape(c)
+    return result
 
 
 class _FilePattern(object):
@@ -74,39 +280,59 @@ class _FilePattern(object):
         # the glob string
         self.pattern = pattern
 
-    def matches(self, info):
-        # Unlike .gitignore, this is a path-unaware match; fnmatch doesn't pay
-        # any attention to "/" as a special character. However, on Windows, we
-        # have fixed up unixified_relative_path to have / instead of \, so that
-        # it will match patterns specified with /.
-        def match(path, pattern):
-            assert path.startswith("/")
-            while path != '/':
-                if fnmatch.fnmatch(path, pattern):
-                    return True
-                # this assumes that on Windows, dirname on a unixified path
-                # will do the right thing...
-                path = os.path.dirname(path)
-            return False
-
-        if self.pattern.startswith("/"):
+        if pattern.startswith("/"):
             # we have to match the full path or one of its parents exactly
-            pattern = self.pattern
+            glob = pattern
         else:
             # we only have to match the end of the path (implicit "*/")
-            pattern = "*/" + self.pattern
-
-        # So that */ matches even plain "foo" we need to start with /
-        match_against = "/" + info.unixified_relative_path
+            glob = "*/" + pattern
 
         # ending with / means only match directories
-        if pattern.endswith("/"):
-            if info.is_directory:
-                return match(match_against, pattern[:-1])
-            else:
-                return False
+        self.directories_only = glob.endswith("/")
+        if self.directories_only:
+            glob = glob[:-1]
+
+        # Unlike .gitignore, this is a path-unaware match; "*"
+        # matches "/" like any other character. However, on
+        # Windows, we have fixed up unixified_relative_path to have
+        # / instead of \, so that it will match patterns specified
+        # with /.
+        self.regex = _glob_to_regex(glob)
+
+    def matches(self, info):
+        return _PatternMatcher([self]).matches(info)
+
+
+class _PatternMatcher(object):
+    """A set of ``_FilePattern`` compiled into one regular expression.
+
+    A path matches if the path or one of its parent directories
+    matches any pattern, so we match against the start of the path
+    and require the match to end where a path component does.
+    """
+
+    def __init__(self, patterns):
+        self._for_files = self._compile([pattern for pattern in patterns if not pattern.directories_only])
+        self._for_directories = self._compile(patterns)
+
+    def _compile(self, patterns):
+        if len(patterns) == 0:
+            return None
+        flags = re.DOTALL
+        if platform.system() == 'Windows':
+            # like fnmatch, which uses os.path.normcase
+            flags = flags | re.IGNORECASE
+        # (?<=.) is because "/" itself isn't a parent we match against
+        alternatives = "|".join(["(?:%s)" % pattern.regex for pattern in patterns])
+        return re.compile("(?:%s)(?<=.)(?=/|\\Z)" % alternatives, flags)
+
+    def matches(self, info):
+        if info.is_directory:
+            regex = self._for_directories
         else:
-            return match(match_against, pattern)
+            regex = self._for_files
+        # So that */ matches even plain "foo" we need to start with /
+        return regex is not None and regex.match("/" + info.unixified_relative_path) is not None
 
 
 def _parse_ignore_file(filename, errors):
@@ -144,159 +370,706 @@ def _load_ignore_file(project_directory, errors):
     return _parse_ignore_file(ignore_file, errors)
 
 
-def _git_ignored_files(project_directory, errors):
+def _git_pathspec_excludes(patterns):
+    # Telling git about simple patterns like "/envs" saves it listing
+    # every file in there, only for us to ignore them.
+    excludes = []
+    for pattern in patterns:
+        glob = pattern.pattern
+        if glob.startswith("/") and len(glob) > 1 and not pattern.directories_only and \
+           not any(c in glob for c in "*?[\\"):
+            excludes.append(":(exclude)" + glob[1:])
+    return excludes
+
+
+def _contains_files(directory):
+    # stops at the first file, a directory full of them may be big
+    stack = [directory]
+    while len(stack) > 0:
+        try:
+            entries = list(scandir(stack.pop()))
+        except OSError:
+            return True
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            else:
+                return True
+    return False
+
+
+def _git_empty_directories(project_directory, git_paths):
+    # git only lists files, so empty directories have to be found
+    # another way. Only the directories git listed files in can
+    # hold one we want, so we only look in those; a directory not
+    # listed which has any file in it only has files git ignores.
+    listed = set([''])
+    for git_path in git_paths:
+        listed.add(git_path)
+        parent = posixpath.dirname(git_path)
+        while parent not in listed:
+            listed.add(parent)
+            parent = posixpath.dirname(parent)
+
+    candidates = []
+    for directory in sorted(listed):
+        full_path = os.path.join(project_directory, directory)
+        if not os.path.isdir(full_path) or os.path.islink(full_path):
+            continue
+        try:
+            entries = list(scandir(full_path))
+        except OSError:
+            continue
+        for entry in entries:
+            path = posixpath.join(directory, entry.name)
+            if path != '.git' and path not in listed and entry.is_dir(follow_symlinks=False) and \
+               not _contains_files(entry.path):
+                candidates.append(path)
+
+    # git lists the candidates it doesn't ignore as "name/"
+    empty = []
+    for i in range(0, len(candidates), _GIT_PATHSPECS_PER_COMMAND):
+        pathspecs = [':(literal)' + path for path in candidates[i:i + _GIT_PATHSPECS_PER_COMMAND]]
+        output = logged_subprocess.check_output(
+            ['git', 'ls-files', '-z', '--others', '--exclude-standard', '--directory', '--'] + pathspecs,
+            cwd=project_directory)
+        empty.extend([path for path in output.decode('utf-8').split('\0') if path.endswith('/')])
+    return empty
+
+
+def _git_project_files(project_directory, patterns, errors):
     if not os.path.exists(os.path.join(project_directory, ".git")):
-        return []
+        return None
 
     # It is pretty involved to parse .gitignore correctly. Lots of
     # little syntax rules that don't quite match python's fnmatch,
     # there can be multiple .gitignore, and there are also things
     # in the git config file that affect what's ignored.  So we
     # let git do this itself. If the project has a `.git` we assume
-    # the user is using git.
+    # the user is using git, and ask git for the files instead of
+    # walking the whole directory.
 
-    # --other means show untracked (not added) files
-    # --ignored means show ignored files
-    # --exclude-standard means use the usual .gitignore and other configuration
-    # --directory means output "node_modules/" if it's ignored, not 100000 JS files
+    # --cached means show files git knows about
+    # --others means show untracked (not added) files
+    # --exclude-standard means leave out files ignored by .gitignore and other configuration
+    # -z means don't quote unusual filenames, separate them with NUL
     try:
         output = logged_subprocess.check_output(
-            ['git', 'ls-files', '--others', '--ignored', '--exclude-standard', '--directory'],
+            ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--', '.'] +
+            _git_pathspec_excludes(patterns),
             cwd=project_directory)
-        # for whatever reason, git doesn't include the ".git" in the ignore list
-        return [".git"] + output.decode('utf-8').splitlines()
+        # a file can be listed twice if it has merge conflicts
+        paths = set([path for path in output.decode('utf-8').split('\0') if path != ''])
+        paths.update(_git_empty_directories(project_directory, paths))
+        return sorted(paths)
     except subprocess.CalledProcessError as e:
         message = e.output.decode('utf-8').replace("\n", " ")
-        errors.append("'git ls-files' failed to list ignored files: %s." % (message))
+        errors.append("'git ls-files' failed to list project files: %s." % (message))
         return None
     except OSError as e:
         errors.append("Failed to run 'git ls-files'; %s" % str(e))
         return None
 
 
-def _git_filter(project_directory, errors):
-    git_ignored = _git_ignored_files(project_directory, errors)
-    if git_ignored is None:
-        assert errors
-        return None
-
-    git_ignored = set(git_ignored)
-
-    def is_git_ignored(info):
-        path = info.relative_path
-        while path != '':
-            assert path != '/'  # would infinite loop
-            # git ls-files seems to append "/" to dirs when using --directory
-            if path in git_ignored or (path + '/') in git_ignored:
-                return True
-            path = os.path.dirname(path)
-        return False
-
-    return is_git_ignored
-
-
-def _ignore_file_filter(project_directory, errors):
+def _archive_patterns(project_directory, errors, requirements):
     patterns = _load_ignore_file(project_directory, errors)
     if patterns is None:
         assert errors
         return None
 
-    def matches_some_pattern(info):
-        for pattern in patterns:
-            if pattern.matches(info):
-                return True
-        return False
+    plugin_patterns = set()
+    for req in requirements:
+        plugin_patterns = plugin_patterns.union(req.ignore_patterns)
+    return patterns + [_FilePattern(s) for s in sorted(plugin_patterns)]
 
-    return matches_some_pattern
 
+def _iterate_project(project_directory, errors, requirements, excluded_paths=()):
+    """Get an iterator over the ``_FileInfo`` that go in the project's archive.
 
-def _enumerate_archive_files(project_directory, errors, requirements):
-    git_filter = _git_filter(project_directory, errors)
-    ignore_file_filter = _ignore_file_filter(project_directory, errors)
-    if git_filter is None or ignore_file_filter is None:
-        assert errors
+    Problems found before we start, such as a broken
+    .projectignore, are added to errors and we return None. The
+    iterator can raise ``OSError`` if it fails to list the project.
+    """
+    patterns = _archive_patterns(project_directory, errors, requirements)
+    if patterns is None:
         return None
 
-    plugin_patterns = set()
-    for req in requirements:
-        plugin_patterns = plugin_patterns.union(req.ignore_patterns)
-    plugin_patterns = [_FilePattern(s) for s in plugin_patterns]
+    # checking every pattern against every file one at a time is
+    # very slow for big projects, so we match them all at once
+    matcher = _PatternMatcher(patterns)
+    excluded_paths = set(excluded_paths)
 
-    def is_plugin_generated(info):
-        for pattern in plugin_patterns:
-            if pattern.matches(info):
-                return True
-        return False
+    def ignore_filter(info):
+        return info.relative_path in excluded_paths or matcher.matches(info)
+
+    if os.path.exists(os.path.join(project_directory, ".git")):
+        git_paths = _git_project_files(project_directory, patterns, errors)
+        if git_paths is None:
+            assert errors
+            return None
+        return _git_project_infos(project_directory, ignore_filter, git_paths)
+    else:
+        return _walk_project(project_directory, ignore_filter)
 
-    def all_filters(info):
-        return git_filter(info) or ignore_file_filter(info) or is_plugin_generated(info)
 
-    infos = _list_project(project_directory, all_filters, errors)
+def _enumerate_archive_files(project_directory, errors, requirements, excluded_paths=()):
+    infos = _iterate_project(project_directory, errors, requirements, excluded_paths)
     if infos is None:
-        assert errors
         return None
 
-    return infos
+    try:
+        return list(infos)
+    except OSError as e:
+        errors.append("Could not list files in %s: %s." % (project_directory, str(e)))
+        return None
 
 
 def _leaf_infos(infos):
-    all_by_name = dict()
-    for info in infos:
-        all_by_name[info.relative_path] = info
-    for info in infos:
-        parent = os.path.dirname(info.relative_path)
-        while parent != '':
-            assert parent != '/'  # would be infinite loop
-            if parent in all_by_name:
-                del all_by_name[parent]
-            parent = os.path.dirname(parent)
+    return sorted([info for info in infos if info.is_leaf], key=lambda x: x.relative_path)
+
+
+class _CompressingWriter(object):
+    # a writable file object feeding a compressor object such as bz2.BZ2Compressor
+    def __init__(self, fileobj, compressor):
+        self._fileobj = fileobj
+        self._compressor = compressor
+
+    def write(self, data):
+        self._fileobj.write(self._compressor.compress(data))
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._fileobj.write(self._compressor.flush())
+            self._fileobj.flush()
+
+
+def _compressing_writer(fileobj, compression, compression_level, max_workers, mtime=None):
+    if compression == "gz":
+        # gzip on all cores, as pigz does
+        return ParallelGzipWriter(fileobj,
+                                  compresslevel=(9 if compression_level is None else compression_level),
+                                  max_workers=max_workers,
+                                  mtime=mtime)
+    elif compression == "xz":
+        # xz on all cores, as xz -T does
+        return ParallelXzWriter(fileobj,
+                                preset=(6 if compression_level is None else compression_level),
+                                max_workers=max_workers)
+    else:
+        assert compression == "bz2"
+        return _CompressingWriter(fileobj, bz2.BZ2Compressor(9 if compression_level is None else
+                                                             max(compression_level, 1)))
+
 
-    return sorted(all_by_name.values(), key=lambda x: x.relative_path)
+def _reproducible_mtime(environ=None):
+    """The time to give every file in a reproducible archive.
 
+    SOURCE_DATE_EPOCH is the usual way to choose it for
+    reproducible builds; otherwise it's the earliest time a zip can
+    hold.
+    """
+    if environ is None:
+        environ = os.environ
+    try:
+        return max(int(environ.get('SOURCE_DATE_EPOCH', '')), _ZIP_EPOCH)
+    except ValueError:
+        return _ZIP_EPOCH
+
+
+def _reproducible_mode(mode, is_directory):
+    # keep only whether it's executable, not whatever the umask was
+    if is_directory or (mode & 0o111) != 0:
+        return 0o755
+    else:
+        return 0o644
+
+
+def _write_tar(archive_root_name,
+               infos,
+               fileobj,
+               compression,
+               logs,
+               compression_level=None,
+               max_workers=None,
+               reproducible=False):
+    if reproducible:
+        mtime = _reproducible_mtime()
+
+        def normalize(tarinfo):
+            tarinfo.mtime = mtime
+            tarinfo.mode = _reproducible_mode(tarinfo.mode, tarinfo.isdir())
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = ''
+            return tarinfo
+
+        # the default format depends on the Python version
+        tar_format = tarfile.GNU_FORMAT
+    else:
+        mtime = None
+        normalize = None
+        tar_format = tarfile.DEFAULT_FORMAT
+
+    # tarfile's stream mode doesn't seek, so fileobj can be a pipe
+    def write_all(f):
+        with tarfile.open(fileobj=f, mode='w|', format=tar_format) as tf:
+            for info in _leaf_infos(infos):
+                arcname = os.path.join(archive_root_name, info.relative_path)
+                logs.append("  added %s" % arcname)
+                tf.add(info.full_path, arcname=arcname, filter=normalize)
 
-def _write_tar(archive_root_name, infos, filename, compression, logs):
     if compression is None:
-        compression = ""
+        write_all(fileobj)
     else:
-        compression = ":" + compression
-    with tarfile.open(filename, ('w%s' % compression)) as tf:
-        for info in _leaf_infos(infos):
-            arcname = os.path.join(archive_root_name, info.relative_path)
-            logs.append("  added %s" % arcname)
-            tf.add(info.full_path, arcname=arcname)
+        with _compressing_writer(fileobj, compression, compression_level, max_workers, mtime=mtime) as writer:
+            write_all(writer)
+
+
+def _entropy(data):
+    """Shannon entropy of the bytes in data, in bits per byte."""
+    total = float(len(data))
+    return -sum((count / total) * math.log(count / total, 2)
+                for count in collections.Counter(bytearray(data)).values())
+
+
+def _looks_incompressible(sample):
+    if len(sample) < _MIN_ENTROPY_SAMPLE_SIZE:
+        return False
+    return _entropy(sample[:_ENTROPY_SAMPLE_SIZE]) > _INCOMPRESSIBLE_ENTROPY
+
+
+def _spool_zip_member(full_path, zinfo, spool_dir, compression_level):
+    # runs on a worker thread; zlib releases the GIL while it compresses.
+    # the CRC and sizes go in the local header before the data, where
+    # zip readers which can't seek (such as Java's ZipInputStream)
+    # need them, so we compute them while the data waits in a spool.
+    deflate = compression_level != 0 and os.path.splitext(full_path)[1].lower() not in _INCOMPRESSIBLE_EXTENSIONS
+    crc = 0
+    size = 0
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    spool = tempfile.SpooledTemporaryFile(max_size=_ZIP_SPOOL_SIZE, dir=spool_dir)
+    try:
+        with open(full_path, 'rb') as f:
+            while True:
+                chunk = f.read(_COPY_CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                if size == 0 and deflate and _looks_incompressible(chunk):
+                    deflate = False
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                spool.write(compressor.compress(chunk) if deflate else chunk)
+        if deflate:
+            spool.write(compressor.flush())
+    except Exception as e:
+        spool.close()
+        raise e
+    if deflate and spool.tell() >= size:
+        # deflating didn't help, it happens with tiny files
+        spool.close()
+        return _spool_zip_member(full_path, zinfo, spool_dir, 0)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED
+    zinfo.CRC = crc & 0xffffffff
+    zinfo.file_size = size
+    zinfo.compress_size = spool.tell()
+    spool.seek(0)
+    return spool
+
+
+def _zip_dos_date_time(date_time):
+    (year, month, day, hour, minute, second) = date_time
+    return (((year - 1980) << 9) | (month << 5) | day, (hour << 11) | (minute << 5) | (second // 2))
+
+
+def _zip_encoded_filename(zinfo):
+    # as zipfile does, names which aren't ASCII are UTF-8 with flag bit 11 set
+    filename = zinfo.filename
+    if isinstance(filename, bytes):
+        # a str on Python 2
+        return (filename, zinfo.flag_bits)
+    try:
+        return (filename.encode('ascii'), zinfo.flag_bits)
+    except UnicodeEncodeError:
+        return (filename.encode('utf-8'), zinfo.flag_bits | 0x800)
+
+
+class _ZipWriter(object):
+    """Writes a zip file one member at a time, without seeking.
 
+    ``zipfile.ZipFile`` only writes data it compresses itself, and
+    our members are compressed on other threads, so we write the
+    zip records ourselves. ``zipfile.ZipInfo`` just holds each
+    member's name, times, attributes, and sizes.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._offset = 0
+        # (zinfo, encoded filename, flag bits, local header offset)
+        self._members = []
+
+    def _write(self, data):
+        self._fileobj.write(data)
+        self._offset += len(data)
+
+    def _write_local_header(self, zinfo, zip64):
+        (filename, flag_bits) = _zip_encoded_filename(zinfo)
+        self._members.append((zinfo, filename, flag_bits, self._offset))
+        if zip64:
+            extra = struct.pack('<2H2Q', 1, 16, zinfo.file_size, zinfo.compress_size)
+            (compress_size, file_size) = (0xffffffff, 0xffffffff)
+        else:
+            extra = b''
+            (compress_size, file_size) = (zinfo.compress_size, zinfo.file_size)
+        (dos_date, dos_time) = _zip_dos_date_time(zinfo.date_time)
+        self._write(
+            _ZIP_LOCAL_HEADER.pack(b'PK\x03\x04', 45 if zip64 else 20, 0, flag_bits, zinfo.compress_type, dos_time,
+                                   dos_date, zinfo.CRC, compress_size, file_size, len(filename), len(extra)) +
+            filename + extra)
+
+    def write_member(self, zinfo, data):
+        """Write a member whose CRC and sizes are already in zinfo.
+
+        data is a file object with the member's data, compressed as
+        ``zinfo.compress_type`` says, or None for a directory.
+        """
+        self._write_local_header(zinfo, zinfo.file_size > _ZIP64_LIMIT or zinfo.compress_size > _ZIP64_LIMIT)
+        if data is not None:
+            while True:
+                chunk = data.read(_COPY_CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                self._write(chunk)
+
+    def close(self):
+        """Write the central directory, which finishes the zip."""
+        start = self._offset
+        for (zinfo, filename, flag_bits, header_offset) in self._members:
+            fields = [zinfo.file_size, zinfo.compress_size, header_offset]
+            zip64_values = [value for value in fields if value > _ZIP64_LIMIT]
+            if len(zip64_values) > 0:
+                extra = struct.pack('<2H%dQ' % len(zip64_values), 1, 8 * len(zip64_values), *zip64_values)
+                (file_size, compress_size, header_offset) = [value if value <= _ZIP64_LIMIT else 0xffffffff
+                                                             for value in fields]
+                version = 45
+            else:
+                extra = b''
+                (file_size, compress_size) = (zinfo.file_size, zinfo.compress_size)
+                version = 20
+            (dos_date, dos_time) = _zip_dos_date_time(zinfo.date_time)
+            self._write(
+                _ZIP_CENTRAL_DIRECTORY_HEADER.pack(b'PK\x01\x02', version, zinfo.create_system, version, 0, flag_bits,
+                                                   zinfo.compress_type, dos_time, dos_date, zinfo.CRC, compress_size,
+                                                   file_size, len(filename), len(extra), 0, 0, zinfo.internal_attr,
+                                                   zinfo.external_attr, header_offset) + filename + extra)
+
+        count = len(self._members)
+        size = self._offset - start
+        if count > _ZIP_COUNT_LIMIT or size > _ZIP64_LIMIT or start > _ZIP64_LIMIT:
+            zip64_end = self._offset
+            # the record's size doesn't count its signature or the size itself
+            record_size = _ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12
+            self._write(
+                _ZIP64_END_OF_CENTRAL_DIRECTORY.pack(b'PK\x06\x06', record_size, 45, 45, 0, 0, count, count, size,
+                                                     start))
+            self._write(_ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR.pack(b'PK\x06\x07', 0, zip64_end, 1))
+            (count, size, start) = (min(count, 0xffff), min(size, 0xffffffff), min(start, 0xffffffff))
+        self._write(_ZIP_END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, count, count, size, start, 0))
+        self._fileobj.flush()
+
+
+def _write_directory_zip_member(writer, zinfo):
+    # as ZipFile.write does for a directory
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+    # the MS-DOS directory flag
+    zinfo.external_attr |= 0x10
+    writer.write_member(zinfo, None)
+
+
+def _write_zip(archive_root_name,
+               infos,
+               fileobj,
+               logs,
+               compression_level=None,
+               max_workers=None,
+               spool_dir=None,
+               reproducible=False):
+    if compression_level is None:
+        compression_level = zlib.Z_DEFAULT_COMPRESSION
+    if reproducible:
+        date_time = time.gmtime(_reproducible_mtime())[0:6]
+
+    def zip_info(info, arcname):
+        st = os.stat(info.full_path)
+        if reproducible:
+            zinfo = zipfile.ZipInfo(arcname, date_time)
+            # ZipInfo guesses from the platform we're on
+            zinfo.create_system = 3
+            mode = (st.st_mode & ~0o7777) | _reproducible_mode(st.st_mode, info.is_directory)
+        else:
+            zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+            mode = st.st_mode
+        zinfo.external_attr = (mode & 0xFFFF) << 16
+        zinfo.file_size = st.st_size
+        return zinfo
+
+    def compress(info):
+        arcname = os.path.join(archive_root_name, info.relative_path)
+        if info.is_directory:
+            return (info, arcname, zip_info(info, arcname + "/"), None)
+        zinfo = zip_info(info, arcname)
+        return (info, arcname, zinfo, _spool_zip_member(info.full_path, zinfo, spool_dir, compression_level))
+
+    deflated = dict(count=0, size=0, compressed_size=0)
+    stored = dict(count=0, size=0)
+    # members are compressed on several threads, a few ahead of the one we're writing
+    writer = _ZipWriter(fileobj)
+    for (info, arcname, zinfo, spool) in parallel_imap(compress, _leaf_infos(infos), max_workers=max_workers):
+        logs.append("  added %s" % arcname)
+        if info.is_directory:
+            _write_directory_zip_member(writer, zinfo)
+            continue
+        try:
+            writer.write_member(zinfo, spool)
+        finally:
+            spool.close()
+        if zinfo.compress_type == zipfile.ZIP_STORED:
+            stored['count'] += 1
+            stored['size'] += zinfo.file_size
+        else:
+            deflated['count'] += 1
+            deflated['size'] += zinfo.file_size
+            deflated['compressed_size'] += zinfo.compress_size
+    writer.close()
 
-def _write_zip(archive_root_name, infos, filename, logs):
-    with zipfile.ZipFile(filename, 'w') as zf:
-        for info in _leaf_infos(infos):
-            arcname = os.path.join(archive_root_name, info.relative_path)
-            logs.append("  added %s" % arcname)
-            zf.write(info.full_path, arcname=arcname)
+    logs.append("Compressed %d files from %s to %s, saving %s; stored %d files (%s) that wouldn't compress." %
+                (deflated['count'], format_size(deflated['size']), format_size(deflated['compressed_size']),
+                 format_size(deflated['size'] - deflated['compressed_size']), stored['count'],
+                 format_size(stored['size'])))
 
 
 # function exported for project.py
 def _list_relative_paths_for_unignored_project_files(project_directory, errors, requirements):
-    infos = _enumerate_archive_files(project_directory, errors, requirements=requirements)
+    infos = _iterate_project(project_directory, errors, requirements, excluded_paths=(_MANIFEST_DIGEST_FILENAME, ))
     if infos is None:
         return None
-    return [info.relative_path for info in infos]
+    try:
+        # don't keep the infos around, this can be a lot of files
+        return [info.relative_path for info in infos]
+    except OSError as e:
+        errors.append("Could not list files in %s: %s." % (project_directory, str(e)))
+        return None
+
+
+def _manifest_path(project_directory, environ=None):
+    key = os.path.realpath(project_directory)
+    return os.path.join(user_cache_directory(environ), "manifests",
+                        hashlib.sha256(key.encode('utf-8')).hexdigest() + ".json")
+
+
+def _load_manifest(project_directory):
+    # the manifest of the last archive of the project maps each
+    # relative path to (size, mtime_ns, sha256, permission bits), the
+    # first three None for a directory
+    try:
+        with codecs.open(_manifest_path(project_directory), 'r', 'utf-8') as f:
+            entries = json.load(f)
+        return dict((path, (size, mtime_ns, digest, mode)) for (path, size, mtime_ns, digest, mode) in entries)
+    except (EnvironmentError, ValueError, TypeError):
+        return None
+
+
+def _save_manifest(project_directory, manifest):
+    # failing to save it only means the next delta can't be made
+    path = _manifest_path(project_directory)
+    tmp = path + ".tmp-" + str(uuid.uuid4())
+    try:
+        makedirs_ok_if_exists(os.path.dirname(path))
+        with codecs.open(tmp, 'w', 'utf-8') as f:
+            json.dump([[relative_path] + list(entry) for (relative_path, entry) in sorted(manifest.items())], f)
+        rename_over_existing(tmp, path)
+    except EnvironmentError:
+        try:
+            os.remove(tmp)
+        except EnvironmentError:
+            pass
+
+
+def _manifest_digest(manifest):
+    # covers what's in the files and their modes but not their
+    # times, which don't survive the trip through an archive
+    contents = sorted([relative_path, entry[2], entry[3]] for (relative_path, entry) in manifest.items())
+    return hashlib.sha256(json.dumps(contents).encode('utf-8')).hexdigest()
+
+
+def _read_manifest_digest(project_dir):
+    try:
+        with codecs.open(os.path.join(project_dir, _MANIFEST_DIGEST_FILENAME), 'r', 'utf-8') as f:
+            return json.load(f)['manifest_digest']
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _hash_file(full_path):
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_entries(infos, previous, max_workers):
+    # only files whose size or mtime changed since the previous
+    # manifest are hashed again, on several threads; chmod doesn't
+    # change the mtime, so the mode is always taken afresh
+    def entry(info):
+        st = info.stat
+        mode = st.st_mode & 0o777
+        if info.is_directory:
+            return (None, None, None, mode)
+        mtime_ns = getattr(st, 'st_mtime_ns', None)
+        if mtime_ns is None:  # pragma: no cover (py2 only)
+            mtime_ns = int(st.st_mtime * 1000000000)
+        old = previous.get(info.unixified_relative_path)
+        if old is not None and old[0:2] == (st.st_size, mtime_ns):
+            return old[0:3] + (mode, )
+        return (st.st_size, mtime_ns, _hash_file(info.full_path), mode)
+
+    entries = parallel_map(entry, infos, max_workers=max_workers)
+    return dict(zip([info.unixified_relative_path for info in infos], entries))
+
+
+def _delta(previous, current):
+    # returns (changed or added paths, deleted paths); a path that
+    # changed between file and directory is deleted and then added
+    changed = []
+    deleted = []
+    for (path, entry) in current.items():
+        old = previous.get(path)
+        if old is None or old[2:4] != entry[2:4]:
+            changed.append(path)
+        if old is not None and (old[2] is None) != (entry[2] is None):
+            deleted.append(path)
+    deleted.extend(path for path in previous if path not in current)
+    return (set(changed), sorted(deleted))
+
+
+class _HashingWriter(object):
+    # passes writes through to a file, keeping an MD5 of
+    # everything written so the archive needn't be read back
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self._md5.update(data)
+        self.size += len(data)
+        self._fileobj.write(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+
+class _ArchiveStatus(SimpleStatus):
+    def __init__(self, description, logs, manifest, md5, size):
+        super(_ArchiveStatus, self).__init__(success=True, description=description, logs=logs)
+        self.manifest = manifest
+        self.md5 = md5
+        self.size = size
+
+
+_ARCHIVE_SUFFIXES = ((".zip", "zip"), (".tar.gz", "gz"), (".tar.bz2", "bz2"), (".tar.xz", "xz"), (".tar", None))
+
+
+def _archive_format(filename):
+    for (suffix, compression) in _ARCHIVE_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return (suffix, compression)
+    return None
+
+
+def _write_archive(project, infos, fileobj, compression, logs, compression_level, max_workers, spool_dir,
+                   reproducible):
+    if compression == "zip":
+        _write_zip(project.name,
+                   infos,
+                   fileobj,
+                   logs,
+                   compression_level=compression_level,
+                   max_workers=max_workers,
+                   spool_dir=spool_dir,
+                   reproducible=reproducible)
+    else:
+        _write_tar(project.name,
+                   infos,
+                   fileobj,
+                   compression=compression,
+                   logs=logs,
+                   compression_level=compression_level,
+                   max_workers=max_workers,
+                   reproducible=reproducible)
 
 
 # function exported for project_ops.py
-def _archive_project(project, filename):
+def _archive_project(project,
+                     filename,
+                     compression_level=None,
+                     threads=None,
+                     fileobj=None,
+                     reproducible=False,
+                     delta=False,
+                     record_manifest=False):
     """Make an archive of the non-ignored files in the project.
 
     Args:
         project (``Project``): the project
         filename (str): name for the new zip or tar.gz archive file
+        compression_level (int): 0 (fastest) to 9 (smallest), None for the format's default
+        threads (int): most threads to compress with, None for a default
+        fileobj (file): write the archive here rather than to filename, which then only picks the format
+        reproducible (bool): make the same bytes from the same files, whatever their times and owners
+        delta (bool): only archive what changed since the last archive with a recorded manifest,
+            and what was deleted
+        record_manifest (bool): remember what was archived, for the next delta (always done with delta)
 
     Returns:
-        a ``Status``, if failed has ``errors``
+        a ``Status``, if failed has ``errors``, on success has ``manifest`` (list of archived
+        relative paths), ``md5`` (hex digest of the archive) and ``size`` properties
     """
     failed = project.problems_status()
     if failed is not None:
         return failed
 
+    if compression_level is not None and compression_level not in range(0, 10):
+        return SimpleStatus(success=False,
+                            description="Can't create an archive.",
+                            errors=["Compression level should be from 0 to 9, not %r." % (compression_level, )])
+
+    archive_format = _archive_format(filename)
+    if archive_format is None:
+        return SimpleStatus(success=False,
+                            description="Project archive filename must be a .zip, .tar.gz, .tar.bz2, or .tar.xz.",
+                            errors=["Unsupported archive filename %s." % (filename)])
+    (suffix, compression) = archive_format
+    if compression == "xz" and not parallel_xz.available():
+        return SimpleStatus(success=False,
+                            description="Can't create an archive.",
+                            errors=["This version of Python can't write .tar.xz archives."])
+
     if not os.path.exists(project.project_file.filename):
         return SimpleStatus(success=False,
                             description="Can't create an archive.",
@@ -309,32 +1082,117 @@ def _archive_project(project, filename):
                             description="Can't create an archive.",
                             errors=[("%s has been modified but not saved." % project.project_file.basename)])
 
+    # don't put the destination zip into itself, since it's fairly natural to
+    # create a archive right in the project directory
+    relative_dest_file = subdirectory_relative_to_directory(filename, project.directory_path)
+    # an unpacked project's manifest digest is about the archive it came from, not this one
+    if fileobj is not None or os.path.isabs(relative_dest_file):
+        excluded_paths = (_MANIFEST_DIGEST_FILENAME, )
+    else:
+        excluded_paths = (_MANIFEST_DIGEST_FILENAME, relative_dest_file)
+
     errors = []
-    infos = _enumerate_archive_files(project.directory_path, errors, requirements=project.requirements)
+    infos = _enumerate_archive_files(project.directory_path,
+                                     errors,
+                                     requirements=project.requirements,
+                                     excluded_paths=excluded_paths)
     if infos is None:
         return SimpleStatus(success=False, description="Failed to list files in the project.", errors=errors)
 
-    # don't put the destination zip into itself, since it's fairly natural to
-    # create a archive right in the project directory
-    relative_dest_file = subdirectory_relative_to_directory(filename, project.directory_path)
-    if not os.path.isabs(relative_dest_file):
-        infos = [info for info in infos if info.relative_path != relative_dest_file]
+    # the files in the archive, in the order they went in
+    infos = _leaf_infos(infos)
 
     logs = []
-    tmp_filename = filename + ".tmp-" + str(uuid.uuid4())
+    # files we add to the archive which aren't in the project, with their JSON
+    generated = dict()
+    record_manifest = record_manifest or delta
+    if record_manifest:
+        previous = _load_manifest(project.directory_path)
+        if delta and previous is None:
+            return SimpleStatus(success=False,
+                                description="Can't create an archive.",
+                                errors=["There's no earlier archive of this project to make a delta archive from."])
+        try:
+            file_states = _manifest_entries(infos, previous or {}, threads)
+        except (IOError, OSError) as e:
+            return SimpleStatus(success=False, description="Failed to read files in the project.", errors=[str(e)])
+
+    if delta:
+        (changed, deleted) = _delta(previous, file_states)
+        infos = [info for info in infos if info.unixified_relative_path in changed]
+        for path in deleted:
+            logs.append("  deleted %s" % path)
+        logs.append("Delta archive has %d changed or new files and %d deletions." % (len(infos), len(deleted)))
+        generated[_DELTA_FILENAME] = dict(deleted=deleted,
+                                          base_manifest_digest=_manifest_digest(previous),
+                                          manifest_digest=_manifest_digest(file_states))
+    elif record_manifest:
+        # so a delta made from this archive can tell it's unpacking on top of it
+        generated[_MANIFEST_DIGEST_FILENAME] = dict(manifest_digest=_manifest_digest(file_states))
+
+    manifest = [info.relative_path for info in infos]
+
+    generated_dir = None
     try:
-        if filename.lower().endswith(".zip"):
-            _write_zip(project.name, infos, tmp_filename, logs)
-        elif filename.lower().endswith(".tar.gz"):
-            _write_tar(project.name, infos, tmp_filename, compression="gz", logs=logs)
-        elif filename.lower().endswith(".tar.bz2"):
-            _write_tar(project.name, infos, tmp_filename, compression="bz2", logs=logs)
-        elif filename.lower().endswith(".tar"):
-            _write_tar(project.name, infos, tmp_filename, compression=None, logs=logs)
-        else:
+        if len(generated) > 0:
+            generated_dir = tempfile.mkdtemp(prefix="anaconda_project_archive_")
+            for (name, content) in generated.items():
+                path = os.path.join(generated_dir, name)
+                with codecs.open(path, 'w', 'utf-8') as f:
+                    json.dump(content, f, sort_keys=True)
+                infos.append(_FileInfo(path, name, is_directory=False))
+            infos = _leaf_infos(infos)
+
+        status = _write_project_archive(project, filename, compression, suffix, infos, manifest, logs,
+                                        compression_level, threads, fileobj, reproducible)
+    finally:
+        if generated_dir is not None:
+            shutil.rmtree(generated_dir, ignore_errors=True)
+
+    if status and record_manifest:
+        _save_manifest(project.directory_path, file_states)
+    return status
+
+
+def _write_project_archive(project, filename, compression, suffix, infos, manifest, logs, compression_level, threads,
+                           fileobj, reproducible):
+    if fileobj is not None:
+        # straight to the caller's file or pipe, no temporary file
+        writer = _HashingWriter(fileobj)
+        try:
+            _write_archive(project,
+                           infos,
+                           writer,
+                           compression,
+                           logs,
+                           compression_level,
+                           threads,
+                           spool_dir=None,
+                           reproducible=reproducible)
+        except (IOError, OSError) as e:
             return SimpleStatus(success=False,
-                                description="Project archive filename must be a .zip, .tar.gz, or .tar.bz2.",
-                                errors=["Unsupported archive filename %s." % (filename)])
+                                description=("Failed to write %s project archive." % suffix),
+                                errors=[str(e)])
+        return _ArchiveStatus(description=("Wrote %s project archive." % suffix),
+                              logs=logs,
+                              manifest=manifest,
+                              md5=writer.hexdigest(),
+                              size=writer.size)
+
+    tmp_filename = filename + ".tmp-" + str(uuid.uuid4())
+    try:
+        with open(tmp_filename, 'wb') as f:
+            writer = _HashingWriter(f)
+            # compressed zip members that don't fit in memory wait next to the archive
+            _write_archive(project,
+                           infos,
+                           writer,
+                           compression,
+                           logs,
+                           compression_level,
+                           threads,
+                           spool_dir=os.path.dirname(os.path.abspath(filename)),
+                           reproducible=reproducible)
         rename_over_existing(tmp_filename, filename)
     except IOError as e:
         return SimpleStatus(success=False,
@@ -346,7 +1204,11 @@ def _archive_project(project, filename):
         except (IOError, OSError):
             pass
 
-    return SimpleStatus(success=True, description=("Created project archive %s" % filename), logs=logs)
+    return _ArchiveStatus(description=("Created project archive %s" % filename),
+                          logs=logs,
+                          manifest=manifest,
+                          md5=writer.hexdigest(),
+                          size=writer.size)
 
 
 def _list_files_zip(zip_path):
@@ -355,56 +1217,102 @@ def _list_files_zip(zip_path):
 
 
 def _list_files_tar(tar_path):
-    with tarfile.open(tar_path, mode='r') as tf:
+    # Stream mode, like _extract_files_tar; getmembers() would keep
+    # every member in memory. We have to know all the names before
+    # we extract anything, so unpacking reads the archive twice.
+    with tarfile.open(tar_path, mode='r|*') as tf:
         # we don't want links or block devices or anything weird, they could be a security problem
-        return sorted([member.name for member in tf.getmembers() if member.isreg() or member.isdir()])
+        return sorted([member.name for member in tf if member.isreg() or member.isdir()])
+
+
+def _read_member_zip(zip_path, name):
+    with zipfile.ZipFile(zip_path, mode='r') as zf:
+        return zf.read(name)
+
+
+def _read_member_tar(tar_path, name):
+    # the archive is sorted, so the delta file is near the start
+    # and we stop reading long before the end
+    with tarfile.open(tar_path, mode='r|*') as tf:
+        for member in tf:
+            if member.name == name and member.isreg():
+                return tf.extractfile(member).read()
+    raise tarfile.TarError("%s is missing from %s" % (name, tar_path))
+
+
+def _restore_zip_metadata(info, dest):
+    # only the permission bits, an untrusted archive doesn't get to make setuid files
+    mode = (info.external_attr >> 16) & 0o777
+    if mode != 0:
+        os.chmod(dest, mode)
+    try:
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+    except (OverflowError, ValueError):  # pragma: no cover (the zip has a nonsense date)
+        return
+    os.utime(dest, (mtime, mtime))
 
 
 def _extract_files_zip(zip_path, src_and_dest, logs):
-    # the zipfile API has no way to extract to a filename of
-    # our choice, so we have to unpack to a temporary location,
-    # then copy those files over.
-    tmpdir = tempfile.mkdtemp()
+    # members are streamed from the zip straight to their
+    # destinations, several at a time, without a temporary copy.
+    with zipfile.ZipFile(zip_path, mode='r') as zf:
+        infos_and_dests = [(zf.getinfo(src), dest) for (src, dest) in src_and_dest]
+
+    files = []
+    directories = []
+    for (info, dest) in infos_and_dests:
+        logs.append("Unpacking %s to %s" % (info.filename, dest))
+        if info.filename.endswith('/'):
+            makedirs_ok_if_exists(dest)
+            directories.append((info, dest))
+        else:
+            makedirs_ok_if_exists(os.path.dirname(dest))
+            files.append((info, dest))
+
+    ziputils.extract_members(zip_path, files)
+
+    # directories go last and deepest first, since writing
+    # into a directory changes its mtime
+    for (info, dest) in files + sorted(directories, key=lambda pair: pair[1], reverse=True):
+        _restore_zip_metadata(info, dest)
+
+
+def _restore_tar_metadata(tf, member, dest):
     try:
-        with zipfile.ZipFile(zip_path, mode='r') as zf:
-            zf.extractall(tmpdir)
-            for (src, dest) in src_and_dest:
-                logs.append("Unpacking %s to %s" % (src, dest))
-                src_path = os.path.join(tmpdir, src)
-                if os.path.isdir(src_path):
-                    makedirs_ok_if_exists(dest)
-                    shutil.copystat(src_path, dest)
-                else:
-                    makedirs_ok_if_exists(os.path.dirname(dest))
-                    shutil.copy2(src_path, dest)
-    finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except (IOError, OSError):
-            pass
+        tf.chown(member, dest, False)  # pragma: no cover (python 3.5 has another param)
+    except TypeError:  # pragma: no cover
+        tf.chown(member, dest)  # pragma: no cover (python 2.7, 3.4)
+    tf.chmod(member, dest)
+    tf.utime(member, dest)
 
 
 def _extract_files_tar(tar_path, src_and_dest, logs):
-    with tarfile.open(tar_path, mode='r') as tf:
-        for (src, dest) in src_and_dest:
-            logs.append("Unpacking %s to %s" % (src, dest))
-            member = tf.getmember(src)
-            # we could also use tf._extract_member here, but the
-            # solution below with only the public API isn't that
-            # bad.
+    # One pass through the archive in stream mode, writing each
+    # member we want as it goes by, so compressed archives are
+    # decompressed once and we never look members up by name
+    # (getmember is a linear search).
+    dests = dict(src_and_dest)
+    directories = []
+    with tarfile.open(tar_path, mode='r|*') as tf:
+        for member in tf:
+            dest = dests.get(member.name)
+            # we don't want links or block devices or anything weird, even
+            # if they have the same name as a file we do want
+            if dest is None or not (member.isreg() or member.isdir()):
+                continue
+            logs.append("Unpacking %s to %s" % (member.name, dest))
             if member.isreg():
                 makedirs_ok_if_exists(os.path.dirname(dest))
                 tf.makefile(member, dest)
+                _restore_tar_metadata(tf, member, dest)
             else:
-                assert member.isdir()  # we filtered out other types
                 makedirs_ok_if_exists(dest)
+                directories.append((member, dest))
 
-            try:
-                tf.chown(member, dest, False)  # pragma: no cover (python 3.5 has another param)
-            except TypeError:  # pragma: no cover
-                tf.chown(member, dest)  # pragma: no cover (python 2.7, 3.4)
-            tf.chmod(member, dest)
-            tf.utime(member, dest)
+        # directories go last and deepest first, since writing
+        # into a directory changes its mtime
+        for (member, dest) in sorted(directories, key=lambda pair: pair[1], reverse=True):
+            _restore_tar_metadata(tf, member, dest)
 
 
 def _split_after_first(path):
@@ -426,7 +1334,7 @@ def _split_after_first(path):
     return _helper(path, None)
 
 
-def _get_source_and_dest_files(archive_path, list_files, project_dir, parent_dir, errors):
+def _get_source_and_dest_files(archive_path, list_files, project_dir, parent_dir, apply_delta, errors):
     names = list_files(archive_path)
     if len(names) == 0:
         errors.append("A valid project archive must contain at least one file.")
@@ -456,7 +1364,26 @@ def _get_source_and_dest_files(archive_path, list_files, project_dir, parent_dir
     # this assertion is because of the check for candidate_prefix == ".." above.
     assert canonical_project_dir.startswith(canonical_parent_dir)
 
-    if os.path.exists(canonical_project_dir):
+    # a delta archive goes on top of the project it was made from,
+    # and only if we were asked to apply one, since it deletes files
+    delta_member = None
+    for (name, prefix, remainder) in items:
+        if prefix == candidate_prefix and remainder == _DELTA_FILENAME:
+            delta_member = name
+
+    if delta_member is not None and not apply_delta:
+        errors.append("This is a delta archive, which can only be applied on top of an existing project.")
+        return None
+    elif apply_delta and delta_member is None:
+        errors.append("This is not a delta archive.")
+        return None
+
+    if apply_delta:
+        if not os.path.isdir(canonical_project_dir):
+            errors.append("Directory '%s' doesn't exist, so there's nothing to apply the delta archive to." %
+                          canonical_project_dir)
+            return None
+    elif os.path.exists(canonical_project_dir):
         # This is an error to ensure we always do a "fresh" unpack
         # without worrying about overwriting stuff.
         errors.append("Directory '%s' already exists." % canonical_project_dir)
@@ -468,7 +1395,7 @@ def _get_source_and_dest_files(archive_path, list_files, project_dir, parent_dir
             errors.append(("A valid project archive contains only one project directory " +
                            "with all files inside that directory. '%s' is outside '%s'.") % (name, candidate_prefix))
             return None
-        if remainder is None:
+        if remainder is None or name == delta_member:
             # this is an entry that's either the prefix dir itself,
             # or a file at the root not in any dir
             continue
@@ -480,7 +1407,79 @@ def _get_source_and_dest_files(archive_path, list_files, project_dir, parent_dir
             return None
         src_and_dest.append((name, dest))
 
-    return (canonical_project_dir, src_and_dest)
+    return (canonical_project_dir, src_and_dest, delta_member)
+
+
+def _read_delta(archive_path, delta_member, read_member, canonical_project_dir, errors):
+    # returns (paths to delete, the manifest digest of the project after the delta)
+    # the paths to delete are untrusted, just like the archive's file names
+    try:
+        delta = json.loads(read_member(archive_path, delta_member).decode('utf-8'))
+        deleted = delta['deleted']
+        if not all(isinstance(name, type(u'')) for name in deleted):
+            raise ValueError("deleted paths should be strings")
+        base_digest = delta['base_manifest_digest']
+        digest = delta['manifest_digest']
+        if not (isinstance(base_digest, type(u'')) and isinstance(digest, type(u''))):
+            raise ValueError("manifest digests should be strings")
+    except (ValueError, KeyError, TypeError) as e:
+        errors.append("Archive has a broken %s: %s" % (_DELTA_FILENAME, str(e)))
+        return None
+
+    if _read_manifest_digest(canonical_project_dir) != base_digest:
+        errors.append("The delta archive was made from another version of the project than the one in '%s'." %
+                      canonical_project_dir)
+        return None
+
+    paths = []
+    for name in deleted:
+        path = os.path.join(canonical_project_dir, name.replace("/", os.sep))
+        # the last part isn't resolved, so a symlink is itself deleted
+        path = os.path.normpath(os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path)))
+        if not path.startswith(canonical_project_dir + os.sep):
+            errors.append("Archive deletes '%s' which is outside '%s'." % (name, canonical_project_dir))
+            return None
+        paths.append(path)
+    return (paths, digest)
+
+
+def _write_manifest_digest(canonical_project_dir, digest):
+    path = os.path.join(canonical_project_dir, _MANIFEST_DIGEST_FILENAME)
+    tmp = path + ".tmp-" + str(uuid.uuid4())
+    with codecs.open(tmp, 'w', 'utf-8') as f:
+        json.dump(dict(manifest_digest=digest), f, sort_keys=True)
+    rename_over_existing(tmp, path)
+
+
+def _apply_deletions(canonical_project_dir, deleted_paths, src_and_dest, logs):
+    # deepest first, so directories are emptied before we get to them
+    for path in sorted(deleted_paths, reverse=True):
+        logs.append("Removing %s" % path)
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                os.rmdir(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            # something not from the archive is still in the
+            # directory, or it's already gone
+            if not (e.errno == errno.ENOENT or os.path.isdir(path)):
+                raise e
+        # remove directories left empty, though the delta
+        # recreates any that were empty in the project
+        parent = os.path.dirname(path)
+        while parent != canonical_project_dir and parent.startswith(canonical_project_dir):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    # replace changed files rather than writing into them, in
+    # case they're read-only or hard links
+    for (src, dest) in src_and_dest:
+        if os.path.islink(dest) or os.path.isfile(dest):
+            os.remove(dest)
 
 
 class _UnarchiveStatus(SimpleStatus):
@@ -490,7 +1489,7 @@ class _UnarchiveStatus(SimpleStatus):
 
 
 # function exported for project_ops.py
-def _unarchive_project(archive_filename, project_dir, parent_dir=None):
+def _unarchive_project(archive_filename, project_dir, parent_dir=None, apply_delta=False):
     """Unpack an archive of files in the project.
 
     This takes care of several details, for example it deals with
@@ -504,10 +1503,18 @@ def _unarchive_project(archive_filename, project_dir, parent_dir=None):
     If parent_dir is non-None, place the project_dir in it. This is most useful
     if project_dir is None.
 
+    With apply_delta, the archive must be a delta archive, and it
+    is applied to the existing project_dir instead: files deleted
+    since the archive it follows are removed, and changed or new
+    files are unpacked over the top. The project_dir must have
+    been unpacked from the archive the delta follows (or had the
+    previous delta applied).
+
     Args:
         archive_filename (str): the tar or zip archive file
         project_dir (str): the directory that will contain the project config file
         parent_dir (str): place project directory in here
+        apply_delta (bool): apply a delta archive to the existing project_dir
 
     Returns:
         a ``Status``, if failed has ``errors``, on success has a ``project_dir`` property
@@ -517,27 +1524,51 @@ def _unarchive_project(archive_filename, project_dir, parent_dir=None):
 
     list_files = None
     extract_files = None
+    read_member = None
     if archive_filename.endswith(".zip"):
         list_files = _list_files_zip
         extract_files = _extract_files_zip
-    elif any([archive_filename.endswith(suffix) for suffix in [".tar", ".tar.gz", ".tar.bz2"]]):
+        read_member = _read_member_zip
+    elif any([archive_filename.endswith(suffix) for suffix in [".tar", ".tar.gz", ".tar.bz2", ".tar.xz"]]):
         list_files = _list_files_tar
         extract_files = _extract_files_tar
+        read_member = _read_member_tar
     else:
-        return SimpleStatus(
-            success=False,
-            description=("Could not unpack archive %s" % archive_filename),
-            errors=["Unsupported archive filename %s, must be a .zip, .tar.gz, or .tar.bz2" % (archive_filename)])
+        return SimpleStatus(success=False,
+                            description=("Could not unpack archive %s" % archive_filename),
+                            errors=[
+                                "Unsupported archive filename %s, must be a .zip, .tar.gz, .tar.bz2, or .tar.xz" %
+                                (archive_filename)
+                            ])
 
     logs = []
     errors = []
     try:
-        result = _get_source_and_dest_files(archive_filename, list_files, project_dir, parent_dir, errors)
+        result = _get_source_and_dest_files(archive_filename, list_files, project_dir, parent_dir, apply_delta,
+                                            errors)
         if result is None:
             return SimpleStatus(success=False,
                                 description=("Could not unpack archive %s" % archive_filename),
                                 errors=errors)
-        (canonical_project_dir, src_and_dest) = result
+        (canonical_project_dir, src_and_dest, delta_member) = result
+
+        if delta_member is not None:
+            delta = _read_delta(archive_filename, delta_member, read_member, canonical_project_dir, errors)
+            if delta is None:
+                return SimpleStatus(success=False,
+                                    description=("Could not unpack archive %s" % archive_filename),
+                                    errors=errors)
+            (deleted_paths, digest) = delta
+            # we don't remove the project if this fails, it was there
+            # before us, but it's no longer the version it was
+            os.remove(os.path.join(canonical_project_dir, _MANIFEST_DIGEST_FILENAME))
+            _apply_deletions(canonical_project_dir, deleted_paths, src_and_dest, logs)
+            extract_files(archive_filename, src_and_dest, logs)
+            _write_manifest_digest(canonical_project_dir, digest)
+            return _UnarchiveStatus(success=True,
+                                    description=("Delta archive applied to %s." % canonical_project_dir),
+                                    logs=logs,
+                                    project_dir=canonical_project_dir)
 
         if len(src_and_dest) == 0:
             return SimpleStatus(success=False,
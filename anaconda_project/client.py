@@ -7,9 +7,12 @@
 """Talking to the Anaconda server."""
 from __future__ import absolute_import, print_function
 
+import base64
+import binascii
 import logging
 import os
 import tarfile
+import time
 import zipfile
 
 import requests
@@ -17,8 +20,15 @@ import binstar_client.utils as binstar_utils
 import binstar_client.requests_ext as binstar_requests_ext
 from binstar_client.errors import BinstarError, Unauthorized
 
+from anaconda_project.internal import upload_records
 from anaconda_project.internal.simple_status import SimpleStatus
 
+# seconds to wait before each retry of a failed upload to S3
+_S3_RETRY_DELAYS = (1, 5, 30)
+
+# responses from S3 that mean try again later
+_S3_RETRY_STATUSES = (500, 502, 503, 504)
+
 
 class _Client(object):
     def __init__(self, site=None, username=None, token=None, log_level=None):
@@ -62,7 +72,7 @@ class _Client(object):
         return res
 
     def _file_count(self, archive_filename):
-        for suffix in (".tar", ".tar.gz", ".tar.bz2"):
+        for suffix in (".tar", ".tar.gz", ".tar.bz2", ".tar.xz"):
             if archive_filename.lower().endswith(suffix):
                 with tarfile.open(archive_filename, 'r') as tf:
                     return len(tf.getnames())
@@ -71,11 +81,12 @@ class _Client(object):
                 return len(zf.namelist())
         assert False, ("unsupported archive filename %s" % archive_filename)  # pragma: no cover (should not be reached)
 
-    def stage(self, project_info, archive_filename, uploaded_basename):
+    def stage(self, project_info, archive_filename, uploaded_basename, file_count=None):
         url = "{}/apps/{}/projects/{}/stage".format(self._api.domain, self._username(), project_info['name'])
         config = project_info.copy()
         config['size'] = os.path.getsize(archive_filename)
-        file_count = self._file_count(archive_filename)
+        if file_count is None:
+            file_count = self._file_count(archive_filename)
         if file_count is not None:
             config['num_of_files'] = file_count
         json = {'basename': uploaded_basename, 'configuration': config}
@@ -92,36 +103,60 @@ class _Client(object):
         self._check_response(res)
         return res
 
-    def _put_on_s3(self, archive_filename, uploaded_basename, url, s3data):
-        with open(archive_filename, 'rb') as f:
-            _hexmd5, b64md5, size = binstar_utils.compute_hash(f, size=os.path.getsize(archive_filename))
-
-        s3data = s3data.copy()  # don't modify our parameters
-        s3data['Content-Length'] = size
-        s3data['Content-MD5'] = b64md5
-
+    def _post_to_s3(self, archive_filename, uploaded_basename, url, s3data):
         with open(archive_filename, 'rb') as archive_file_object:
             data_stream, headers = binstar_requests_ext.stream_multipart(
                 s3data,
                 files={'file': (uploaded_basename, archive_file_object)})
 
-            res = requests.post(url,
-                                data=data_stream,
-                                verify=self._api.session.verify,
-                                timeout=10 * 60 * 60,
-                                headers=headers)
-            self._check_response(res)
+            return requests.post(url,
+                                 data=data_stream,
+                                 verify=self._api.session.verify,
+                                 timeout=10 * 60 * 60,
+                                 headers=headers)
+
+    def _put_on_s3(self, archive_filename, uploaded_basename, url, s3data, md5=None):
+        if md5 is None:
+            with open(archive_filename, 'rb') as f:
+                _hexmd5, b64md5, size = binstar_utils.compute_hash(f, size=os.path.getsize(archive_filename))
+        else:
+            # the archiver hashed the archive as it wrote it
+            b64md5 = base64.b64encode(binascii.unhexlify(md5)).decode('ascii')
+            size = os.path.getsize(archive_filename)
+
+        s3data = s3data.copy()  # don't modify our parameters
+        s3data['Content-Length'] = size
+        s3data['Content-MD5'] = b64md5
+
+        # S3 gives us a single presigned form to POST the whole
+        # file to, so we can't upload in parts; the best we can do
+        # is start over when the connection drops or S3 is busy.
+        for delay in _S3_RETRY_DELAYS + (None, ):
+            try:
+                res = self._post_to_s3(archive_filename, uploaded_basename, url, s3data)
+                if res.status_code not in _S3_RETRY_STATUSES or delay is None:
+                    break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if delay is None:
+                    raise
+            time.sleep(delay)
+        self._check_response(res)
         return res
 
-    def upload(self, project_info, archive_filename, uploaded_basename):
-        """Upload archive_filename created from project, throwing BinstarError."""
+    def upload(self, project_info, archive_filename, uploaded_basename, file_count=None, md5=None):
+        """Upload archive_filename created from project, throwing BinstarError.
+
+        file_count and md5 (hex digest) can be passed if already
+        known, to avoid reading the archive to find them.
+        """
         if not self._exists(project_info['name']):
             res = self.create(project_info=project_info)
             assert res.status_code in (200, 201)
 
         res = self.stage(project_info=project_info,
                          archive_filename=archive_filename,
-                         uploaded_basename=uploaded_basename)
+                         uploaded_basename=uploaded_basename,
+                         file_count=file_count)
         assert res.status_code in (200, 201)
 
         stage_info = res.json()
@@ -133,7 +168,8 @@ class _Client(object):
         res = self._put_on_s3(archive_filename,
                               uploaded_basename,
                               url=stage_info['post_url'],
-                              s3data=stage_info['form_data'])
+                              s3data=stage_info['form_data'],
+                              md5=md5)
         assert res.status_code in (200, 201)
 
         res = self.commit(project_info['name'], stage_info['dist_id'])
@@ -143,24 +179,48 @@ class _Client(object):
 
 
 class _UploadedStatus(SimpleStatus):
-    def __init__(self, json):
+    def __init__(self, json, description="Upload successful."):
         self.url = json.get('url', None)
         logs = []
         if self.url is not None:
             logs.append("Project is at %s" % self.url)
-        super(_UploadedStatus, self).__init__(success=True, description="Upload successful.", logs=logs)
+        super(_UploadedStatus, self).__init__(success=True, description=description, logs=logs)
 
 
 # This function is supposed to encapsulate the binstar API (don't
 # require any other files to import binstar_client).
 # archive_filename is the path to a local tmp file to upload
 # uploaded_basename is the filename the server should remember
-def _upload(project, archive_filename, uploaded_basename, site=None, username=None, token=None, log_level=None):
+# file_count and md5 describe the archive, if the archiver told us
+# unless force, an archive with the same md5 as last time isn't uploaded again
+def _upload(project,
+            archive_filename,
+            uploaded_basename,
+            site=None,
+            username=None,
+            token=None,
+            log_level=None,
+            file_count=None,
+            md5=None,
+            force=False):
     assert not project.problems
 
     client = _Client(site=site, username=username, token=token, log_level=log_level)
     try:
-        json = client.upload(project.publication_info(), archive_filename, uploaded_basename)
+        if md5 is not None:
+            record_key = (client._api.domain, client._username(), project.directory_path)
+            record = upload_records.load_record(*record_key)
+            if not force and record is not None and record['md5'] == md5:
+                return _UploadedStatus(record,
+                                       description="Project is unchanged since it was last uploaded, "
+                                       "not uploading it again.")
+        json = client.upload(project.publication_info(),
+                             archive_filename,
+                             uploaded_basename,
+                             file_count=file_count,
+                             md5=md5)
+        if md5 is not None:
+            upload_records.save_record(*record_key, md5=md5, url=json.get('url', None))
         return _UploadedStatus(json)
     except Unauthorized as e:
         return SimpleStatus(success=False,
@@ -7,23 +7,58 @@
 """The ``archive`` command makes an archive of the project."""
 from __future__ import absolute_import, print_function
 
+import sys
+
 from anaconda_project.commands.project_load import load_project
 from anaconda_project.commands import console_utils
 import anaconda_project.project_ops as project_ops
 
+ARCHIVE_FORMATS = ('zip', 'tar', 'tar.gz', 'tar.bz2', 'tar.xz')
+
 
-def archive_command(project_dir, archive_filename):
+def archive_command(project_dir,
+                    archive_filename,
+                    compression_level=None,
+                    threads=None,
+                    archive_format=None,
+                    reproducible=False,
+                    delta=False,
+                    record_manifest=False):
     """Make an archive of the project.
 
+    If archive_filename is '-' the archive goes to stdout, in
+    archive_format, and everything else is printed to stderr. We
+    don't offer to fix the project then, since the questions would
+    end up in the archive.
+
     Returns:
         exit code
     """
-    project = load_project(project_dir)
-    status = project_ops.archive(project, archive_filename)
+    if archive_filename == '-':
+        if archive_format is None:
+            print("Use --format to choose the kind of archive to write to standard output.", file=sys.stderr)
+            return 1
+        archive_filename = "archive." + archive_format
+        # the archive is bytes, so skip the text layer on Python 3
+        fileobj = getattr(sys.stdout, 'buffer', sys.stdout)
+        log_file = sys.stderr
+    else:
+        fileobj = None
+        log_file = sys.stdout
+
+    project = load_project(project_dir, interactive=(fileobj is None))
+    status = project_ops.archive(project,
+                                 archive_filename,
+                                 compression_level=compression_level,
+                                 threads=threads,
+                                 fileobj=fileobj,
+                                 reproducible=reproducible,
+                                 delta=delta,
+                                 record_manifest=record_manifest)
     if status:
         for line in status.logs:
-            print(line)
-        print(status.status_description)
+            print(line, file=log_file)
+        print(status.status_description, file=log_file)
         return 0
     else:
         console_utils.print_status_errors(status)
@@ -32,4 +67,5 @@ def archive_command(project_dir, archive_filename):
 
 def main(args):
     """Start the archive command and return exit status code."""
-    return archive_command(args.directory, args.filename)
+    return archive_command(args.directory, args.filename, args.compression_level, args.threads, args.format,
+                           args.reproducible, args.delta, args.record_manifest)
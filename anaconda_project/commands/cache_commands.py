@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""The ``cache`` command inspects and prunes the download cache shared by all projects."""
+from __future__ import absolute_import, print_function
+
+import sys
+import time
+
+from anaconda_project.internal import download_cache
+
+
+def _print_entries(entries):
+    for entry in entries:
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used))
+        print("{:>8}  {}  {}".format(download_cache.format_size(entry.size), last_used, entry.url or entry.path))
+
+
+def list_cache():
+    """List the files in the download cache, least recently used first.
+
+    Returns:
+        exit code
+    """
+    directory = download_cache.cache_directory()
+    entries = download_cache.entries(directory)
+    if len(entries) == 0:
+        print("No downloads found in the cache at %s." % directory)
+        return 0
+
+    print("Downloads in the cache at %s:\n" % directory)
+    _print_entries(entries)
+    total = sum(entry.size for entry in entries)
+    allowed = download_cache.max_size()
+    print("\n%d files, %s of %s allowed." % (len(entries), download_cache.format_size(total),
+                                             download_cache.format_size(allowed)))
+    return 0
+
+
+def prune_cache(max_size):
+    """Remove the least recently used downloads until the cache fits in max_size.
+
+    Args:
+        max_size (str): size such as "10G", or None for the configured maximum
+
+    Returns:
+        exit code
+    """
+    if max_size is None:
+        size = download_cache.max_size()
+    else:
+        size = download_cache.parse_size(max_size)
+        if size is None:
+            print("Could not understand size '%s', try something like 500M or 10G." % max_size, file=sys.stderr)
+            return 1
+
+    removed = download_cache.prune(download_cache.cache_directory(), size)
+    _print_entries(removed)
+    print("Removed %d files (%s) from the download cache." %
+          (len(removed), download_cache.format_size(sum(entry.size for entry in removed))))
+    return 0
+
+
+def clear_cache():
+    """Remove everything from the download cache.
+
+    Returns:
+        exit code
+    """
+    try:
+        removed = download_cache.clear(download_cache.cache_directory())
+    except EnvironmentError as e:
+        print("Failed to clear the download cache: %s" % e, file=sys.stderr)
+        return 1
+    print("Removed %d files (%s) from the download cache." %
+          (len(removed), download_cache.format_size(sum(entry.size for entry in removed))))
+    return 0
+
+
+def main(args):
+    """Start the cache command and return exit status code."""
+    if args.action == 'prune':
+        return prune_cache(args.max_size)
+    elif args.action == 'clear':
+        return clear_cache()
+    else:
+        return list_cache()
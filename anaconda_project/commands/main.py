@@ -34,6 +34,7 @@ import anaconda_project.commands.download_commands as download_commands
 import anaconda_project.commands.service_commands as service_commands
 import anaconda_project.commands.environment_commands as environment_commands
 import anaconda_project.commands.command_commands as command_commands
+import anaconda_project.commands.cache_commands as cache_commands
 
 
 def _parse_args_and_run_subcommand(argv):
@@ -116,15 +117,47 @@ def _parse_args_and_run_subcommand(argv):
         preset.set_defaults(main=activate.main)
 
     preset = subparsers.add_parser('archive',
-                                   help="Create a .zip, .tar.gz, or .tar.bz2 archive with project files in it")
+                                   help="Create a .zip, .tar.gz, .tar.bz2, or .tar.xz archive with project files in it")
     add_directory_arg(preset)
-    preset.add_argument('filename', metavar='ARCHIVE_FILENAME')
+    preset.add_argument('filename', metavar='ARCHIVE_FILENAME', help="Archive to create, or - for standard output")
+    preset.add_argument('--format',
+                        choices=archive.ARCHIVE_FORMATS,
+                        default=None,
+                        help="Kind of archive to write to standard output")
+    preset.add_argument('--threads',
+                        metavar='THREADS',
+                        type=int,
+                        default=None,
+                        help="Most threads to compress with (zip, tar.gz, and tar.xz)")
+    preset.add_argument('--compression-level',
+                        metavar='LEVEL',
+                        type=int,
+                        choices=range(0, 10),
+                        default=None,
+                        help="Compression level from 0 (fastest) to 9 (smallest)")
+    preset.add_argument('--reproducible',
+                        action='store_true',
+                        default=False,
+                        help="Make the same archive every time the project files are the same")
+    preset.add_argument('--delta',
+                        action='store_true',
+                        default=False,
+                        help="Only archive what changed since the last archive with a recorded manifest, "
+                        "to unarchive on top of it (records a new manifest)")
+    preset.add_argument('--record-manifest',
+                        action='store_true',
+                        default=False,
+                        help="Remember which files were archived, so the next archive can be a delta")
     preset.set_defaults(main=archive.main)
 
     preset = subparsers.add_parser('unarchive',
-                                   help="Unpack a .zip, .tar.gz, or .tar.bz2 archive with project files in it")
+                                   help="Unpack a .zip, .tar.gz, .tar.bz2, or .tar.xz archive with project files in it")
     preset.add_argument('filename', metavar='ARCHIVE_FILENAME')
     preset.add_argument('directory', metavar='DESTINATION_DIRECTORY', default=None, nargs='?')
+    preset.add_argument('--delta',
+                        action='store_true',
+                        default=False,
+                        help="Apply a delta archive to the existing project it was made from")
 
     preset.set_defaults(main=unarchive.main)
 
@@ -133,6 +166,10 @@ def _parse_args_and_run_subcommand(argv):
     preset.add_argument('-s', '--site', metavar='SITE', help='Select site to use')
     preset.add_argument('-t', '--token', metavar='TOKEN', help='Auth token or a path to a file containing a token')
     preset.add_argument('-u', '--user', metavar='USERNAME', help='User account, defaults to the current user')
+    preset.add_argument('--force',
+                        action='store_true',
+                        default=False,
+                        help="Upload even if the project hasn't changed since it was last uploaded")
     preset.set_defaults(main=upload.main)
 
     preset = subparsers.add_parser('add-variable', help="Add a required environment variable to the project")
@@ -283,6 +320,19 @@ def _parse_args_and_run_subcommand(argv):
     add_directory_arg(preset)
     preset.set_defaults(main=command_commands.main_list)
 
+    preset = subparsers.add_parser('cache', help="List or prune the download cache shared by all projects")
+    preset.add_argument('action',
+                        metavar='ACTION',
+                        default='list',
+                        nargs='?',
+                        choices=['list', 'prune', 'clear'],
+                        help="One of list (the default), prune, or clear")
+    preset.add_argument('--max-size',
+                        metavar='SIZE',
+                        default=None,
+                        help="With prune, how big the cache may stay, such as 10G (defaults to the configured size)")
+    preset.set_defaults(main=cache_commands.main)
+
     # argparse doesn't do this for us for whatever reason
     if len(argv) < 2:
         print("Must specify a subcommand.", file=sys.stderr)
@@ -80,7 +80,8 @@ def prepare_with_ui_mode_printing_errors(project,
                                          env_spec_name=None,
                                          command_name=None,
                                          command=None,
-                                         extra_command_args=None):
+                                         extra_command_args=None,
+                                         use_cache=False):
     """Perform all steps needed to get a project ready to execute.
 
     This may need to ask the user questions, may start services,
@@ -96,6 +97,7 @@ def prepare_with_ui_mode_printing_errors(project,
         command_name (str): command name to use or None for default
         command (ProjectCommand): a command object or None
         extra_command_args (list of str): extra args for the command we prepare
+        use_cache (bool): reuse a previous identical successful prepare (ignored in browser mode)
 
     Returns:
         a ``PrepareResult`` instance
@@ -133,7 +135,8 @@ def prepare_with_ui_mode_printing_errors(project,
                                                          env_spec_name=env_spec_name,
                                                          command_name=command_name,
                                                          command=command,
-                                                         extra_command_args=extra_command_args)
+                                                         extra_command_args=extra_command_args,
+                                                         use_cache=use_cache)
 
             if result.failed:
                 result.print_output()
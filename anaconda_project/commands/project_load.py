@@ -12,11 +12,15 @@ from anaconda_project.project import Project
 import anaconda_project.commands.console_utils as console_utils
 
 
-def load_project(dirname):
-    """Load a Project, fixing it if needed and possible."""
+def load_project(dirname, interactive=True):
+    """Load a Project, fixing it if needed and possible.
+
+    With interactive=False, we never ask to fix problems, for
+    commands whose stdout isn't for people to read.
+    """
     project = Project(dirname)
 
-    if console_utils.stdin_is_interactive():
+    if interactive and console_utils.stdin_is_interactive():
         had_fixable = len(project.fixable_problems) > 0
         for problem in project.fixable_problems:
             print(problem.text)
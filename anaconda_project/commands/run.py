@@ -46,7 +46,8 @@ def run_command(project_dir, ui_mode, conda_environment, command_name, extra_com
                                                   env_spec_name=conda_environment,
                                                   command=command,
                                                   extra_command_args=extra_command_args,
-                                                  environ=environ)
+                                                  environ=environ,
+                                                  use_cache=True)
 
     if result.failed:
         # errors were printed already
@@ -6,7 +6,10 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function
 
+import io
 import os
+import sys
+import tarfile
 import zipfile
 
 from anaconda_project.commands.main import _parse_args_and_run_subcommand
@@ -38,8 +41,9 @@ def test_archive_command_on_simple_project(capsys):
         assert code == 0
 
         out, err = capsys.readouterr()
-        assert ('  added %s\n  added %s\nCreated project archive %s\n' % (os.path.join(
-            "some_name", DEFAULT_PROJECT_FILENAME), os.path.join("some_name", "foo.py"), archivefile)) == out
+        added = (os.path.join("some_name", DEFAULT_PROJECT_FILENAME), os.path.join("some_name", "foo.py"))
+        assert ('  added %s\n  added %s\n' % added) in out
+        assert out.endswith("stored 1 files (15) that wouldn't compress.\nCreated project archive %s\n" % archivefile)
 
         with zipfile.ZipFile(archivefile, mode='r') as zf:
             assert [os.path.basename(x) for x in sorted(zf.namelist())] == [DEFAULT_PROJECT_FILENAME, "foo.py"]
@@ -62,3 +66,116 @@ def test_archive_command_on_invalid_project(capsys):
                 'Unable to load the project.\n') in err
 
     with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: "variables:\n  42"}, check)
+
+
+def test_archive_command_with_compression_level(capsys):
+    def check(dirname):
+        archivefile = os.path.join(dirname, "foo.zip")
+        code = _parse_args_and_run_subcommand(
+            ['anaconda-project', 'archive', '--directory', dirname, '--compression-level', '0', archivefile])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        assert "Compressed 0 files from 0 to 0, saving 0; stored 2 files" in out
+        assert '' == err
+
+        with zipfile.ZipFile(archivefile, mode='r') as zf:
+            assert [zipfile.ZIP_STORED, zipfile.ZIP_STORED] == [info.compress_type for info in zf.infolist()]
+
+    with_directory_contents_completing_project_file({'foo.py': 'print("hello")\n' * 100}, check)
+
+
+def test_archive_command_reproducible(capsys):
+    def check(dirname):
+        archives = []
+        for mtime in (1000000000, 1500000000):
+            os.utime(os.path.join(dirname, 'foo.py'), (mtime, mtime))
+            archivefile = os.path.join(dirname, "foo%d.tar.gz" % mtime)
+            code = _parse_args_and_run_subcommand(
+                ['anaconda-project', 'archive', '--directory', dirname, '--reproducible', archivefile])
+            assert code == 0
+            with open(archivefile, 'rb') as f:
+                archives.append(f.read())
+            os.remove(archivefile)
+
+        assert archives[0] == archives[1]
+
+    with_directory_contents_completing_project_file({'foo.py': 'print("hello")\n'}, check)
+
+
+def test_archive_command_delta(capsys):
+    def check(dirname):
+        archivefile = os.path.join(dirname, "foo.zip")
+        code = _parse_args_and_run_subcommand(
+            ['anaconda-project', 'archive', '--directory', dirname, '--record-manifest', archivefile])
+        assert code == 0
+        with zipfile.ZipFile(archivefile, mode='r') as zf:
+            assert 'some_name/.anaconda-project-manifest-digest.json' in zf.namelist()
+        with open(os.path.join(dirname, 'foo.py'), 'w') as f:
+            f.write('print("goodbye")\n')
+        capsys.readouterr()
+
+        code = _parse_args_and_run_subcommand(
+            ['anaconda-project', 'archive', '--directory', dirname, '--delta', archivefile])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        assert "Delta archive has 1 changed or new files and 0 deletions.\n" in out
+        assert '' == err
+        with zipfile.ZipFile(archivefile, mode='r') as zf:
+            assert ['some_name/.anaconda-project-delta.json', 'some_name/foo.py'] == zf.namelist()
+
+    with_directory_contents_completing_project_file({'foo.py': 'print("hello")\n'}, check)
+
+
+def test_archive_command_to_stdout(capsys, monkeypatch):
+    def check(dirname):
+        stdout = io.BytesIO()
+        # on Python 2 there's no text layer to go around
+        fake_stdout = io.TextIOWrapper(stdout) if sys.version_info >= (3, ) else stdout
+        monkeypatch.setattr(sys, 'stdout', fake_stdout)
+        code = _parse_args_and_run_subcommand(
+            ['anaconda-project', 'archive', '--directory', dirname, '--format', 'tar.gz', '--threads', '2', '-'])
+        monkeypatch.undo()
+        assert code == 0
+        archive = stdout.getvalue()
+
+        out, err = capsys.readouterr()
+        assert '' == out
+        assert err.endswith("Wrote .tar.gz project archive.\n")
+
+        with tarfile.open(fileobj=io.BytesIO(archive), mode='r:gz') as tf:
+            assert tf.extractfile('some_name/foo.py').read() == b'print("hello")\n'
+
+    with_directory_contents_completing_project_file({'foo.py': 'print("hello")\n'}, check)
+
+
+def test_archive_command_to_stdout_does_not_offer_fixes(capsys, monkeypatch):
+    def check(dirname):
+        monkeypatch.setattr('anaconda_project.commands.console_utils.stdin_is_interactive', lambda: True)
+
+        def mock_input(prompt):
+            raise AssertionError("asked to fix the project: %s" % prompt)
+
+        monkeypatch.setattr('anaconda_project.commands.console_utils._input', mock_input)
+        code = _parse_args_and_run_subcommand(
+            ['anaconda-project', 'archive', '--directory', dirname, '--format', 'zip', '-'])
+        assert code == 1
+
+        out, err = capsys.readouterr()
+        assert '' == out
+        assert ("%s: The env_specs section is empty.\n" % DEFAULT_PROJECT_FILENAME) in err
+
+    with_directory_contents({DEFAULT_PROJECT_FILENAME: "name: foo"}, check)
+
+
+def test_archive_command_to_stdout_needs_format(capsys):
+    def check(dirname):
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'archive', '--directory', dirname, '-'])
+        assert code == 1
+
+        out, err = capsys.readouterr()
+        assert '' == out
+        assert "Use --format to choose the kind of archive to write to standard output.\n" == err
+
+    with_directory_contents_completing_project_file({'foo.py': 'print("hello")\n'}, check)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import os
+import time
+
+from anaconda_project.commands.main import _parse_args_and_run_subcommand
+from anaconda_project.internal import download_cache
+from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
+
+
+def _fill_cache(monkeypatch, dirname):
+    monkeypatch.setenv('ANACONDA_PROJECT_CACHE_DIR', os.path.join(dirname, "cache"))
+    directory = download_cache.cache_directory()
+    now = time.time()
+    paths = []
+    for (i, name) in enumerate(("a", "b")):
+        path = download_cache.store(directory,
+                                    os.path.join(dirname, name),
+                                    url="http://example.com/" + name,
+                                    etag='"%s"' % name)
+        os.utime(path + ".json", (now - 100 + i, now - 100 + i))
+        paths.append(path)
+    return (directory, paths)
+
+
+def test_list_empty_cache(capsys, monkeypatch):
+    def check(dirname):
+        monkeypatch.setenv('ANACONDA_PROJECT_CACHE_DIR', dirname)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache'])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        assert out == "No downloads found in the cache at %s.\n" % os.path.join(dirname, "downloads")
+        assert err == ''
+
+    with_directory_contents(dict(), check)
+
+
+def test_list_cache(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'list'])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        lines = out.splitlines()
+        assert lines[0] == "Downloads in the cache at %s:" % directory
+        assert lines[2].startswith("    1.0K  ")
+        assert lines[2].endswith("  http://example.com/a")
+        assert lines[3].startswith("     100  ")
+        assert lines[3].endswith("  http://example.com/b")
+        assert lines[5] == "2 files, 1.1K of 20.0G allowed."
+        assert err == ''
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
+
+
+def test_prune_cache(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'prune', '--max-size', '1K'])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        lines = out.splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith("  http://example.com/a")
+        assert lines[1] == "Removed 1 files (1.0K) from the download cache."
+        assert not os.path.exists(paths[0])
+        assert os.path.exists(paths[1])
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
+
+
+def test_prune_cache_to_configured_size(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+        monkeypatch.setenv('ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE', '100')
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'prune'])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        assert out.endswith("Removed 1 files (1.0K) from the download cache.\n")
+        assert not os.path.exists(paths[0])
+        assert os.path.exists(paths[1])
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
+
+
+def test_prune_cache_bad_size(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'prune', '--max-size', 'lots'])
+        assert code == 1
+
+        out, err = capsys.readouterr()
+        assert out == ''
+        assert err == "Could not understand size 'lots', try something like 500M or 10G.\n"
+        assert os.path.exists(paths[0])
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
+
+
+def test_clear_cache(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'clear'])
+        assert code == 0
+
+        out, err = capsys.readouterr()
+        assert out == "Removed 2 files (1.1K) from the download cache.\n"
+        assert not os.path.exists(directory)
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
+
+
+def test_clear_cache_fails(capsys, monkeypatch):
+    def check(dirname):
+        (directory, paths) = _fill_cache(monkeypatch, dirname)
+
+        def mock_rmtree(path):
+            raise OSError("nope")
+
+        monkeypatch.setattr('shutil.rmtree', mock_rmtree)
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'cache', 'clear'])
+        monkeypatch.undo()
+        assert code == 1
+
+        out, err = capsys.readouterr()
+        assert out == ''
+        assert err == "Failed to clear the download cache: nope\n"
+
+    with_directory_contents(dict(a="x" * 1024, b="y" * 100), check)
@@ -16,7 +16,7 @@ all_subcommands = ('init', 'run', 'prepare', 'clean', 'activate', 'archive', 'un
                    'remove-variable', 'list-variables', 'set-variable', 'unset-variable', 'add-download',
                    'remove-download', 'list-downloads', 'add-service', 'remove-service', 'list-services',
                    'add-env-spec', 'remove-env-spec', 'list-env-specs', 'export-env-spec', 'add-packages',
-                   'remove-packages', 'list-packages', 'add-command', 'remove-command', 'list-commands')
+                   'remove-packages', 'list-packages', 'add-command', 'remove-command', 'list-commands', 'cache')
 all_subcommands_in_curlies = "{" + ",".join(all_subcommands) + "}"
 all_subcommands_comma_space = ", ".join(["'" + s + "'" for s in all_subcommands])
 
@@ -67,10 +67,10 @@ expected_usage_msg_format = \
         '    clean               Removes generated state (stops services, deletes\n' \
         '                        environment files, etc)\n' \
         '%s' \
-        '    archive             Create a .zip, .tar.gz, or .tar.bz2 archive with\n' \
-        '                        project files in it\n'\
-        '    unarchive           Unpack a .zip, .tar.gz, or .tar.bz2 archive with\n' \
-        '                        project files in it\n'\
+        '    archive             Create a .zip, .tar.gz, .tar.bz2, or .tar.xz archive\n' \
+        '                        with project files in it\n'\
+        '    unarchive           Unpack a .zip, .tar.gz, .tar.bz2, or .tar.xz archive\n' \
+        '                        with project files in it\n'\
         '    upload              Upload the project to Anaconda Cloud\n' \
         '    add-variable        Add a required environment variable to the project\n' \
         '    remove-variable     Remove an environment variable from the project\n' \
@@ -96,6 +96,8 @@ expected_usage_msg_format = \
         '    add-command         Add a new command to the project\n' \
         '    remove-command      Remove a command from the project\n' \
         '    list-commands       List the commands on the project\n' \
+        '    cache               List or prune the download cache shared by all\n' \
+        '                        projects\n' \
         '\n' \
         'optional arguments:\n' \
         '  -h, --help            show this help message and exit\n' \
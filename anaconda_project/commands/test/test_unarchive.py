@@ -11,7 +11,7 @@ from anaconda_project.internal.simple_status import SimpleStatus
 
 
 def test_unarchive_command(capsys, monkeypatch):
-    def mock_unarchive(filename, project_dir, parent_dir=None):
+    def mock_unarchive(filename, project_dir, parent_dir=None, apply_delta=False):
         return SimpleStatus(success=True, description="DESC", logs=['a', 'b'])
 
     monkeypatch.setattr('anaconda_project.project_ops.unarchive', mock_unarchive)
@@ -24,7 +24,7 @@ def test_unarchive_command(capsys, monkeypatch):
 
 
 def test_unarchive_command_error(capsys, monkeypatch):
-    def mock_unarchive(filename, project_dir, parent_dir=None):
+    def mock_unarchive(filename, project_dir, parent_dir=None, apply_delta=False):
         return SimpleStatus(success=False, description="DESC", logs=['a', 'b'], errors=['c', 'd'])
 
     monkeypatch.setattr('anaconda_project.project_ops.unarchive', mock_unarchive)
@@ -34,3 +34,16 @@ def test_unarchive_command_error(capsys, monkeypatch):
     out, err = capsys.readouterr()
     assert '' == out
     assert 'a\nb\nc\nd\nDESC\n' == err
+
+
+def test_unarchive_command_delta(capsys, monkeypatch):
+    params = []
+
+    def mock_unarchive(filename, project_dir, parent_dir=None, apply_delta=False):
+        params.append(apply_delta)
+        return SimpleStatus(success=True, description="DESC")
+
+    monkeypatch.setattr('anaconda_project.project_ops.unarchive', mock_unarchive)
+    code = _parse_args_and_run_subcommand(['anaconda-project', 'unarchive', '--delta', 'foo.zip', 'bar'])
+    assert code == 0
+    assert [True] == params
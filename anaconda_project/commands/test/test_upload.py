@@ -67,3 +67,15 @@ def test_upload_command_with_token_and_user(capsys, monkeypatch):
         assert params['kwargs']['username'] == 'foo'
 
     with_directory_contents_completing_project_file(dict(), check)
+
+
+def test_upload_command_with_force(capsys, monkeypatch):
+    params = _monkeypatch_upload(monkeypatch)
+
+    def check(dirname):
+        code = _parse_args_and_run_subcommand(['anaconda-project', 'upload', '--directory', dirname, '--force'])
+        assert code == 0
+
+        assert params['kwargs']['force'] is True
+
+    with_directory_contents_completing_project_file(dict(), check)
@@ -11,13 +11,13 @@ from anaconda_project.commands import console_utils
 import anaconda_project.project_ops as project_ops
 
 
-def unarchive_command(archive_filename, project_dir):
-    """Unpack an archive of the project.
+def unarchive_command(archive_filename, project_dir, apply_delta=False):
+    """Unpack an archive of the project, or apply a delta archive to it.
 
     Returns:
         exit code
     """
-    status = project_ops.unarchive(archive_filename, project_dir)
+    status = project_ops.unarchive(archive_filename, project_dir, apply_delta=apply_delta)
     if status:
         for line in status.logs:
             print(line)
@@ -30,4 +30,4 @@ def unarchive_command(archive_filename, project_dir):
 
 def main(args):
     """Start the unarchive command and return exit status code."""
-    return unarchive_command(args.filename, args.directory)
+    return unarchive_command(args.filename, args.directory, args.delta)
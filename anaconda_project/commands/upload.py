@@ -12,14 +12,14 @@ from anaconda_project.commands import console_utils
 import anaconda_project.project_ops as project_ops
 
 
-def upload_command(project_dir, site, username, token):
+def upload_command(project_dir, site, username, token, force=False):
     """Upload project to Anaconda.
 
     Returns:
         exit code
     """
     project = load_project(project_dir)
-    status = project_ops.upload(project, site=site, username=username, token=token)
+    status = project_ops.upload(project, site=site, username=username, token=token, force=force)
     if status:
         for line in status.logs:
             print(line)
@@ -32,4 +32,4 @@ def upload_command(project_dir, site, username, token):
 
 def main(args):
     """Start the upload command and return exit status code."""
-    return upload_command(args.directory, args.site, args.user, args.token)
+    return upload_command(args.directory, args.site, args.user, args.token, args.force)
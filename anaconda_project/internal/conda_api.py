@@ -6,17 +6,26 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function, division, unicode_literals
 
+import codecs
 import collections
 import errno
+import fnmatch
+import glob
+import hashlib
 import subprocess
 import json
 import os
 import platform
 import re
 import sys
+import threading
+import uuid
 
 from anaconda_project.internal import logged_subprocess
 from anaconda_project.internal.directory_contains import subdirectory_relative_to_directory
+from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.rename import rename_over_existing
+from anaconda_project.internal.user_cache import user_cache_directory
 
 
 class CondaError(Exception):
@@ -64,13 +73,153 @@ def _call_and_parse_json(extra_args):
         raise CondaError('Invalid JSON from conda: %s' % str(e))
 
 
-def info():
+# "conda info" is slow (it's a whole conda startup), so we remember
+# its output both in memory and on disk. The cache key covers
+# everything that can change the output short of creating or
+# removing envs, which resolve_env_to_prefix() copes with.
+_info_cache = dict()
+_info_cache_lock = threading.Lock()
+
+# bump this if the format of the on-disk cache changes
+_INFO_CACHE_FORMAT = 1
+
+# different CONDA_PREFIX etc. get different cache files; we keep
+# only the most recently written ones
+_MAX_INFO_CACHE_FILES = 16
+
+
+def _find_executable(name):
+    if os.path.dirname(name) != '':
+        return os.path.abspath(name) if os.path.isfile(name) else None
+    extensions = ['']
+    if platform.system() == 'Windows':
+        extensions.extend(os.environ.get('PATHEXT', '.COM;.EXE;.BAT;.CMD').lower().split(os.pathsep))
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        for extension in extensions:
+            candidate = os.path.join(directory, name + extension)
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+    return None
+
+
+def _mtime_or_none(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _info_cache_key(cmd_list):
+    executable = _find_executable(cmd_list[0])
+    if executable is None:
+        return None
+    # conda is usually ROOT/bin/conda or ROOT/Scripts/conda.exe
+    root = os.path.dirname(os.path.dirname(executable))
+    condarcs = [os.path.join(root, '.condarc'), os.path.join(os.path.expanduser("~"), '.condarc')]
+    if 'CONDARC' in os.environ:
+        condarcs.append(os.environ['CONDARC'])
+    parts = dict(format=_INFO_CACHE_FORMAT,
+                 cmd_list=cmd_list[1:],
+                 executable=executable,
+                 executable_mtime=_mtime_or_none(executable),
+                 condarcs=[(condarc, _mtime_or_none(condarc)) for condarc in condarcs],
+                 environ=sorted([(key, value) for (key, value) in os.environ.items() if key.startswith('CONDA')]))
+    serialized = json.dumps(parts, sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def _info_cache_filename(key):
+    return os.path.join(user_cache_directory(), "conda-info-%s.json" % key)
+
+
+def _load_info_from_disk(key):
+    try:
+        with codecs.open(_info_cache_filename(key), 'r', 'utf-8') as f:
+            loaded = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if isinstance(loaded, dict):
+        return loaded
+    else:
+        return None
+
+
+def _save_info_to_disk(key, result):
+    # errors are ignored because the cache is only an optimization
+    filename = _info_cache_filename(key)
+    tmp = filename + ".tmp-" + str(uuid.uuid4())
+    try:
+        makedirs_ok_if_exists(os.path.dirname(filename))
+        with codecs.open(tmp, 'w', 'utf-8') as f:
+            f.write(json.dumps(result))
+        rename_over_existing(tmp, filename)
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            os.remove(tmp)
+        except (IOError, OSError):
+            pass
+
+    others = glob.glob(os.path.join(os.path.dirname(filename), "conda-info-*.json"))
+    if len(others) > _MAX_INFO_CACHE_FILES:
+        others.sort(key=lambda other: _mtime_or_none(other) or 0)
+        for other in others[:-_MAX_INFO_CACHE_FILES]:
+            try:
+                os.remove(other)
+            except (IOError, OSError):
+                pass
+
+
+def invalidate_info_cache():
+    """Forget cached ``info()`` results, both in memory and on disk.
+
+    Call this after doing something that changes the output of
+    ``conda info``, such as creating a named environment or
+    editing conda's configuration in a way we can't detect.
+    """
+    global _envs_dirs
+    global _root_dir
+    with _info_cache_lock:
+        _info_cache.clear()
+        _envs_dirs = None
+        _root_dir = None
+        for filename in glob.glob(os.path.join(user_cache_directory(), "conda-info-*.json")):
+            try:
+                os.remove(filename)
+            except (IOError, OSError):
+                pass
+
+
+def info(refresh=False):
     """Return a dictionary with configuration information.
 
     No guarantee is made about which keys exist.  Therefore this function
     should only be used for testing and debugging.
+
+    The result is cached in memory and on disk, keyed on the conda
+    executable, its modification time, the condarc files, and the
+    ``CONDA*`` environment variables; see ``invalidate_info_cache()``.
+
+    Args:
+        refresh (bool): run ``conda info`` again and replace the cached result
+            for the current key, leaving other cached results alone
     """
-    return _call_and_parse_json(['info', '--json'])
+    extra_args = ['info', '--json']
+    key = _info_cache_key(_get_conda_command(extra_args))
+    if key is None:
+        return _call_and_parse_json(extra_args)
+
+    with _info_cache_lock:
+        result = None if refresh else _info_cache.get(key)
+        if result is None:
+            result = None if refresh else _load_info_from_disk(key)
+            if result is None:
+                result = _call_and_parse_json(extra_args)
+                _save_info_to_disk(key, result)
+            _info_cache[key] = result
+    # copy so callers can't modify the cached value
+    return json.loads(json.dumps(result))
 
 
 def resolve_env_to_prefix(name_or_prefix):
@@ -82,16 +231,21 @@ def resolve_env_to_prefix(name_or_prefix):
     if os.path.isabs(name_or_prefix):
         return name_or_prefix
 
-    json = info()
-    root_prefix = json.get('root_prefix', None)
-    if name_or_prefix == 'root':
-        return root_prefix
+    def find(info_json):
+        if name_or_prefix == 'root':
+            return info_json.get('root_prefix', None)
 
-    envs = json.get('envs', [])
-    for prefix in envs:
-        if os.path.basename(prefix) == name_or_prefix:
-            return prefix
-    return None
+        envs = info_json.get('envs', [])
+        for prefix in envs:
+            if os.path.basename(prefix) == name_or_prefix:
+                return prefix
+        return None
+
+    prefix = find(info())
+    if prefix is None or not os.path.isdir(prefix):
+        # the cached info may predate creating or removing the env
+        prefix = find(info(refresh=True))
+    return prefix
 
 
 def create(prefix, pkgs=None, channels=()):
@@ -111,6 +265,19 @@ def create(prefix, pkgs=None, channels=()):
     return _call_conda(cmd_list)
 
 
+def clone(prefix, source_prefix):
+    """Create an environment as a copy of another one.
+
+    conda hard-links packages from its package cache where it can,
+    so this is much faster than solving and installing from scratch.
+    """
+    if os.path.exists(prefix):
+        raise CondaEnvExistsError('Conda environment [%s] already exists' % prefix)
+
+    cmd_list = ['create', '--yes', '--quiet', '--prefix', prefix, '--clone', source_prefix]
+    return _call_conda(cmd_list)
+
+
 def install(prefix, pkgs=None, channels=()):
     """Install packages into an environment either by name or path with a specified set of packages."""
     if not pkgs or not isinstance(pkgs, (list, tuple)):
@@ -276,6 +443,124 @@ def parse_spec(spec):
         pip_constraint = pip_constraint.replace(' ', '')
     return ParsedSpec(name=m.group('name').lower(), conda_constraint=m.group('cc'), pip_constraint=pip_constraint)
 
+
+def _version_key(version):
+    # This approximates conda's VersionOrder: an optional epoch,
+    # then numeric and alphabetic runs compared in order, with
+    # "dev" sorting before pre-releases like "a1" or "rc2", those
+    # before releases, and "post" after. The local version after
+    # "+" is ignored. Missing trailing parts count as zero.
+    version = version.strip().lower()
+    epoch = 0
+    if '!' in version:
+        (epoch_string, version) = version.split('!', 1)
+        try:
+            epoch = int(epoch_string)
+        except ValueError:
+            pass
+    version = version.split('+', 1)[0]
+    key = []
+    for part in re.findall(r'[0-9]+|[a-z]+', version):
+        if part.isdigit():
+            key.append((2, int(part), ''))
+        elif part == 'dev':
+            key.append((0, 0, ''))
+        elif part == 'post':
+            key.append((3, 0, ''))
+        else:
+            key.append((1, 0, part))
+    return (epoch, key)
+
+
+def _compare_versions(a, b):
+    (a_epoch, a_key) = _version_key(a)
+    (b_epoch, b_key) = _version_key(b)
+    if a_epoch != b_epoch:
+        return -1 if a_epoch < b_epoch else 1
+    zero = (2, 0, '')
+    for i in range(max(len(a_key), len(b_key))):
+        a_part = a_key[i] if i < len(a_key) else zero
+        b_part = b_key[i] if i < len(b_key) else zero
+        if a_part != b_part:
+            return -1 if a_part < b_part else 1
+    return 0
+
+
+def _fuzzy_version_matches(version, pattern):
+    # "1.2" matches "1.2", "1.2.1" but not "1.20"; "1.2*" is a glob
+    if '*' in pattern:
+        return fnmatch.fnmatchcase(version, pattern)
+    elif version.startswith(pattern):
+        rest = version[len(pattern):]
+        return rest == '' or not rest[0].isdigit()
+    else:
+        return False
+
+
+_version_clause_pat = re.compile(r'^(==|!=|>=|<=|>|<|=)?(.+)$')
+
+
+def _version_clause_matches(version, clause):
+    m = _version_clause_pat.match(clause)
+    if m is None:
+        return False
+    (op, operand) = (m.group(1), m.group(2))
+    if op is None or op == '=':
+        return _fuzzy_version_matches(version, operand)
+    elif op == '==':
+        if '*' in operand:
+            return fnmatch.fnmatchcase(version, operand)
+        return _compare_versions(version, operand) == 0
+    elif op == '!=':
+        if '*' in operand:
+            return not fnmatch.fnmatchcase(version, operand)
+        return _compare_versions(version, operand) != 0
+    comparison = _compare_versions(version, operand)
+    if op == '>=':
+        return comparison >= 0
+    elif op == '<=':
+        return comparison <= 0
+    elif op == '>':
+        return comparison > 0
+    else:
+        assert op == '<'
+        return comparison < 0
+
+
+def _version_constraint_matches(version, constraint):
+    # "|" separates alternatives, "," separates required clauses
+    for alternative in constraint.split('|'):
+        if all(_version_clause_matches(version, clause) for clause in alternative.split(',')):
+            return True
+    return False
+
+
+def installed_version_matches(parsed_spec, version, build):
+    """Check whether an installed package version and build satisfy a parsed spec.
+
+    Args:
+        parsed_spec (ParsedSpec): result of ``parse_spec()``
+        version (str): installed version
+        build (str): installed build string
+
+    Returns:
+        True if the installed package is acceptable
+    """
+    if parsed_spec.conda_constraint is not None:
+        # "=1.2" means 1.2.*, while "=1.2=build" means exactly
+        # version 1.2 with a matching build string
+        pieces = parsed_spec.conda_constraint[1:].split('=', 1)
+        if len(pieces) == 1:
+            return _version_constraint_matches(version, pieces[0])
+        else:
+            return (any(fnmatch.fnmatchcase(version, alternative) for alternative in pieces[0].split('|')) and
+                    fnmatch.fnmatchcase(build, pieces[1]))
+    elif parsed_spec.pip_constraint is not None:
+        return _version_constraint_matches(version, parsed_spec.pip_constraint)
+    else:
+        return True
+
+
 # these are in order of preference. On pre-4.1.4 Windows,
 # CONDA_PREFIX and CONDA_ENV_PATH aren't set, so we get to
 # CONDA_DEFAULT_ENV.
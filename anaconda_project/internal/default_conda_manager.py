@@ -9,13 +9,16 @@ from __future__ import absolute_import
 
 import codecs
 import glob
+import hashlib
 import json
 import os
+import shutil
 
 from anaconda_project.conda_manager import CondaManager, CondaEnvironmentDeviations, CondaManagerError
 import anaconda_project.internal.conda_api as conda_api
 import anaconda_project.internal.pip_api as pip_api
 import anaconda_project.internal.makedirs as makedirs
+from anaconda_project.internal.scandir import scandir
 
 from anaconda_project.version import version
 
@@ -24,32 +27,51 @@ class DefaultCondaManager(CondaManager):
     def _timestamp_file(self, prefix, spec):
         return os.path.join(prefix, "var", "cache", "anaconda-project", "env-specs", spec.channels_and_packages_hash)
 
-    def _timestamp_comparison_directories(self, prefix):
-        # this is a little bit heuristic; we are trying to detect
-        # if any packages are installed or removed. This may need
-        # to become more comprehensive.  We don't want to check
-        # directories that would change at runtime like /var/run,
-        # and we need this to be reasonably fast (so we can't do a
-        # full directory walk or something). Remember that on
-        # Linux at least a new mtime on a directory means
-        # _immediate_ child directory entries were added or
-        # removed, changing the files themselves or the files in
-        # subdirs will not affect mtime. Windows may be a bit
-        # different.
-
+    def _site_packages_directories(self, prefix):
         # Linux
         dirs = list(glob.iglob(os.path.join(prefix, "lib", "python*", "site-packages")))
-        dirs.append(os.path.join(prefix, "bin"))
-        dirs.append(os.path.join(prefix, "lib"))
         # Windows
         dirs.append(os.path.join(prefix, "Lib", "site-packages"))
-        dirs.append(os.path.join(prefix, "Library", "bin"))
-        dirs.append(os.path.join(prefix, "Scripts"))
-        # conda-meta
-        dirs.append(os.path.join(prefix, "conda-meta"))
-
         return dirs
 
+    def _environment_manifest(self, prefix, spec):
+        # The manifest records exactly which packages are installed,
+        # plus the size and mtime of each conda-meta record so that
+        # we notice packages being replaced by another build. This
+        # is a single scandir of conda-meta (plus one of
+        # site-packages if we have pip packages), which is cheap,
+        # but unlike directory mtimes it notices every change.
+        records = []
+        try:
+            for entry in scandir(os.path.join(prefix, "conda-meta")):
+                if entry.name.endswith(".json"):
+                    st = entry.stat()
+                    records.append((entry.name[:-5], st.st_size, st.st_mtime))
+        except OSError:
+            return None
+        records.sort()
+
+        digest = hashlib.sha1()
+        for (name, size, mtime) in records:
+            digest.update(("%s %d %r\n" % (name, size, mtime)).encode('utf-8'))
+
+        manifest = dict(conda_meta=[record[0] for record in records], conda_meta_digest=digest.hexdigest())
+
+        # pip doesn't touch conda-meta, so if we care about pip
+        # packages we also need the pip metadata directories.
+        if len(spec.pip_packages) > 0:
+            pip_records = []
+            for site_packages in self._site_packages_directories(prefix):
+                try:
+                    for entry in scandir(site_packages):
+                        if entry.name.endswith((".dist-info", ".egg-info", ".egg-link")):
+                            pip_records.append(entry.name)
+                except OSError:
+                    pass
+            manifest['pip'] = sorted(pip_records)
+
+        return manifest
+
     def _timestamp_file_up_to_date(self, prefix, spec):
         # The goal here is to return False if 1) the env spec
         # has changed (different hash) or 2) the environment has
@@ -57,70 +79,56 @@ class DefaultCondaManager(CondaManager):
 
         filename = self._timestamp_file(prefix, spec)
         try:
-            stamp_mtime = os.path.getmtime(filename)
-        except OSError:
+            with codecs.open(filename, 'r', encoding='utf-8') as f:
+                recorded = json.loads(f.read())
+        except (IOError, OSError, ValueError):
             return False
 
-        dirs = self._timestamp_comparison_directories(prefix)
+        # timestamp files written by older versions don't have a manifest
+        if not isinstance(recorded, dict) or 'manifest' not in recorded:
+            return False
 
-        for d in dirs:
-            try:
-                d_mtime = os.path.getmtime(d)
-            except OSError:
-                d_mtime = 0
-            # When we write the timestamp, we put it 1s in the
-            # future, so we want >= here (if the d_mtime has gone
-            # into the future from when we wrote the timestamp,
-            # the directory has changed).
-            if d_mtime >= stamp_mtime:
-                return False
-
-        return True
+        manifest = self._environment_manifest(prefix, spec)
+        return manifest is not None and manifest == recorded['manifest']
 
     def _write_timestamp_file(self, prefix, spec):
         filename = self._timestamp_file(prefix, spec)
-        makedirs.makedirs_ok_if_exists(os.path.dirname(filename))
+        manifest = self._environment_manifest(prefix, spec)
+        if manifest is None:
+            return
 
         try:
+            makedirs.makedirs_ok_if_exists(os.path.dirname(filename))
             with codecs.open(filename, 'w', encoding='utf-8') as f:
-                # we don't read the contents of the file for now, but
-                # recording the version in it in case in the future
-                # that is useful. We need to write something to the
-                # file to bump its mtime if it already exists...
-                f.write(json.dumps(dict(anaconda_project_version=version)) + "\n")
-            # set the timestamp 1s in the future, which guarantees
-            # it doesn't have the same mtime as any files in the
-            # environment changed by us; if another process
-            # changes some files during the current second, then
-            # we would not notice those changes. The alternative
-            # is that we falsely believe we changed things
-            # ourselves. Ultimately clock resolution keeps us from
-            # perfection here without some sort of cross-process
-            # locking.
-            actual_time = os.path.getmtime(filename)
-            next_tick_time = actual_time + 1
-            os.utime(filename, (next_tick_time, next_tick_time))
+                f.write(json.dumps(dict(anaconda_project_version=version, manifest=manifest)) + "\n")
         except (IOError, OSError):
             # ignore errors because this is just an optimization, if we
             # fail we will survive
             pass
 
-    def _find_conda_missing(self, prefix, spec):
+    def _find_conda_deviations(self, prefix, spec):
+        # conda-meta records are named name-version-build.json, so
+        # one listing of conda-meta gives us everything we need to
+        # check the version and build constraints, without reading
+        # the (potentially large) JSON records themselves.
         try:
             installed = conda_api.installed(prefix)
         except conda_api.CondaError as e:
             raise CondaManagerError("Conda failed while listing installed packages in %s: %s" % (prefix, str(e)))
 
-        # TODO: we don't verify that the environment contains the right versions
-        # https://github.com/Anaconda-Server/anaconda-project/issues/77
-
         missing = set()
+        wrong_version = set()
 
         for name in spec.conda_package_names_set:
             if name not in installed:
                 missing.add(name)
+                continue
+            parsed = conda_api.parse_spec(spec.specs_for_conda_package_names([name])[0])
+            (_, installed_version, installed_build) = installed[name]
+            if not conda_api.installed_version_matches(parsed, installed_version, installed_build):
+                wrong_version.add(name)
 
-        return sorted(list(missing))
+        return (sorted(list(missing)), sorted(list(wrong_version)))
 
     def _find_pip_missing(self, prefix, spec):
         # this is an important optimization to avoid a slow "pip
@@ -144,6 +152,43 @@ class DefaultCondaManager(CondaManager):
 
         return sorted(list(missing))
 
+    def _find_clone_source(self, prefix, spec):
+        # Project env specs live side by side in envs/<name>, so
+        # an ancestor env spec's environment would be a sibling of
+        # ours. We only clone it if it's completely up to date,
+        # which means it has all of the ancestor's packages.
+        if os.path.basename(prefix) != spec.name:
+            return None
+        parent_dir = os.path.dirname(prefix)
+        # nearest ancestors first, since they have the most in common with us
+        ancestors = list(spec.inherit_from)
+        seen = set()
+        while len(ancestors) > 0:
+            ancestor = ancestors.pop(0)
+            if ancestor.name is None or ancestor.name in seen:
+                continue
+            seen.add(ancestor.name)
+            candidate = os.path.join(parent_dir, ancestor.name)
+            if (os.path.isdir(os.path.join(candidate, 'conda-meta')) and
+                    self._timestamp_file_up_to_date(candidate, ancestor)):
+                return candidate
+            ancestors.extend(ancestor.inherit_from)
+        return None
+
+    def _clone_environment(self, prefix, spec):
+        # returns True if we cloned, False if we need to create from scratch
+        source_prefix = self._find_clone_source(prefix, spec)
+        if source_prefix is None:
+            return False
+        try:
+            conda_api.clone(prefix=prefix, source_prefix=source_prefix)
+            return True
+        except conda_api.CondaError:
+            # fall back to creating from scratch; clean up any partial clone
+            if os.path.exists(prefix):
+                shutil.rmtree(prefix, ignore_errors=True)
+            return False
+
     def find_environment_deviations(self, prefix, spec):
         if not os.path.isdir(os.path.join(prefix, 'conda-meta')):
             return CondaEnvironmentDeviations(
@@ -156,22 +201,25 @@ class DefaultCondaManager(CondaManager):
 
         if self._timestamp_file_up_to_date(prefix, spec):
             conda_missing = []
+            conda_wrong_version = []
             pip_missing = []
             timestamp_ok = True
         else:
-            conda_missing = self._find_conda_missing(prefix, spec)
+            (conda_missing, conda_wrong_version) = self._find_conda_deviations(prefix, spec)
             pip_missing = self._find_pip_missing(prefix, spec)
             timestamp_ok = False
 
         if len(conda_missing) > 0 or len(pip_missing) > 0:
             summary = "Conda environment is missing packages: %s" % (", ".join(conda_missing + pip_missing))
+        elif len(conda_wrong_version) > 0:
+            summary = "Conda environment has wrong versions of packages: %s" % (", ".join(conda_wrong_version))
         elif not timestamp_ok:
             summary = "Conda environment needs to be marked as up-to-date"
         else:
             summary = "OK"
         return CondaEnvironmentDeviations(summary=summary,
                                           missing_packages=conda_missing,
-                                          wrong_version_packages=(),
+                                          wrong_version_packages=conda_wrong_version,
                                           missing_pip_packages=pip_missing,
                                           wrong_version_pip_packages=(),
                                           broken=(not timestamp_ok))
@@ -186,15 +234,29 @@ class DefaultCondaManager(CondaManager):
             command_line_packages = set(['python'])
 
         if os.path.isdir(os.path.join(prefix, 'conda-meta')):
+            # install only the packages that are missing or the wrong
+            # version; conda install with the full spec will replace
+            # a mismatched version.
             missing = deviations.missing_packages
-            if len(missing) > 0:
-                specs = spec.specs_for_conda_package_names(missing)
-                assert len(specs) == len(missing)
+            wrong_version = deviations.wrong_version_packages
+            if len(missing) > 0 or len(wrong_version) > 0:
+                names = list(missing) + list(wrong_version)
+                specs = spec.specs_for_conda_package_names(names)
+                assert len(specs) == len(names)
                 try:
                     conda_api.install(prefix=prefix, pkgs=specs, channels=spec.channels)
                 except conda_api.CondaError as e:
-                    raise CondaManagerError("Failed to install missing packages: {}: {}".format(", ".join(missing), str(
-                        e)))
+                    if len(wrong_version) == 0:
+                        message = "Failed to install missing packages: {}: {}"
+                    else:
+                        message = "Failed to install missing or wrong-version packages: {}: {}"
+                    raise CondaManagerError(message.format(", ".join(names), str(e)))
+        elif create and self._clone_environment(prefix, spec):
+            # We cloned an ancestor env spec's environment, so we
+            # only need to add whatever this env spec has on top
+            # of the ancestor's packages.
+            self.fix_environment_deviations(prefix, spec, create=False)
+            return
         elif create:
             # Create environment from scratch
             try:
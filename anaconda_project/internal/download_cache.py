@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A per-user store of downloaded files, shared by all projects.
+
+Files are kept under the user cache directory, named by their
+checksum when the project gives us one
+(``<algorithm>/<hash value>``), or else by their URL
+(``url/<sha256 of url>``) along with the server's ETag so we can
+ask the server whether our copy is still current. Each file has
+a ``.json`` sidecar describing it; the sidecar's modification
+time records when the file was last used, so we can evict the
+least recently used files when the cache gets too big.
+
+Files are placed into projects with a reflink (copy-on-write
+clone) where the filesystem supports it, then a hard link, then
+a plain copy.
+"""
+from __future__ import absolute_import, print_function
+
+import codecs
+import errno
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import time
+import uuid
+
+from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.rename import rename_over_existing
+from anaconda_project.internal.user_cache import user_cache_directory
+
+DEFAULT_MAX_SIZE = 20 * 1024 * 1024 * 1024
+
+_SIZE_SUFFIXES = dict(K=1024, M=1024 * 1024, G=1024 * 1024 * 1024, T=1024 * 1024 * 1024 * 1024)
+
+_SIDECAR_SUFFIX = ".json"
+
+# from linux/fs.h
+_FICLONE = 0x40049409
+
+
+class CacheEntry(object):
+    """A file in the download cache."""
+
+    def __init__(self, path, size, last_used, url):
+        """Create a CacheEntry.
+
+        Args:
+            path (str): the cached file
+            size (int): size in bytes
+            last_used (float): time the file was last stored or used
+            url (str): where the file was downloaded from, if known
+        """
+        self.path = path
+        self.size = size
+        self.last_used = last_used
+        self.url = url
+
+
+def parse_size(text):
+    """Parse a size such as "500M" or "20G" into a number of bytes.
+
+    Returns:
+        number of bytes, or None if we can't parse it
+    """
+    match = re.match(r"^\s*(\d+)\s*([KMGT]?)B?\s*$", text, re.IGNORECASE)
+    if match is None:
+        return None
+    return int(match.group(1)) * _SIZE_SUFFIXES.get(match.group(2).upper(), 1)
+
+
+def format_size(size):
+    """Format a number of bytes for people to read."""
+    for suffix in ('T', 'G', 'M', 'K'):
+        if size >= _SIZE_SUFFIXES[suffix]:
+            return "%.1f%s" % (float(size) / _SIZE_SUFFIXES[suffix], suffix)
+    return "%d" % size
+
+
+def cache_directory(environ=None):
+    """Get the directory holding the download cache, which may not exist yet."""
+    return os.path.join(user_cache_directory(environ), "downloads")
+
+
+def max_size(environ=None):
+    """Get the most bytes the cache may hold, 0 if the cache is disabled.
+
+    ``ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE`` sets the size, such as
+    "50G"; set it to 0 to turn the cache off.
+    """
+    if environ is None:
+        environ = os.environ
+    text = environ.get('ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE', '')
+    if text == '':
+        return DEFAULT_MAX_SIZE
+    size = parse_size(text)
+    if size is None:
+        return DEFAULT_MAX_SIZE
+    return size
+
+
+def _hash_path(directory, hash_algorithm, hash_value):
+    # the hash value comes from the project file, so be sure it can't escape the cache
+    if hash_algorithm is None or hash_value is None or re.match(r"^[0-9a-fA-F]+$", hash_value) is None:
+        return None
+    return os.path.join(directory, hash_algorithm, hash_value.lower())
+
+
+def _url_path(directory, url):
+    return os.path.join(directory, "url", hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+
+def _read_sidecar(path):
+    try:
+        with codecs.open(path + _SIDECAR_SUFFIX, 'r', 'utf-8') as f:
+            sidecar = json.load(f)
+        if not isinstance(sidecar, dict):
+            return None
+        return sidecar
+    except (EnvironmentError, ValueError):
+        return None
+
+
+def _write_sidecar(path, sidecar):
+    tmp = path + _SIDECAR_SUFFIX + ".tmp-" + str(uuid.uuid4())
+    with codecs.open(tmp, 'w', 'utf-8') as f:
+        json.dump(sidecar, f)
+    rename_over_existing(tmp, path + _SIDECAR_SUFFIX)
+
+
+def _remove(path):
+    for filename in (path, path + _SIDECAR_SUFFIX):
+        try:
+            os.remove(filename)
+        except EnvironmentError:
+            pass
+
+
+def _check_entry(path):
+    # returns the sidecar if the file is still as we stored it. Projects
+    # may share the file through a hard link, so we check it wasn't
+    # modified in place.
+    sidecar = _read_sidecar(path)
+    if sidecar is None:
+        return None
+    try:
+        st = os.stat(path)
+    except EnvironmentError:
+        return None
+    if st.st_size != sidecar.get('size') or st.st_mtime != sidecar.get('mtime'):
+        _remove(path)
+        return None
+    return sidecar
+
+
+def _touch(path):
+    try:
+        os.utime(path + _SIDECAR_SUFFIX, None)
+    except EnvironmentError:
+        pass
+
+
+def lookup(directory, hash_algorithm, hash_value):
+    """Find a cached file with the given checksum.
+
+    Returns:
+        path to the cached file, or None
+    """
+    path = _hash_path(directory, hash_algorithm, hash_value)
+    if path is None or _check_entry(path) is None:
+        return None
+    _touch(path)
+    return path
+
+
+def lookup_url(directory, url):
+    """Find a cached file downloaded from the given URL.
+
+    The caller should ask the server whether the file has changed
+    by sending the ETag in ``If-None-Match``.
+
+    Returns:
+        tuple of (path to the cached file, ETag), or None
+    """
+    path = _url_path(directory, url)
+    sidecar = _check_entry(path)
+    if sidecar is None or sidecar.get('url') != url or not sidecar.get('etag'):
+        return None
+    _touch(path)
+    return (path, sidecar['etag'])
+
+
+def _reflink(src, dest):
+    # copy-on-write clone, only on Linux filesystems which support it (btrfs, xfs)
+    if platform.system() != 'Linux':
+        return False
+    import fcntl
+    with open(src, 'rb') as src_file:
+        with open(dest, 'wb') as dest_file:
+            try:
+                fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+                return True
+            except (EnvironmentError, ValueError):
+                pass
+    os.remove(dest)
+    return False
+
+
+def _link_or_copy(src, dest):
+    if _reflink(src, dest):
+        return
+    try:
+        os.link(src, dest)
+        return
+    except (AttributeError, EnvironmentError):
+        # no os.link on Windows with Python 2, or a different device
+        pass
+    shutil.copyfile(src, dest)
+
+
+def copy_out(path, dest):
+    """Place a cached file at dest, replacing anything already there.
+
+    Returns:
+        True on success
+    """
+    tmp = dest + ".part"
+    try:
+        makedirs_ok_if_exists(os.path.dirname(dest))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        _link_or_copy(path, tmp)
+        rename_over_existing(tmp, dest)
+        return True
+    except EnvironmentError:
+        try:
+            os.remove(tmp)
+        except EnvironmentError:
+            pass
+        return False
+
+
+def store(directory, filename, hash_algorithm=None, hash_value=None, url=None, etag=None):
+    """Add a downloaded file to the cache, keyed by checksum or else by URL and ETag.
+
+    Files with neither a checksum nor an ETag are not cached.
+
+    Returns:
+        path to the cached file, or None if we didn't cache it
+    """
+    path = _hash_path(directory, hash_algorithm, hash_value)
+    if path is None:
+        if url is None or not etag:
+            return None
+        path = _url_path(directory, url)
+
+    tmp = path + ".tmp-" + str(uuid.uuid4())
+    try:
+        makedirs_ok_if_exists(os.path.dirname(path))
+        _link_or_copy(filename, tmp)
+        rename_over_existing(tmp, path)
+        st = os.stat(path)
+        _write_sidecar(path, dict(url=url, etag=etag, size=st.st_size, mtime=st.st_mtime))
+        return path
+    except EnvironmentError:
+        _remove(tmp)
+        return None
+
+
+def entries(directory):
+    """List the files in the cache, least recently used first.
+
+    Returns:
+        list of CacheEntry
+    """
+    result = []
+    for (dirpath, dirnames, filenames) in os.walk(directory):
+        for name in filenames:
+            if not name.endswith(_SIDECAR_SUFFIX):
+                continue
+            path = os.path.join(dirpath, name[:-len(_SIDECAR_SUFFIX)])
+            sidecar = _read_sidecar(path)
+            try:
+                size = os.path.getsize(path)
+                last_used = os.path.getmtime(path + _SIDECAR_SUFFIX)
+            except EnvironmentError:
+                continue
+            result.append(CacheEntry(path=path,
+                                     size=size,
+                                     last_used=last_used,
+                                     url=(sidecar or dict()).get('url')))
+    result.sort(key=lambda entry: (entry.last_used, entry.path))
+    return result
+
+
+def _is_stale_leftover(path, now):
+    # files from stores and sidecar writes that never finished
+    try:
+        return ".tmp-" in os.path.basename(path) and os.path.getmtime(path) < now - 60 * 60
+    except EnvironmentError:
+        return False
+
+
+def prune(directory, max_size):
+    """Remove the least recently used files until the cache holds at most max_size bytes.
+
+    Also removes files we can no longer account for, such as
+    leftovers from interrupted stores.
+
+    Returns:
+        list of CacheEntry that were removed
+    """
+    now = time.time()
+    for (dirpath, dirnames, filenames) in os.walk(directory):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.endswith(_SIDECAR_SUFFIX):
+                orphaned = not os.path.exists(path[:-len(_SIDECAR_SUFFIX)])
+            else:
+                orphaned = not os.path.exists(path + _SIDECAR_SUFFIX)
+            if (orphaned and ".tmp-" not in name) or _is_stale_leftover(path, now):
+                try:
+                    os.remove(path)
+                except EnvironmentError:
+                    pass
+
+    removed = []
+    remaining = entries(directory)
+    total = sum(entry.size for entry in remaining)
+    for entry in remaining:
+        if total <= max_size:
+            break
+        _remove(entry.path)
+        total -= entry.size
+        removed.append(entry)
+    return removed
+
+
+def clear(directory):
+    """Remove everything from the cache.
+
+    Returns:
+        list of CacheEntry that were removed
+    """
+    removed = prune(directory, 0)
+    try:
+        shutil.rmtree(directory)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            raise e
+    return removed
@@ -8,30 +8,155 @@ from __future__ import absolute_import, print_function
 
 from tornado import httpclient
 from tornado import gen
+from tornado.ioloop import IOLoop
 
 import anaconda_project.internal.makedirs as makedirs
 import anaconda_project.internal.rename as rename
 
+import codecs
 import os
 import hashlib
+import json
+import re
+
+# how many downloads download_all() runs at once by default
+DEFAULT_MAX_CLIENTS = 8
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# below this size, we download in one piece even if asked for segments
+_MIN_SEGMENT_SIZE = 1024 * 1024
+
+# returned by _fetch() when we should throw away the partial file and try again
+_START_OVER = object()
+
+# next to a .part file, says where it came from so we can resume it safely
+_PART_INFO_SUFFIX = ".json"
+
+
+def _create_client(io_loop, max_clients):
+    return httpclient.AsyncHTTPClient(
+        io_loop=io_loop,
+        max_clients=max_clients,
+        # without this we buffer a huge amount
+        # of stuff and then call the streaming_callback
+        # once.
+        max_buffer_size=1024 * 1024,
+        # without this we 599 on large downloads
+        max_body_size=100 * 1024 * 1024 * 1024,
+        force_instance=True)
+
+
+def _range_header_callback(state):
+    # record the status code, the start of any Content-Range, and
+    # the validators in state; with redirects we see more than one
+    # status line, and the last one wins.
+    def header_callback(line):
+        lower = line.lower()
+        if line.startswith("HTTP/"):
+            fields = line.split()
+            state['code'] = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else None
+            state['range_start'] = None
+            state['etag'] = None
+            state['last_modified'] = None
+        elif lower.startswith("content-range:"):
+            match = re.match(r"\s*bytes\s+(\d+)-", line.split(":", 1)[1])
+            if match is not None:
+                state['range_start'] = int(match.group(1))
+        elif lower.startswith("etag:"):
+            state['etag'] = line.split(":", 1)[1].strip()
+        elif lower.startswith("last-modified:"):
+            state['last_modified'] = line.split(":", 1)[1].strip()
+
+    return header_callback
+
+
+def _if_range_validator(etag, last_modified):
+    # If-Range needs a strong validator, so a weak ETag won't do
+    if etag and not etag.startswith("W/"):
+        return etag
+    elif last_modified:
+        return last_modified
+    else:
+        return None
+
+
+def _load_partial_info(tmp_filename, url):
+    # the If-Range validator to resume tmp_filename with, or None if
+    # we can't tell that it's a partial copy of what's at url now
+    try:
+        with codecs.open(tmp_filename + _PART_INFO_SUFFIX, 'r', 'utf-8') as f:
+            info = json.load(f)
+        if isinstance(info, dict) and info.get('url') == url:
+            return info.get('validator', None)
+    except (EnvironmentError, ValueError):
+        pass
+    return None
+
+
+def _save_partial_info(tmp_filename, url, validator):
+    try:
+        if validator is None:
+            _remove_partial_info(tmp_filename)
+        else:
+            with codecs.open(tmp_filename + _PART_INFO_SUFFIX, 'w', 'utf-8') as f:
+                json.dump(dict(url=url, validator=validator), f)
+    except EnvironmentError:
+        # we just won't be able to resume
+        pass
+
+
+def _remove_partial_info(tmp_filename):
+    try:
+        os.remove(tmp_filename + _PART_INFO_SUFFIX)
+    except EnvironmentError:
+        pass
 
 
 class FileDownloader(object):
-    def __init__(self, url, filename, hash_algorithm=None):
+    def __init__(self, url, filename, hash_algorithm=None, segments=1, if_none_match=None):
         """Downloader for the given url to the given filename, computing the given hash.
 
         hash_algorithm is the name of a hash function in hashlib
+
+        segments is the number of byte ranges to fetch at once, if
+        the server supports ranges and the file is large enough
+
+        if_none_match is the ETag of a copy we already have; if the
+        server says it's current, the response code is 304 and
+        nothing is downloaded
         """
         self._url = url
         self._filename = filename
         self._hash_algorithm = hash_algorithm
+        self._segments = segments
+        self._if_none_match = if_none_match
         self._hash = None
         self._client = None
         self._errors = []
 
     @gen.coroutine
-    def run(self, io_loop):
-        """Run the download on the given io_loop."""
+    def run(self, io_loop, client=None):
+        """Run the download on the given io_loop.
+
+        If a client is given, it must belong to the io_loop; this
+        lets several downloads share one client and its connection
+        pool. Otherwise we create a client for this download only.
+
+        If an earlier attempt left a partial ``.part`` file behind,
+        from the same URL, we ask the server for only the rest of
+        the file if it's still the same version (with
+        ``If-Range``), falling back to a full download if the
+        server sends the whole thing.
+
+        Otherwise, if we were asked for more than one segment, we
+        check whether the server supports ranges and fetch the
+        segments at the same time, each one writing into its own
+        region of the file. The segments have a client of their own,
+        so they don't queue behind other downloads sharing our
+        client, and they use ``If-Range`` so they can't come from
+        different versions of the file.
+        """
         assert self._client is None
 
         dirname = os.path.dirname(self._filename)
@@ -41,43 +166,241 @@ class FileDownloader(object):
             self._errors.append("Could not create directory '%s': %s" % (dirname, e))
             raise gen.Return(None)
 
-        if self._hash_algorithm is not None:
-            hasher = getattr(hashlib, self._hash_algorithm)()
-        self._client = httpclient.AsyncHTTPClient(
-            io_loop=io_loop,
-            max_clients=1,
-            # without this we buffer a huge amount
-            # of stuff and then call the streaming_callback
-            # once.
-            max_buffer_size=1024 * 1024,
-            # without this we 599 on large downloads
-            max_body_size=100 * 1024 * 1024 * 1024,
-            force_instance=True)
+        if client is None:
+            client = _create_client(io_loop, max_clients=self._segments)
+        self._client = client
+
+        if self._segments > 1 and self._if_none_match is None and not os.path.exists(self._filename + ".part"):
+            probe = yield self._probe()
+            if probe is not None:
+                (response, length, validator) = probe
+                count = min(self._segments, length // _MIN_SEGMENT_SIZE)
+                if count > 1:
+                    response = yield self._fetch_segments(io_loop, response, length, count, validator)
+                    raise gen.Return(response)
+
+        response = yield self._fetch(resume=True)
+        if response is _START_OVER:
+            response = yield self._fetch(resume=False)
+        raise gen.Return(response)
+
+    def _seed_hasher_from_partial_file(self, tmp_filename, hasher):
+        # returns the number of bytes we can resume after
+        try:
+            st = os.stat(tmp_filename)
+            if st.st_nlink > 1:
+                # hard linked from somewhere else (such as the download
+                # cache), so appending to it would change the other copy
+                os.remove(tmp_filename)
+                return 0
+            offset = st.st_size
+            if offset > 0 and hasher is not None:
+                with open(tmp_filename, 'rb') as f:
+                    while True:
+                        chunk = f.read(_HASH_CHUNK_SIZE)
+                        if len(chunk) == 0:
+                            break
+                        hasher.update(chunk)
+            return offset
+        except EnvironmentError:
+            return 0
+
+    @gen.coroutine
+    def _probe(self):
+        # returns (response, length, validator) if the server will give us ranges of the file
+        request = httpclient.HTTPRequest(url=self._url, method='HEAD', request_timeout=60)
+        try:
+            response = yield self._client.fetch(request)
+        except Exception:
+            # the real download will report any problem
+            raise gen.Return(None)
+
+        if response.headers.get('Accept-Ranges', '').strip().lower() != 'bytes':
+            raise gen.Return(None)
+        try:
+            length = int(response.headers.get('Content-Length', ''))
+        except ValueError:
+            raise gen.Return(None)
+        # without a validator we can't be sure all the ranges are of one version
+        validator = _if_range_validator(response.headers.get('ETag', None), response.headers.get('Last-Modified', None))
+        if validator is None:
+            raise gen.Return(None)
+        raise gen.Return((response, length, validator))
+
+    @gen.coroutine
+    def _fetch_segment(self, client, url, validator, tmp_filename, start, end):
+        # fetch bytes [start, end) into the same place in tmp_filename
+        try:
+            _file = open(tmp_filename, 'r+b')
+            _file.seek(start)
+        except EnvironmentError as e:
+            self._errors.append("Failed to open %s: %s" % (tmp_filename, e))
+            return
+
+        state = dict(code=None, range_start=None, written=0)
+
+        def bad_segment():
+            return "Failed download to %s: server did not send bytes %d-%d" % (self._filename, start, end - 1)
 
+        def writer(chunk):
+            if len(self._errors) > 0:
+                return
+            if state['code'] != 206 or state['range_start'] != start or state['written'] + len(chunk) > end - start:
+                self._errors.append(bad_segment())
+                return
+            try:
+                _file.write(chunk)
+                state['written'] += len(chunk)
+            except EnvironmentError as e:
+                self._errors.append("Failed to write to %s: %s" % (tmp_filename, e))
+
+        try:
+            timeout_in_seconds = 60 * 10
+            # if the file changed since the probe we get a 200, not a range
+            request = httpclient.HTTPRequest(url=url,
+                                             headers={'Range': "bytes=%d-%d" % (start, end - 1),
+                                                      'If-Range': validator},
+                                             header_callback=_range_header_callback(state),
+                                             streaming_callback=writer,
+                                             request_timeout=timeout_in_seconds)
+            try:
+                yield client.fetch(request)
+            except Exception as e:
+                self._errors.append("Failed download to %s: %s" % (self._filename, str(e)))
+                return
+
+            if len(self._errors) == 0 and state['written'] != end - start:
+                self._errors.append(bad_segment())
+        finally:
+            _file.close()
+
+    @gen.coroutine
+    def _fetch_segments(self, io_loop, probe_response, length, count, validator):
         tmp_filename = self._filename + ".part"
         try:
-            _file = open(tmp_filename, 'wb')
+            with open(tmp_filename, 'wb') as f:
+                # reserve the space up front so each segment can write into its own region
+                f.truncate(length)
         except EnvironmentError as e:
             self._errors.append("Failed to open %s: %s" % (tmp_filename, e))
             raise gen.Return(None)
 
-        def cleanup_tmp():
+        # a shared client may not have a free slot for each segment,
+        # and requests waiting in its queue time out
+        client = _create_client(io_loop, max_clients=count)
+        try:
+            # the probe followed any redirects for us
+            url = probe_response.effective_url
+            bounds = [(length * i // count, length * (i + 1) // count) for i in range(count)]
+            yield [self._fetch_segment(client, url, validator, tmp_filename, start, end) for (start, end) in bounds]
+
+            digest = None
+            if len(self._errors) == 0 and self._hash_algorithm is not None:
+                hasher = getattr(hashlib, self._hash_algorithm)()
+                try:
+                    with open(tmp_filename, 'rb') as f:
+                        while True:
+                            chunk = f.read(_HASH_CHUNK_SIZE)
+                            if len(chunk) == 0:
+                                break
+                            hasher.update(chunk)
+                    digest = hasher.hexdigest()
+                except EnvironmentError as e:
+                    self._errors.append("Failed to read %s: %s" % (tmp_filename, e))
+
+            if len(self._errors) == 0:
+                try:
+                    rename.rename_over_existing(tmp_filename, self._filename)
+                    self._hash = digest
+                except EnvironmentError as e:
+                    self._errors.append("Failed to rename %s to %s: %s" % (tmp_filename, self._filename, str(e)))
+        finally:
+            client.close()
+            # a file with holes in it can't be resumed, so never keep it
             try:
-                _file.close()
-                # future: we could save it in order to try
-                # resuming a failed download midstream, but
-                # pointless until the download code above
-                # knows how to resume.
                 os.remove(tmp_filename)
             except EnvironmentError:
                 pass
 
+        if len(self._errors) > 0:
+            raise gen.Return(None)
+        # the probe response describes the whole file we now have
+        raise gen.Return(probe_response)
+
+    @gen.coroutine
+    def _fetch(self, resume):
+        def new_hasher():
+            if self._hash_algorithm is not None:
+                return getattr(hashlib, self._hash_algorithm)()
+            else:
+                return None
+
+        state = dict(hasher=new_hasher(),
+                     offset=0,
+                     code=None,
+                     range_start=None,
+                     etag=None,
+                     last_modified=None,
+                     started=False)
+
+        tmp_filename = self._filename + ".part"
+        validator = None
+        if resume and os.path.exists(tmp_filename):
+            validator = _load_partial_info(tmp_filename, self._url)
+            # a partial file we know nothing about could be from
+            # another URL or an older version, so it's no use
+            if validator is not None:
+                state['offset'] = self._seed_hasher_from_partial_file(tmp_filename, state['hasher'])
+        if state['offset'] == 0:
+            state['hasher'] = new_hasher()
+
+        try:
+            _file = open(tmp_filename, 'ab' if state['offset'] > 0 else 'wb')
+        except EnvironmentError as e:
+            self._errors.append("Failed to open %s: %s" % (tmp_filename, e))
+            raise gen.Return(None)
+
+        def cleanup_tmp(keep_partial):
+            try:
+                _file.close()
+                # keep whatever we got so the next try can resume
+                if not (keep_partial and os.path.getsize(tmp_filename) > 0):
+                    _remove_partial_info(tmp_filename)
+                    os.remove(tmp_filename)
+            except EnvironmentError:
+                pass
+
+        def start_writing():
+            if state['started']:
+                return
+            state['started'] = True
+            if state['offset'] > 0 and state['code'] == 206:
+                if state['range_start'] != state['offset']:
+                    self._errors.append("Failed download to %s: server sent a range starting at %s, not %d" %
+                                        (self._filename, state['range_start'], state['offset']))
+                return
+            if state['offset'] > 0:
+                # the server ignored our range, or the file changed
+                # since the partial download, and sent the whole file
+                state['offset'] = 0
+                state['hasher'] = new_hasher()
+                _file.seek(0)
+                _file.truncate()
+            # remember which version this is, in case we have to resume it
+            _save_partial_info(tmp_filename, self._url, _if_range_validator(state['etag'], state['last_modified']))
+
         def writer(chunk):
+            if len(self._errors) == 0:
+                try:
+                    start_writing()
+                except EnvironmentError as e:
+                    self._errors.append("Failed to write to %s: %s" % (tmp_filename, e))
+
             if len(self._errors) > 0:
                 return
 
-            if self._hash_algorithm is not None:
-                hasher.update(chunk)
+            if state['hasher'] is not None:
+                state['hasher'].update(chunk)
 
             try:
                 _file.write(chunk)
@@ -87,14 +410,34 @@ class FileDownloader(object):
                 # we continue to download bytes that we don't use. yuck.
                 self._errors.append("Failed to write to %s: %s" % (tmp_filename, e))
 
+        keep_partial = False
         try:
             timeout_in_seconds = 60 * 10  # pretty long because we could be dealing with huge files
+            headers = dict()
+            if state['offset'] > 0:
+                headers['Range'] = "bytes=%d-" % state['offset']
+                headers['If-Range'] = validator
+            elif self._if_none_match is not None:
+                headers['If-None-Match'] = self._if_none_match
             request = httpclient.HTTPRequest(url=self._url,
+                                             headers=headers,
+                                             header_callback=_range_header_callback(state),
                                              streaming_callback=writer,
                                              request_timeout=timeout_in_seconds)
             try:
                 response = yield self._client.fetch(request)
             except Exception as e:
+                code = getattr(e, 'code', None)
+                if code == 304 and getattr(e, 'response', None) is not None:
+                    # our copy is current
+                    raise gen.Return(e.response)
+                if code == 416 and state['offset'] > 0:
+                    # our partial file is no good (perhaps the file on the server changed)
+                    raise gen.Return(_START_OVER)
+                # 599 is tornado's code for timeouts and dropped connections,
+                # and other exceptions are socket errors; those are worth resuming.
+                # An HTTP error status means the partial file is no use.
+                keep_partial = (code is None or code == 599) and len(self._errors) == 0
                 self._errors.append("Failed download to %s: %s" % (self._filename, str(e)))
                 raise gen.Return(None)
 
@@ -103,17 +446,18 @@ class FileDownloader(object):
 
             if len(self._errors) == 0:
                 try:
+                    start_writing()  # in case the body was empty
                     _file.close()  # be sure tmp_filename is flushed
                     rename.rename_over_existing(tmp_filename, self._filename)
                 except EnvironmentError as e:
                     self._errors.append("Failed to rename %s to %s: %s" % (tmp_filename, self._filename, str(e)))
 
-            if len(self._errors) == 0 and self._hash_algorithm is not None:
-                self._hash = hasher.hexdigest()
+            if len(self._errors) == 0 and state['hasher'] is not None:
+                self._hash = state['hasher'].hexdigest()
 
             raise gen.Return(response)
         finally:
-            cleanup_tmp()
+            cleanup_tmp(keep_partial)
 
     @property
     def hash(self):
@@ -124,3 +468,50 @@ class FileDownloader(object):
     def errors(self):
         """List of errors if we failed to download, empty list if we succeeded."""
         return self._errors
+
+
+def download_all(downloaders, max_clients=DEFAULT_MAX_CLIENTS):
+    """Run several ``FileDownloader`` at once, sharing one IOLoop and one HTTP client.
+
+    At most ``max_clients`` downloads are in progress at a time;
+    the rest wait their turn rather than queueing inside the
+    client, where they could time out before starting.
+
+    Args:
+        downloaders (list of FileDownloader): downloads to run, each not yet run
+        max_clients (int): maximum number of simultaneous downloads
+
+    Returns:
+        list of responses in the same order as the downloaders, None
+        for each download that failed (its ``errors`` say why)
+    """
+    downloaders = list(downloaders)
+    responses = [None] * len(downloaders)
+    if len(downloaders) == 0:
+        return responses
+
+    io_loop = IOLoop(make_current=False)
+    client = _create_client(io_loop, max_clients=max(1, max_clients))
+    remaining = list(reversed(range(len(downloaders))))
+
+    @gen.coroutine
+    def work():
+        while len(remaining) > 0:
+            index = remaining.pop()
+            download = downloaders[index]
+            try:
+                responses[index] = yield download.run(io_loop, client)
+            except Exception as e:
+                download.errors.append("Failed download to %s: %s" % (download._filename, str(e)))
+
+    @gen.coroutine
+    def run_all():
+        yield [work() for i in range(min(max(1, max_clients), len(downloaders)))]
+
+    try:
+        io_loop.run_sync(run_all)
+    finally:
+        client.close()
+        io_loop.close()
+
+    return responses
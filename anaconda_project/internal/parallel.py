@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Run functions on a bounded number of threads."""
+from __future__ import absolute_import
+
+import collections
+import multiprocessing
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:  # pragma: no cover (py2 only)
+    import Queue as queue
+
+
+def default_max_workers(limit=4):
+    """Get a reasonable default number of workers, never more than ``limit``."""
+    try:
+        count = multiprocessing.cpu_count()
+    except NotImplementedError:  # pragma: no cover (not on the platforms we support)
+        count = 1
+    return max(1, min(limit, count))
+
+
+def parallel_map(function, items, max_workers=None):
+    """Call a function on each item, using up to ``max_workers`` threads.
+
+    Results are returned in the same order as the items, regardless
+    of the order in which the calls finish. If any call raises, we
+    wait for the calls already started, then re-raise the exception
+    from the earliest item that failed.
+
+    With ``max_workers`` of 1 (or only one item) everything runs
+    on the calling thread.
+
+    Args:
+        function (function): function taking one item
+        items (iterable): items to pass to the function
+        max_workers (int): maximum number of threads, None for ``default_max_workers()``
+
+    Returns:
+        list of results
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = default_max_workers()
+    worker_count = max(1, min(max_workers, len(items)))
+    if worker_count == 1:
+        return [function(item) for item in items]
+
+    results = [None] * len(items)
+    exc_infos = [None] * len(items)
+    lock = threading.Lock()
+    remaining = list(reversed(range(len(items))))
+
+    def work():
+        while True:
+            with lock:
+                # stop handing out work after a failure
+                if len(remaining) == 0 or any(exc_infos):
+                    return
+                index = remaining.pop()
+            try:
+                results[index] = function(items[index])
+            except Exception:
+                exc_infos[index] = sys.exc_info()
+
+    threads = [threading.Thread(target=work) for i in range(worker_count)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for exc_info in exc_infos:
+        if exc_info is not None:
+            # on Python 3 the exception keeps its original traceback
+            raise exc_info[1]
+    return results
+
+
+class OrderedPipeline(object):
+    """Run a function on items on worker threads as they're added, getting results back in order.
+
+    Unlike ``parallel_map``, items can be fed in one at a time and
+    results come back as soon as they and all earlier results are
+    ready, so a long stream of items can be processed without
+    holding all of the results at once. At most ``max_pending``
+    items are in progress or waiting to be collected; ``put()``
+    blocks until there's room.
+
+    Exceptions raised by the function are re-raised when their
+    result would have been returned. Call ``close()`` when done,
+    even after an exception, to stop the threads.
+    """
+
+    def __init__(self, function, max_workers=None, max_pending=None):
+        """Create the pipeline; threads are started as items arrive."""
+        if max_workers is None:
+            max_workers = default_max_workers()
+        self._function = function
+        self._max_workers = max(1, max_workers)
+        if max_pending is None:
+            max_pending = 2 * self._max_workers
+        self._max_pending = max(1, max_pending)
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._pending = collections.deque()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            (slot, item) = task
+            try:
+                slot['result'] = self._function(item)
+            except Exception:
+                slot['exc_info'] = sys.exc_info()
+            slot['done'].set()
+
+    def _collect(self, wait_for_all):
+        results = []
+        while len(self._pending) > 0:
+            slot = self._pending[0]
+            if not slot['done'].is_set() and not wait_for_all and len(self._pending) < self._max_pending:
+                break
+            slot['done'].wait()
+            if slot['exc_info'] is not None:
+                if len(results) > 0:
+                    # return the results before the failure first
+                    break
+                self._pending.popleft()
+                raise slot['exc_info'][1]
+            self._pending.popleft()
+            results.append(slot['result'])
+        return results
+
+    def put(self, item):
+        """Start processing an item.
+
+        Returns:
+            list of results that are now ready, in the order their items were put
+        """
+        slot = dict(done=threading.Event(), result=None, exc_info=None)
+        self._pending.append(slot)
+        if len(self._threads) < min(self._max_workers, len(self._pending)):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._tasks.put((slot, item))
+        return self._collect(wait_for_all=False)
+
+    def finish(self):
+        """Wait for all items to be processed.
+
+        Returns:
+            list of the remaining results, in order
+        """
+        return self._collect(wait_for_all=True)
+
+    def close(self):
+        """Stop the worker threads, once they finish what they're doing."""
+        for thread in self._threads:
+            self._tasks.put(None)
+        self._threads = []
+
+
+def parallel_imap(function, items, max_workers=None, max_pending=None):
+    """Call a function on each item using up to ``max_workers`` threads, generating results in order.
+
+    Results are generated as they become ready, and at most
+    ``max_pending`` items are processed ahead of the results
+    already generated. See ``OrderedPipeline``.
+    """
+    pipeline = OrderedPipeline(function, max_workers=max_workers, max_pending=max_pending)
+    try:
+        for item in items:
+            for result in pipeline.put(item):
+                yield result
+        for result in pipeline.finish():
+            yield result
+    finally:
+        pipeline.close()
+
+
+class ParallelBlockWriter(object):
+    """Base for writable file objects which transform fixed-size blocks on worker threads.
+
+    Written data is cut into ``block_size`` blocks. Each block is
+    turned into a task by ``_block_task()`` on the calling thread,
+    in order, and the task is passed to ``function`` on a worker
+    thread. The results are given to ``_write_result()`` in order.
+    Subclasses write any header in their constructor and any
+    trailer in ``_write_trailer()``.
+    """
+
+    def __init__(self, fileobj, function, block_size, max_workers=None):
+        """Start writing to fileobj, which is left open when we're closed."""
+        self._fileobj = fileobj
+        self._block_size = block_size
+        self._buffer = []
+        self._buffered = 0
+        self._closed = False
+        self._pipeline = OrderedPipeline(function, max_workers=max_workers)
+
+    def _block_task(self, data, last):
+        raise NotImplementedError()  # pragma: no cover
+
+    def _write_result(self, result):
+        self._fileobj.write(result)
+
+    def _write_trailer(self):
+        pass
+
+    def _write_results(self, results):
+        for result in results:
+            self._write_result(result)
+
+    def _submit(self, data, last):
+        self._write_results(self._pipeline.put(self._block_task(data, last)))
+
+    def write(self, data):
+        """Write some bytes."""
+        if self._closed:
+            raise ValueError("write to closed %s" % type(self).__name__)
+        if len(data) == 0:
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._block_size:
+            pending = b''.join(self._buffer)
+            start = 0
+            while len(pending) - start >= self._block_size:
+                self._submit(pending[start:start + self._block_size], last=False)
+                start += self._block_size
+            self._buffer = [pending[start:]]
+            self._buffered = len(pending) - start
+
+    def flush(self):
+        """Flush the underlying file; buffered data isn't written until close()."""
+        self._fileobj.flush()
+
+    def close(self):
+        """Write the remaining data and any trailer; doesn't close the underlying file."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._submit(b''.join(self._buffer), last=True)
+            self._write_results(self._pipeline.finish())
+        finally:
+            self._pipeline.close()
+        self._buffer = []
+        self._write_trailer()
+        self._fileobj.flush()
+
+    def __enter__(self):
+        """Allow use as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close if there was no exception, otherwise just stop the threads."""
+        if exc_type is None:
+            self.close()
+        else:
+            self._closed = True
+            self._pipeline.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Write gzip files using several threads, the way pigz does.
+
+The data is split into blocks which are deflated independently on
+worker threads (zlib releases the GIL while compressing). Each
+block but the last ends with a sync flush, so the blocks can simply
+be concatenated into one ordinary gzip member that any gzip reader
+understands. Each block is primed with the last 32K of the block
+before it, so the compression ratio is nearly as good as
+compressing the whole stream at once.
+"""
+from __future__ import absolute_import
+
+import struct
+import sys
+import time
+import zlib
+
+from anaconda_project.internal.parallel import ParallelBlockWriter
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# the deflate window, the most of the previous block that can help
+_DICTIONARY_SIZE = 32 * 1024
+
+# zlib on Python 2 can't be given a dictionary
+_HAS_ZDICT = sys.version_info >= (3, 3)
+
+
+def _deflate_block(task):
+    (level, data, dictionary, last) = task
+    if dictionary and _HAS_ZDICT:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if last:
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+    else:
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(ParallelBlockWriter):
+    """A writable file object which gzips what's written to another file object."""
+
+    def __init__(self, fileobj, compresslevel=9, max_workers=None, block_size=DEFAULT_BLOCK_SIZE, mtime=None):
+        """Start writing a gzip stream to fileobj.
+
+        Args:
+            fileobj (file): where the compressed data goes, left open when we're closed
+            compresslevel (int): zlib compression level
+            max_workers (int): most threads to compress with, None for a default
+            block_size (int): bytes of input per independently compressed block
+            mtime (int): modification time for the gzip header, None for now
+        """
+        super(ParallelGzipWriter, self).__init__(fileobj, _deflate_block, block_size, max_workers=max_workers)
+        self._level = compresslevel
+        self._dictionary = b''
+        self._crc = 0
+        self._size = 0
+        if mtime is None:
+            mtime = time.time()
+        # no file name, max compression flag, unknown OS
+        fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', int(mtime) & 0xffffffff) + b'\x02\xff')
+
+    def _block_task(self, data, last):
+        task = (self._level, data, self._dictionary, last)
+        self._dictionary = data[-_DICTIONARY_SIZE:]
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        return task
+
+    def _write_trailer(self):
+        self._fileobj.write(struct.pack('<II', self._crc & 0xffffffff, self._size & 0xffffffff))
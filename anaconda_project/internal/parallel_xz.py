@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Write xz files using several threads, the way ``xz -T`` does.
+
+Python's lzma module only compresses on one thread, but the xz
+format is made of independently compressed blocks. We compress
+each block as a complete xz stream on a worker thread (the lzma
+module releases the GIL while compressing), cut the block out of
+that stream, and write all of the blocks into one stream with a
+single index. The result is an ordinary xz file; in particular
+it's a single stream, which some readers (such as tarfile in
+stream mode) require.
+"""
+from __future__ import absolute_import
+
+import struct
+import zlib
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover (py2 only)
+    lzma = None
+
+from anaconda_project.internal.parallel import ParallelBlockWriter
+
+# xz uses three times the dictionary size of the default preset
+DEFAULT_BLOCK_SIZE = 24 * 1024 * 1024
+
+_HEADER_MAGIC = b'\xfd7zXZ\x00'
+_FOOTER_MAGIC = b'YZ'
+# no flags, CRC32 checks
+_STREAM_FLAGS = b'\x00\x01'
+# magic, flags, CRC32 of the flags
+_STREAM_HEADER_SIZE = 12
+_STREAM_FOOTER_SIZE = 12
+
+
+def available():
+    """True if this Python can write xz files."""
+    return lzma is not None
+
+
+def _encode_varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = bytearray(data[pos:pos + 1])[0]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return (value, pos)
+
+
+def _compress_block(task):
+    (preset, data) = task
+    stream = lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC32, preset=preset)
+    # the footer tells us how big the index is, and the index has
+    # the one record we need to put the block in our own index.
+    (backward_size, ) = struct.unpack('<I', stream[-8:-4])
+    index_start = len(stream) - _STREAM_FOOTER_SIZE - (backward_size + 1) * 4
+    (count, pos) = _decode_varint(stream, index_start + 1)
+    assert count == 1
+    (unpadded_size, pos) = _decode_varint(stream, pos)
+    (uncompressed_size, pos) = _decode_varint(stream, pos)
+    return (stream[_STREAM_HEADER_SIZE:index_start], unpadded_size, uncompressed_size)
+
+
+def _crc32(data):
+    return struct.pack('<I', zlib.crc32(data) & 0xffffffff)
+
+
+class ParallelXzWriter(ParallelBlockWriter):
+    """A writable file object which xz-compresses what's written to another file object."""
+
+    def __init__(self, fileobj, preset=6, max_workers=None, block_size=DEFAULT_BLOCK_SIZE):
+        """Start writing an xz stream to fileobj.
+
+        Args:
+            fileobj (file): where the compressed data goes, left open when we're closed
+            preset (int): xz compression preset from 0 to 9
+            max_workers (int): most threads to compress with, None for a default
+            block_size (int): bytes of input per independently compressed block
+        """
+        if lzma is None:  # pragma: no cover (py2 only)
+            raise RuntimeError("The lzma module is needed to write xz files")
+        super(ParallelXzWriter, self).__init__(fileobj, _compress_block, block_size, max_workers=max_workers)
+        self._preset = preset
+        self._records = []
+        fileobj.write(_HEADER_MAGIC + _STREAM_FLAGS + _crc32(_STREAM_FLAGS))
+
+    def _block_task(self, data, last):
+        return (self._preset, data)
+
+    def _write_result(self, result):
+        (block, unpadded_size, uncompressed_size) = result
+        self._fileobj.write(block)
+        self._records.append(_encode_varint(unpadded_size) + _encode_varint(uncompressed_size))
+
+    def _submit(self, data, last):
+        # an empty file is a stream with no blocks
+        if len(data) > 0:
+            super(ParallelXzWriter, self)._submit(data, last)
+
+    def _write_trailer(self):
+        index = b'\x00' + _encode_varint(len(self._records)) + b''.join(self._records)
+        index += b'\x00' * (-len(index) % 4)
+        index += _crc32(index)
+        backward_size = struct.pack('<I', len(index) // 4 - 1)
+        self._fileobj.write(index + _crc32(backward_size + _STREAM_FLAGS) + backward_size + _STREAM_FLAGS +
+                            _FOOTER_MAGIC)
@@ -6,13 +6,16 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function
 
+import codecs
 import collections
+import glob
 import subprocess
 import os
 import re
 import sys
 
 from anaconda_project.internal import logged_subprocess
+from anaconda_project.internal.scandir import scandir
 
 
 class PipError(Exception):
@@ -81,11 +84,100 @@ def remove(prefix, pkgs=None):
     return _call_pip(prefix, extra_args=args)
 
 
+def _read_metadata_name_and_version(filename):
+    # METADATA and PKG-INFO are RFC 822 style; the headers we
+    # want are before the first blank line, and the description
+    # after it can be long, so we stop reading there.
+    name = None
+    version = None
+    try:
+        with codecs.open(filename, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line == '':
+                    break
+                if line.startswith("Name:"):
+                    name = line[5:].strip()
+                elif line.startswith("Version:"):
+                    version = line[8:].strip()
+    except (IOError, OSError):
+        return None
+    if not name or not version:
+        return None
+    return (name, version)
+
+
+def _site_packages_directory(prefix):
+    # Linux/Mac
+    dirs = glob.glob(os.path.join(prefix, "lib", "python*", "site-packages"))
+    # Windows
+    windows_dir = os.path.join(prefix, "Lib", "site-packages")
+    if os.path.isdir(windows_dir):
+        dirs.append(windows_dir)
+    if len(dirs) == 1:
+        return dirs[0]
+    else:
+        # none, or several python versions in one prefix; let pip sort it out
+        return None
+
+
+def _scan_installed(prefix):
+    """Find installed packages by reading metadata in site-packages.
+
+    Returns:
+        dict like ``installed()``, or None if the layout of
+        site-packages is something we don't understand
+    """
+    site_packages = _site_packages_directory(prefix)
+    if site_packages is None:
+        return None
+
+    result = dict()
+    try:
+        for entry in scandir(site_packages):
+            if entry.name.endswith(".dist-info"):
+                metadata = os.path.join(entry.path, "METADATA")
+            elif entry.name.endswith(".egg-info"):
+                if entry.is_dir():
+                    metadata = os.path.join(entry.path, "PKG-INFO")
+                else:
+                    metadata = entry.path
+            elif entry.name.endswith((".egg-link", ".egg")) or entry.name == "easy-install.pth":
+                # develop installs and eggs put packages outside of
+                # site-packages, only pip knows how to find them
+                return None
+            else:
+                continue
+            name_and_version = _read_metadata_name_and_version(metadata)
+            if name_and_version is None:
+                return None
+            result[name_and_version[0]] = name_and_version
+    except OSError:
+        return None
+    return result
+
+
 def installed(prefix):
     """Get a dict of package names to (name, version) tuples."""
     if not os.path.isdir(prefix):
         return dict()
 
+    # Reading the metadata ourselves avoids starting up pip twice,
+    # which is by far the slowest part of checking pip packages.
+    # If pip isn't installed, we leave it to the "pip list"
+    # codepath, which considers there to be no pip packages.
+    try:
+        _get_pip_command(prefix, [])
+        scanned = _scan_installed(prefix)
+        if scanned is not None:
+            return scanned
+    except PipNotInstalledError:
+        pass
+
+    return _list_installed_with_pip(prefix)
+
+
+def _list_installed_with_pip(prefix):
     # In pip 9, there's a big ugly deprecation warning by default if
     # you type `pip list`, unless you do `pip list --format=legacy`
     # pip 8 of course does not support --format=legacy, so that
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""On-disk cache of successful prepare results, keyed by a fingerprint of the inputs."""
+from __future__ import absolute_import, print_function
+
+import codecs
+import hashlib
+import json
+import os
+import uuid
+
+from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.rename import rename_over_existing
+
+# bump this if the format of the cache entries changes
+_CACHE_FORMAT = 1
+
+# we keep a handful of entries so that alternating between a few
+# commands or env specs doesn't thrash the cache
+_MAX_ENTRIES = 16
+
+
+def cache_filename(project_dir):
+    """Get the filename of the prepare cache for a project.
+
+    The cache lives in ``envs/`` so that it's ignored when
+    archiving and removed by ``anaconda-project clean``.
+    """
+    return os.path.join(project_dir, "envs", ".prepare-cache.json")
+
+
+def file_digest(filename):
+    """Get a sha1 hex digest of a file's contents, or None if it can't be read."""
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def fingerprint(parts):
+    """Compute a cache key from a JSON-serializable value describing all prepare inputs."""
+    serialized = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def path_stamps(paths):
+    """Get a dict from path to mtime, or None if any path doesn't exist."""
+    stamps = dict()
+    for path in paths:
+        try:
+            stamps[path] = os.path.getmtime(path)
+        except OSError:
+            return None
+    return stamps
+
+
+def _load_entries(project_dir):
+    try:
+        with codecs.open(cache_filename(project_dir), 'r', 'utf-8') as f:
+            loaded = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if not isinstance(loaded, dict) or loaded.get('format') != _CACHE_FORMAT:
+        return dict()
+    entries = loaded.get('entries')
+    if not isinstance(entries, dict):
+        return dict()
+    return entries
+
+
+def load(project_dir, key):
+    """Get the cached entry for the key, or None if missing or stale.
+
+    An entry is stale if any of the paths it was stamped with has
+    been modified or removed since it was saved.
+    """
+    entry = _load_entries(project_dir).get(key)
+    if not isinstance(entry, dict):
+        return None
+    stamps = entry.get('stamps', dict())
+    if path_stamps(stamps.keys()) != stamps:
+        return None
+    return entry
+
+
+def save(project_dir, key, entry):
+    """Save an entry under the key, dropping the oldest entries if we have too many.
+
+    Errors are ignored, because the cache is only an optimization.
+    """
+    entries = _load_entries(project_dir)
+    entries.pop(key, None)
+    while len(entries) >= _MAX_ENTRIES:
+        oldest = min(entries.keys(), key=lambda k: entries[k].get('saved_order', 0))
+        del entries[oldest]
+    saved_order = 1 + max([e.get('saved_order', 0) for e in entries.values()] + [0])
+    entry = dict(entry, saved_order=saved_order)
+    entries[key] = entry
+
+    filename = cache_filename(project_dir)
+    tmp = filename + ".tmp-" + str(uuid.uuid4())
+    try:
+        makedirs_ok_if_exists(os.path.dirname(filename))
+        with codecs.open(tmp, 'w', 'utf-8') as f:
+            f.write(json.dumps(dict(format=_CACHE_FORMAT, entries=entries), sort_keys=True))
+        rename_over_existing(tmp, filename)
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            os.remove(tmp)
+        except (IOError, OSError):
+            pass
+
+
+def invalidate(project_dir):
+    """Remove all cached prepare results for the project."""
+    try:
+        os.remove(cache_filename(project_dir))
+    except (IOError, OSError):
+        pass
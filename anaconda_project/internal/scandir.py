@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Compatibility wrapper for ``os.scandir``, which is missing on Python 2."""
+from __future__ import absolute_import
+
+import os
+import stat
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover (py2 only)
+
+    class _DirEntry(object):
+        def __init__(self, dirname, name):
+            self.name = name
+            self.path = os.path.join(dirname, name)
+            self._stat = None
+            self._lstat = None
+
+        def stat(self, follow_symlinks=True):
+            if follow_symlinks:
+                if self._stat is None:
+                    self._stat = os.stat(self.path)
+                return self._stat
+            else:
+                if self._lstat is None:
+                    self._lstat = os.lstat(self.path)
+                return self._lstat
+
+        def is_dir(self, follow_symlinks=True):
+            try:
+                return stat.S_ISDIR(self.stat(follow_symlinks=follow_symlinks).st_mode)
+            except OSError:
+                return False
+
+        def is_file(self, follow_symlinks=True):
+            try:
+                return stat.S_ISREG(self.stat(follow_symlinks=follow_symlinks).st_mode)
+            except OSError:
+                return False
+
+        def is_symlink(self):
+            try:
+                return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+            except OSError:
+                return False
+
+    def scandir(path):
+        """Iterate over entries in a directory, like Python 3's ``os.scandir``."""
+        return iter([_DirEntry(path, name) for name in os.listdir(path)])
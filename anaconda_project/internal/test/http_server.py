@@ -20,30 +20,77 @@ class _DownloadView(RequestHandler):
         # Note: application is stored as self.application
         super(_DownloadView, self).__init__(application, *args, **kwargs)
 
+    def head(self, *args, **kwargs):
+        length = int(self.get_argument("length"))
+        self.set_header('ETag', '"%s"' % self.get_argument("id"))
+        if self.get_argument("accept_ranges", None) == "1":
+            self.set_header('Accept-Ranges', 'bytes')
+        self.set_status(200)
+        self.set_header('Content-Length', str(length))
+        self.finish()
+
     @gen.coroutine
     def get(self, *args, **kwargs):
         download_id = self.get_argument("id")
         hash_algorithm = self.get_argument("hash_algorithm", None)
         length = int(self.get_argument("length"))
 
-        print("Planning to send %d bytes" % length)
+        etag = '"%s"' % download_id
+        if self.request.headers.get('If-None-Match', None) == etag:
+            self.set_status(304)
+            self.finish()
+            return
+        self.set_header('ETag', etag)
+
+        accept_ranges = self.get_argument("accept_ranges", None) == "1"
+        range_header = None
+        start = 0
+        stop = length
+        if accept_ranges:
+            self.set_header('Accept-Ranges', 'bytes')
+            range_header = self.request.headers.get('Range', None)
+            if_range = self.request.headers.get('If-Range', None)
+            if range_header is not None:
+                self.application.ranges_requested.append(range_header)
+                self.application.if_ranges_requested.append(if_range)
+            if if_range is not None and if_range != etag:
+                # the client's copy is of another version, so it gets all of this one
+                range_header = None
+            if range_header is not None:
+                (first, last) = range_header[len("bytes="):].split("-")
+                start = int(first)
+                if last != '':
+                    stop = min(length, int(last) + 1)
+                if start >= length:
+                    self.set_status(416)
+                    self.set_header('Content-Range', 'bytes */%d' % length)
+                    self.finish()
+                    return
+
+        print("Planning to send %d bytes" % (stop - start))
         if hash_algorithm:
             hasher = getattr(hashlib, hash_algorithm)()
 
-        self.set_status(200)
-        self.set_header('Content-Length', str(length))
+        if range_header is not None:
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %d-%d/%d' % (start, stop - 1, length))
+        else:
+            self.set_status(200)
+        self.set_header('Content-Length', str(stop - start))
         data = ("abcdefghijklmnop" * 20).encode("utf-8")
-        remaining = length
-        while remaining > 0:
-            to_write = data[:remaining]
+        sent = 0
+        while sent < length:
+            to_write = data[:length - sent]
+            # the hash is of the whole file, even if we only send part of it
             if hash_algorithm:
                 hasher.update(to_write)
-            remaining = remaining - len(to_write)
-            self.write(to_write)
-            try:
-                yield self.flush()
-            except Exception as e:
-                raise e
+            if sent < stop and sent + len(to_write) > start:
+                self.write(to_write[max(0, start - sent):stop - sent])
+                try:
+                    yield self.flush()
+                except Exception as e:
+                    raise e
+            sent = sent + len(to_write)
 
         if hash_algorithm:
             self.application.hashes[download_id] = hasher.hexdigest()
@@ -64,6 +111,8 @@ class _ErrorView(RequestHandler):
 class _TestServerApplication(Application):
     def __init__(self, **kwargs):
         self.hashes = dict()
+        self.ranges_requested = []
+        self.if_ranges_requested = []
         patterns = [(r'/download', _DownloadView), (r'/error', _ErrorView)]
         super(_TestServerApplication, self).__init__(patterns, **kwargs)
 
@@ -104,12 +153,27 @@ class _TestServer(object):
     def error_url(self):
         return self.url + "error"
 
-    def new_download_url(self, download_length, hash_algorithm):
+    def new_download_url(self, download_length, hash_algorithm, accept_ranges=False):
         url = (self.url + "download?id=" + str(uuid.uuid4()) + "&length=" + str(download_length))
         if hash_algorithm:
             url += "&hash_algorithm=" + hash_algorithm
+        if accept_ranges:
+            url += "&accept_ranges=1"
         return url
 
+    @property
+    def ranges_requested(self):
+        return self._application.ranges_requested
+
+    @property
+    def if_ranges_requested(self):
+        return self._application.if_ranges_requested
+
+    @staticmethod
+    def download_content(download_length):
+        data = ("abcdefghijklmnop" * 20).encode("utf-8")
+        return (data * (download_length // len(data) + 1))[:download_length]
+
     def server_computed_hash_for_downloaded_url(self, download_url):
         i = download_url.index("id=")
         download_id = download_url[(i + 3):][:36]
@@ -6,9 +6,12 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function
 
+import glob
+import json
 import os
 import platform
 import pytest
+import sys
 
 import anaconda_project.internal.conda_api as conda_api
 
@@ -154,11 +157,17 @@ def test_conda_remove_no_packages(monkeypatch):
     with_directory_contents(dict(), do_test)
 
 
+def _monkeypatch_info_cache_dir(monkeypatch, dirname):
+    monkeypatch.setenv('ANACONDA_PROJECT_CACHE_DIR', os.path.join(dirname, "cache"))
+    conda_api.invalidate_info_cache()
+
+
 def test_conda_invoke_fails(monkeypatch):
     def mock_popen(args, stdout=None, stderr=None):
         raise OSError("failed to exec")
 
     def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
         monkeypatch.setattr('subprocess.Popen', mock_popen)
         with pytest.raises(conda_api.CondaError) as excinfo:
             conda_api.info()
@@ -177,6 +186,7 @@ sys.exit(1)
 """)
 
     def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
         monkeypatch.setattr('anaconda_project.internal.conda_api._get_conda_command', get_failed_command)
         with pytest.raises(conda_api.CondaError) as excinfo:
             conda_api.info()
@@ -195,6 +205,7 @@ sys.exit(0)
 """)
 
     def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
         monkeypatch.setattr('anaconda_project.internal.conda_api._get_conda_command', get_command)
         conda_api.info()
         (out, err) = capsys.readouterr()
@@ -212,6 +223,7 @@ sys.exit(0)
 """)
 
     def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
         monkeypatch.setattr('anaconda_project.internal.conda_api._get_conda_command', get_command)
         with pytest.raises(conda_api.CondaError) as excinfo:
             conda_api.info()
@@ -220,6 +232,136 @@ sys.exit(0)
     with_directory_contents(dict(), do_test)
 
 
+def _monkeypatch_counted_conda_info(monkeypatch, executable, results):
+    calls = []
+
+    def mock_get_conda_command(extra_args):
+        return [executable] + extra_args
+
+    def mock_call_conda(extra_args):
+        assert ['info', '--json'] == extra_args
+        calls.append(extra_args)
+        return json.dumps(results[0]).encode('utf-8')
+
+    monkeypatch.setattr('anaconda_project.internal.conda_api._get_conda_command', mock_get_conda_command)
+    monkeypatch.setattr('anaconda_project.internal.conda_api._call_conda', mock_call_conda)
+    return calls
+
+
+def test_info_is_cached(monkeypatch):
+    def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
+        results = [dict(root_prefix='/foo', envs=[])]
+        calls = _monkeypatch_counted_conda_info(monkeypatch, sys.executable, results)
+
+        assert dict(root_prefix='/foo', envs=[]) == conda_api.info()
+        assert 1 == len(calls)
+        # callers can't mess up the cached value
+        conda_api.info()['envs'].append('/bar')
+        assert dict(root_prefix='/foo', envs=[]) == conda_api.info()
+        assert 1 == len(calls)
+
+        # a new process would load it from disk
+        conda_api._info_cache.clear()
+        assert dict(root_prefix='/foo', envs=[]) == conda_api.info()
+        assert 1 == len(calls)
+        assert 1 == len(glob.glob(os.path.join(dirname, "cache", "conda-info-*.json")))
+
+        # changing conda variables gives a different key
+        monkeypatch.setenv('CONDA_TEST_SOMETHING', 'blah')
+        assert dict(root_prefix='/foo', envs=[]) == conda_api.info()
+        assert 2 == len(calls)
+
+        # we can invalidate explicitly
+        results[0] = dict(root_prefix='/foo', envs=['/foo/envs/bar'])
+        conda_api.invalidate_info_cache()
+        assert [] == glob.glob(os.path.join(dirname, "cache", "conda-info-*.json"))
+        assert dict(root_prefix='/foo', envs=['/foo/envs/bar']) == conda_api.info()
+        assert 3 == len(calls)
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_info_not_cached_without_executable(monkeypatch):
+    def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
+        calls = _monkeypatch_counted_conda_info(monkeypatch, "this-conda-does-not-exist", [dict()])
+        conda_api.info()
+        conda_api.info()
+        assert 2 == len(calls)
+        assert not os.path.exists(os.path.join(dirname, "cache"))
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_info_cache_keeps_newest_files(monkeypatch):
+    monkeypatch.setattr('anaconda_project.internal.conda_api._MAX_INFO_CACHE_FILES', 2)
+
+    def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
+        _monkeypatch_counted_conda_info(monkeypatch, sys.executable, [dict()])
+        for i in range(0, 4):
+            monkeypatch.setenv('CONDA_TEST_SOMETHING', str(i))
+            conda_api.info()
+        assert 2 == len(glob.glob(os.path.join(dirname, "cache", "conda-info-*.json")))
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_resolve_env_refreshes_stale_info(monkeypatch):
+    def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
+        envdir = os.path.join(dirname, "envs", "bar")
+        results = [dict(root_prefix=dirname, envs=[])]
+        calls = _monkeypatch_counted_conda_info(monkeypatch, sys.executable, results)
+        assert conda_api.resolve_env_to_prefix('bar') is None
+        assert 2 == len(calls)
+
+        # the env gets created by someone else
+        os.makedirs(envdir)
+        results[0] = dict(root_prefix=dirname, envs=[envdir])
+        assert envdir == conda_api.resolve_env_to_prefix('bar')
+        assert 3 == len(calls)
+        assert envdir == conda_api.resolve_env_to_prefix('bar')
+        assert 3 == len(calls)
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_resolve_env_miss_keeps_other_cached_info(monkeypatch):
+    def do_test(dirname):
+        _monkeypatch_info_cache_dir(monkeypatch, dirname)
+        results = [dict(root_prefix=dirname, envs=[])]
+        calls = _monkeypatch_counted_conda_info(monkeypatch, sys.executable, results)
+
+        # info for some other conda configuration
+        monkeypatch.setenv('CONDA_TEST_SOMETHING', 'other')
+        conda_api.info()
+        [other] = glob.glob(os.path.join(dirname, "cache", "conda-info-*.json"))
+        monkeypatch.delenv('CONDA_TEST_SOMETHING')
+        conda_api.info()
+        assert 2 == len(calls)
+
+        assert conda_api.resolve_env_to_prefix('nope') is None
+        assert 3 == len(calls)
+        assert os.path.isfile(other)
+        assert 2 == len(glob.glob(os.path.join(dirname, "cache", "conda-info-*.json")))
+
+        # the refreshed info is what's cached for the current key
+        results[0] = dict(root_prefix=dirname, envs=['/whatever'])
+        conda_api.info(refresh=True)
+        conda_api._info_cache.clear()
+        assert dict(root_prefix=dirname, envs=['/whatever']) == conda_api.info()
+        assert 4 == len(calls)
+
+        # and the other key still uses its cached info
+        monkeypatch.setenv('CONDA_TEST_SOMETHING', 'other')
+        assert dict(root_prefix=dirname, envs=[]) == conda_api.info()
+        assert 4 == len(calls)
+
+    with_directory_contents(dict(), do_test)
+
+
 def test_conda_create_gets_channels(monkeypatch):
     def mock_call_conda(extra_args):
         assert ['create', '--yes', '--quiet', '--prefix', '/prefix', '--channel', 'foo', 'python'] == extra_args
@@ -228,6 +370,23 @@ def test_conda_create_gets_channels(monkeypatch):
     conda_api.create(prefix='/prefix', pkgs=['python'], channels=['foo'])
 
 
+def test_conda_clone(monkeypatch):
+    def mock_call_conda(extra_args):
+        assert ['create', '--yes', '--quiet', '--prefix', '/prefix', '--clone', '/parent'] == extra_args
+
+    monkeypatch.setattr('anaconda_project.internal.conda_api._call_conda', mock_call_conda)
+    conda_api.clone(prefix='/prefix', source_prefix='/parent')
+
+
+def test_conda_clone_existing_prefix():
+    def do_test(dirname):
+        with pytest.raises(conda_api.CondaEnvExistsError) as excinfo:
+            conda_api.clone(prefix=dirname, source_prefix='/parent')
+        assert 'already exists' in repr(excinfo.value)
+
+    with_directory_contents(dict(), do_test)
+
+
 def test_conda_install_gets_channels(monkeypatch):
     def mock_call_conda(extra_args):
         assert ['install', '--yes', '--quiet', '--prefix', '/prefix', '--channel', 'foo', 'python'] == extra_args
@@ -243,7 +402,7 @@ def test_resolve_root_prefix():
 
 
 def test_resolve_named_env(monkeypatch):
-    def mock_info():
+    def mock_info(refresh=False):
         return {'root_prefix': '/foo', 'envs': ['/foo/envs/bar']}
 
     monkeypatch.setattr('anaconda_project.internal.conda_api.info', mock_info)
@@ -252,7 +411,7 @@ def test_resolve_named_env(monkeypatch):
 
 
 def test_resolve_bogus_env(monkeypatch):
-    def mock_info():
+    def mock_info(refresh=False):
         return {'root_prefix': '/foo', 'envs': ['/foo/envs/bar']}
 
     monkeypatch.setattr('anaconda_project.internal.conda_api.info', mock_info)
@@ -566,6 +725,44 @@ def test_pip_style_specs():
         assert conda_api.parse_spec(case[0]) == case[1]
 
 
+def test_installed_version_matches():
+    cases = [('foo', '1.0', 'py35_0', True),
+             ('foo=1.0', '1.0', 'py35_0', True),
+             ('foo=1.0', '1.0.3', 'py35_0', True),
+             ('foo=1.0', '1.0rc1', 'py35_0', True),
+             ('foo=1.0', '1.01', 'py35_0', False),
+             ('foo=1.0', '1.1', 'py35_0', False),
+             ('foo=1.0*', '1.01', 'py35_0', True),
+             ('foo=1.0|1.2', '1.2.1', 'py35_0', True),
+             ('foo=1.0|1.2', '1.1', 'py35_0', False),
+             ('foo=1.0=py35_0', '1.0', 'py35_0', True),
+             ('foo=1.0=py35_0', '1.0', 'py27_0', False),
+             ('foo=1.0=py35_0', '1.0.1', 'py35_0', False),
+             ('foo=1.0=py35*', '1.0', 'py35_1', True),
+             ('foo >=1.0', '1.0', 'py35_0', True),
+             ('foo >=1.0', '1.10', 'py35_0', True),
+             ('foo >=1.9', '1.10', 'py35_0', True),
+             ('foo >=1.0', '0.9', 'py35_0', False),
+             ('foo >=1.0', '1.0rc1', 'py35_0', False),
+             ('foo >=1.0', '1.0.post1', 'py35_0', True),
+             ('foo >=1.0', '1.0.dev1', 'py35_0', False),
+             ('foo >1.0', '1.0', 'py35_0', False),
+             ('foo >1.0', '1.0.1', 'py35_0', True),
+             ('foo <2.0', '1.9', 'py35_0', True),
+             ('foo <=2.0', '2.0.0', 'py35_0', True),
+             ('foo != 1.0', '1.0', 'py35_0', False),
+             ('foo != 1.0', '1.1', 'py35_0', True),
+             ('foo >=1.0 , < 2.0', '1.5', 'py35_0', True),
+             ('foo >=1.0 , < 2.0', '2.0', 'py35_0', False),
+             ('foo ==1.0', '1.0.0', 'py35_0', True),
+             ('foo ==1.0', '1!1.0', 'py35_0', False),
+             ('foo >=1.0', '1.0+local', 'py35_0', True)]
+    for (spec, version, build, expected) in cases:
+        parsed = conda_api.parse_spec(spec)
+        assert (spec, version, build, expected) == (spec, version, build,
+                                                    conda_api.installed_version_matches(parsed, version, build))
+
+
 def test_conda_variable_when_not_in_conda(monkeypatch):
     monkeypatch.setattr('os.environ', dict())
     assert conda_api.conda_prefix_variable() == 'CONDA_PREFIX'
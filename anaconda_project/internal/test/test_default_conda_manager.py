@@ -11,7 +11,7 @@ import json
 import os
 import platform
 import pytest
-import time
+import shutil
 
 from anaconda_project.env_spec import EnvSpec
 from anaconda_project.conda_manager import CondaManagerError
@@ -125,6 +125,8 @@ def test_conda_create_and_install_and_remove(monkeypatch):
             raise pip_api.PipError("pip fail")
 
         monkeypatch.setattr('anaconda_project.internal.pip_api._call_pip', mock_call_pip)
+        # make us fall back to running pip
+        monkeypatch.setattr('anaconda_project.internal.pip_api._scan_installed', lambda prefix: None)
 
         with pytest.raises(CondaManagerError) as excinfo:
             deviations = manager.find_environment_deviations(envdir, spec)
@@ -144,20 +146,13 @@ def test_timestamp_file_works(monkeypatch):
         manager = DefaultCondaManager()
 
         def print_timestamps(when):
-            newest_in_prefix = 0
-            for d in manager._timestamp_comparison_directories(envdir):
-                try:
-                    t = os.path.getmtime(d)
-                    if t > newest_in_prefix:
-                        newest_in_prefix = t
-                except Exception:
-                    pass
             timestamp_file = 0
             try:
                 timestamp_file = os.path.getmtime(manager._timestamp_file(envdir, spec))
             except Exception:
                 pass
-            print("%s: timestamp file %d prefix %d" % (when, timestamp_file, newest_in_prefix))
+            print("%s: timestamp file %d manifest %r" % (when, timestamp_file,
+                                                         manager._environment_manifest(envdir, spec)))
 
         print_timestamps("before env creation")
 
@@ -209,16 +204,21 @@ def test_timestamp_file_works(monkeypatch):
 
         assert manager._timestamp_file_up_to_date(envdir, spec)
 
-        # now modify conda-meta and check that we DO call the package managers
-        time.sleep(1.1)  # be sure we are in a new second
+        # adding and then removing a file that isn't a package
+        # record doesn't matter
         conda_meta_dir = os.path.join(envdir, "conda-meta")
-        print("conda-meta original timestamp: %d" % os.path.getmtime(conda_meta_dir))
         inside_conda_meta = os.path.join(conda_meta_dir, "thing.txt")
         with codecs.open(inside_conda_meta, 'w', encoding='utf-8') as f:
-            f.write(u"This file should change the mtime on conda-meta\n")
-        print("file inside conda-meta %d and conda-meta itself %d" % (os.path.getmtime(inside_conda_meta),
-                                                                      os.path.getmtime(conda_meta_dir)))
+            f.write(u"This file should not affect the manifest\n")
+        assert manager._timestamp_file_up_to_date(envdir, spec)
         os.remove(inside_conda_meta)
+        assert manager._timestamp_file_up_to_date(envdir, spec)
+
+        # now modify a package record and check that we DO call the package managers
+        record = [name for name in os.listdir(conda_meta_dir) if name.startswith("ipython-")][0]
+        record_path = os.path.join(conda_meta_dir, record)
+        record_mtime = os.path.getmtime(record_path)
+        os.utime(record_path, (record_mtime + 10, record_mtime + 10))
 
         print_timestamps("after touching conda-meta")
 
@@ -255,6 +255,7 @@ def test_timestamp_file_ignores_failed_write(monkeypatch):
         from codecs import open as real_open
 
         envdir = os.path.join(dirname, spec.name)
+        assert os.path.isdir(os.path.join(envdir, "conda-meta"))
 
         manager = DefaultCondaManager()
 
@@ -284,6 +285,251 @@ def test_timestamp_file_ignores_failed_write(monkeypatch):
         # check on the file contents
         with real_open(filename, 'r', encoding='utf-8') as f:
             content = json.loads(f.read())
-            assert dict(anaconda_project_version=version) == content
+            assert dict(anaconda_project_version=version,
+                        manifest=manager._environment_manifest(envdir, spec)) == content
+            assert [] == content['manifest']['conda_meta']
+
+    with_directory_contents({"myenv/conda-meta": None}, do_test)
+
+
+def test_timestamp_file_manifest():
+    spec = EnvSpec(name='myenv', conda_packages=['ipython'], pip_packages=[], channels=[])
+    spec_with_pip = EnvSpec(name='myenv', conda_packages=['ipython'], pip_packages=['flake8'], channels=[])
+
+    def do_test(dirname):
+        envdir = os.path.join(dirname, "myenv")
+        conda_meta = os.path.join(envdir, "conda-meta")
+        site_packages = os.path.join(envdir, "lib", "python3.5", "site-packages")
+        manager = DefaultCondaManager()
+
+        # no timestamp file yet
+        assert not manager._timestamp_file_up_to_date(envdir, spec)
+
+        manager._write_timestamp_file(envdir, spec)
+        assert manager._timestamp_file_up_to_date(envdir, spec)
+        assert not manager._timestamp_file_up_to_date(envdir, spec_with_pip)
+        assert ['ipython-5.1.0-py35_0'] == manager._environment_manifest(envdir, spec)['conda_meta']
+        assert 'pip' not in manager._environment_manifest(envdir, spec)
+
+        # installing a package is noticed
+        with codecs.open(os.path.join(conda_meta, "flake8-3.0.4-py35_0.json"), 'w', 'utf-8') as f:
+            f.write("{}")
+        assert not manager._timestamp_file_up_to_date(envdir, spec)
+
+        # removing it again puts us back where we were
+        os.remove(os.path.join(conda_meta, "flake8-3.0.4-py35_0.json"))
+        assert manager._timestamp_file_up_to_date(envdir, spec)
+
+        # replacing a package record is noticed
+        record = os.path.join(conda_meta, "ipython-5.1.0-py35_0.json")
+        with codecs.open(record, 'w', 'utf-8') as f:
+            f.write('{"name": "ipython", "version": "5.1.0", "build": "py35_0"}')
+        assert not manager._timestamp_file_up_to_date(envdir, spec)
+        manager._write_timestamp_file(envdir, spec)
+        assert manager._timestamp_file_up_to_date(envdir, spec)
+
+        # pip packages are only considered if the spec has any
+        manager._write_timestamp_file(envdir, spec_with_pip)
+        assert manager._timestamp_file_up_to_date(envdir, spec_with_pip)
+        assert ['foo-1.0.dist-info'] == manager._environment_manifest(envdir, spec_with_pip)['pip']
+        os.makedirs(os.path.join(site_packages, "flake8-3.0.4.dist-info"))
+        assert not manager._timestamp_file_up_to_date(envdir, spec_with_pip)
+        assert manager._timestamp_file_up_to_date(envdir, spec)
+
+        # an old-style timestamp file without a manifest is never up to date
+        with codecs.open(manager._timestamp_file(envdir, spec), 'w', 'utf-8') as f:
+            f.write(json.dumps(dict(anaconda_project_version=version)))
+        assert not manager._timestamp_file_up_to_date(envdir, spec)
+
+        # garbage in the timestamp file
+        with codecs.open(manager._timestamp_file(envdir, spec), 'w', 'utf-8') as f:
+            f.write("not json")
+        assert not manager._timestamp_file_up_to_date(envdir, spec)
+
+    with_directory_contents({"myenv/conda-meta/ipython-5.1.0-py35_0.json": "{}",
+                             "myenv/conda-meta/history": "",
+                             "myenv/lib/python3.5/site-packages/foo-1.0.dist-info/METADATA": "",
+                             "myenv/lib/python3.5/site-packages/foo.py": ""}, do_test)
+
+
+def test_timestamp_file_no_conda_meta():
+    def do_test(dirname):
+        envdir = os.path.join(dirname, "myenv")
+        manager = DefaultCondaManager()
+        assert manager._environment_manifest(envdir, test_spec) is None
+        manager._write_timestamp_file(envdir, test_spec)
+        assert not os.path.exists(manager._timestamp_file(envdir, test_spec))
+        assert not manager._timestamp_file_up_to_date(envdir, test_spec)
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_find_and_fix_wrong_version_packages(monkeypatch):
+    spec = EnvSpec(name='myenv',
+                   conda_packages=['ipython=5.1', 'numpy >=1.11', 'bokeh=0.12.3=py35_0', 'pandas'],
+                   pip_packages=[],
+                   channels=['foo'])
+
+    def do_test(dirname):
+        envdir = os.path.join(dirname, "myenv")
+        manager = DefaultCondaManager()
+
+        deviations = manager.find_environment_deviations(envdir, spec)
+        assert deviations.missing_packages == ('pandas', )
+        assert deviations.wrong_version_packages == ('bokeh', 'numpy')
+        assert deviations.summary == "Conda environment is missing packages: pandas"
+        assert not deviations.ok
+
+        installs = []
+
+        def mock_install(prefix, pkgs=None, channels=()):
+            installs.append((prefix, list(pkgs), list(channels)))
+
+        monkeypatch.setattr('anaconda_project.internal.conda_api.install', mock_install)
+        manager.fix_environment_deviations(envdir, spec, deviations)
+        # only the packages that need work are passed to conda
+        assert [(envdir, ['pandas', 'bokeh=0.12.3=py35_0', 'numpy >=1.11'], ['foo'])] == installs
+
+    with_directory_contents({"myenv/conda-meta/ipython-5.1.0-py35_0.json": "{}",
+                             "myenv/conda-meta/numpy-1.10.4-py35_0.json": "{}",
+                             "myenv/conda-meta/bokeh-0.12.3-py27_0.json": "{}"}, do_test)
+
+
+def test_find_wrong_version_packages_only(monkeypatch):
+    spec = EnvSpec(name='myenv', conda_packages=['ipython=5.1'], pip_packages=[], channels=[])
+
+    def do_test(dirname):
+        envdir = os.path.join(dirname, "myenv")
+        manager = DefaultCondaManager()
+
+        deviations = manager.find_environment_deviations(envdir, spec)
+        assert deviations.missing_packages == ()
+        assert deviations.wrong_version_packages == ('ipython', )
+        assert deviations.summary == "Conda environment has wrong versions of packages: ipython"
+
+        def mock_install(prefix, pkgs=None, channels=()):
+            from anaconda_project.internal.conda_api import CondaError
+            raise CondaError("it broke")
+
+        monkeypatch.setattr('anaconda_project.internal.conda_api.install', mock_install)
+        with pytest.raises(CondaManagerError) as excinfo:
+            manager.fix_environment_deviations(envdir, spec, deviations)
+        assert 'Failed to install missing or wrong-version packages: ipython: it broke' == str(excinfo.value)
+
+    with_directory_contents({"myenv/conda-meta/ipython-4.2.0-py35_0.json": "{}"}, do_test)
+
+
+def _inheriting_specs():
+    base = EnvSpec(name='base', conda_packages=['ipython'], pip_packages=[], channels=[])
+    child = EnvSpec(name='child',
+                    conda_packages=['numpy'],
+                    pip_packages=[],
+                    channels=[],
+                    inherit_from_names=('base', ),
+                    inherit_from=(base, ))
+    grandchild = EnvSpec(name='grandchild',
+                         conda_packages=['pandas'],
+                         pip_packages=[],
+                         channels=[],
+                         inherit_from_names=('child', ),
+                         inherit_from=(child, ))
+    return (base, child, grandchild)
+
+
+def _monkeypatch_fake_conda(monkeypatch, calls):
+    def mock_clone(prefix, source_prefix):
+        calls.append(('clone', os.path.basename(prefix), os.path.basename(source_prefix)))
+        shutil.copytree(source_prefix, prefix)
+
+    def mock_create(prefix, pkgs=None, channels=()):
+        calls.append(('create', os.path.basename(prefix), sorted(pkgs)))
+        os.makedirs(os.path.join(prefix, "conda-meta"))
+        mock_install(prefix, pkgs, channels, record=False)
+
+    def mock_install(prefix, pkgs=None, channels=(), record=True):
+        if record:
+            calls.append(('install', os.path.basename(prefix), sorted(pkgs)))
+        for pkg in pkgs:
+            with codecs.open(os.path.join(prefix, "conda-meta", "%s-1.0-py35_0.json" % pkg), 'w', 'utf-8') as f:
+                f.write("{}")
+
+    monkeypatch.setattr('anaconda_project.internal.conda_api.clone', mock_clone)
+    monkeypatch.setattr('anaconda_project.internal.conda_api.create', mock_create)
+    monkeypatch.setattr('anaconda_project.internal.conda_api.install', mock_install)
+
+
+def test_create_child_env_by_cloning_parent(monkeypatch):
+    (base, child, grandchild) = _inheriting_specs()
+
+    def do_test(dirname):
+        envs = os.path.join(dirname, "envs")
+        calls = []
+        _monkeypatch_fake_conda(monkeypatch, calls)
+        manager = DefaultCondaManager()
+
+        # the parent isn't there yet, so we create the child from scratch
+        manager.fix_environment_deviations(os.path.join(envs, "child"), child)
+        assert [('create', 'child', ['ipython', 'numpy'])] == calls
+        shutil.rmtree(os.path.join(envs, "child"))
+        del calls[:]
+
+        manager.fix_environment_deviations(os.path.join(envs, "base"), base)
+        manager.fix_environment_deviations(os.path.join(envs, "child"), child)
+        manager.fix_environment_deviations(os.path.join(envs, "grandchild"), grandchild)
+        assert [('create', 'base', ['ipython']), ('clone', 'child', 'base'), ('install', 'child', ['numpy']),
+                ('clone', 'grandchild', 'child'), ('install', 'grandchild', ['pandas'])] == calls
+        for (prefix, spec) in (('base', base), ('child', child), ('grandchild', grandchild)):
+            assert manager.find_environment_deviations(os.path.join(envs, prefix), spec).ok
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_clone_skips_out_of_date_parent(monkeypatch):
+    (base, child, grandchild) = _inheriting_specs()
+
+    def do_test(dirname):
+        envs = os.path.join(dirname, "envs")
+        calls = []
+        _monkeypatch_fake_conda(monkeypatch, calls)
+        manager = DefaultCondaManager()
+
+        manager.fix_environment_deviations(os.path.join(envs, "base"), base)
+        # child exists but someone changed it since it was prepared
+        os.makedirs(os.path.join(envs, "child", "conda-meta"))
+        del calls[:]
+
+        # so we skip it and clone the grandparent
+        manager.fix_environment_deviations(os.path.join(envs, "grandchild"), grandchild)
+        assert [('clone', 'grandchild', 'base'), ('install', 'grandchild', ['numpy', 'pandas'])] == calls
+
+        # prefixes that aren't named after the env spec aren't project envs
+        del calls[:]
+        manager.fix_environment_deviations(os.path.join(dirname, "elsewhere"), child)
+        assert [('create', 'elsewhere', ['ipython', 'numpy'])] == calls
+
+    with_directory_contents(dict(), do_test)
+
+
+def test_clone_failure_falls_back_to_create(monkeypatch):
+    (base, child, grandchild) = _inheriting_specs()
+
+    def do_test(dirname):
+        envs = os.path.join(dirname, "envs")
+        calls = []
+        _monkeypatch_fake_conda(monkeypatch, calls)
+        manager = DefaultCondaManager()
+        manager.fix_environment_deviations(os.path.join(envs, "base"), base)
+        del calls[:]
+
+        def mock_failed_clone(prefix, source_prefix):
+            from anaconda_project.internal.conda_api import CondaError
+            calls.append(('clone', os.path.basename(prefix), os.path.basename(source_prefix)))
+            os.makedirs(os.path.join(prefix, "partial"))
+            raise CondaError("clone failed")
+
+        monkeypatch.setattr('anaconda_project.internal.conda_api.clone', mock_failed_clone)
+        manager.fix_environment_deviations(os.path.join(envs, "child"), child)
+        assert [('clone', 'child', 'base'), ('create', 'child', ['ipython', 'numpy'])] == calls
+        assert not os.path.exists(os.path.join(envs, "child", "partial"))
 
     with_directory_contents(dict(), do_test)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import codecs
+import os
+import time
+
+import anaconda_project.internal.download_cache as download_cache
+from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
+
+
+def _read(path):
+    with codecs.open(path, 'r', 'utf-8') as f:
+        return f.read()
+
+
+def _write(path, content):
+    with codecs.open(path, 'w', 'utf-8') as f:
+        f.write(content)
+
+
+def test_parse_and_format_size():
+    assert download_cache.parse_size("100") == 100
+    assert download_cache.parse_size("2K") == 2048
+    assert download_cache.parse_size("3mb") == 3 * 1024 * 1024
+    assert download_cache.parse_size(" 20G ") == 20 * 1024 * 1024 * 1024
+    assert download_cache.parse_size("1T") == 1024 * 1024 * 1024 * 1024
+    assert download_cache.parse_size("lots") is None
+    assert download_cache.parse_size("-1") is None
+
+    assert download_cache.format_size(100) == "100"
+    assert download_cache.format_size(1536) == "1.5K"
+    assert download_cache.format_size(20 * 1024 * 1024 * 1024) == "20.0G"
+
+
+def test_cache_directory_and_max_size():
+    environ = dict(ANACONDA_PROJECT_CACHE_DIR="/somewhere")
+    assert download_cache.cache_directory(environ) == os.path.join(os.path.abspath("/somewhere"), "downloads")
+    assert download_cache.max_size(environ) == download_cache.DEFAULT_MAX_SIZE
+    assert download_cache.max_size(dict(ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE="1G")) == 1024 * 1024 * 1024
+    assert download_cache.max_size(dict(ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE="0")) == 0
+    assert download_cache.max_size(dict(ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE="nope")) == download_cache.DEFAULT_MAX_SIZE
+
+
+def test_store_and_lookup_by_hash():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        path = download_cache.store(cache, os.path.join(dirname, "data.csv"), hash_algorithm='md5', hash_value='ABC123')
+        assert path == os.path.join(cache, 'md5', 'abc123')
+        assert _read(path) == "hello"
+
+        assert download_cache.lookup(cache, 'md5', 'abc123') == path
+        assert download_cache.lookup(cache, 'md5', 'ABC123') == path
+        assert download_cache.lookup(cache, 'sha1', 'abc123') is None
+        assert download_cache.lookup(cache, 'md5', 'def456') is None
+        assert download_cache.lookup(cache, None, None) is None
+
+        dest = os.path.join(dirname, "other", "data.csv")
+        assert download_cache.copy_out(path, dest)
+        assert _read(dest) == "hello"
+        assert not os.path.exists(dest + ".part")
+
+    with_directory_contents({"data.csv": "hello"}, check)
+
+
+def test_hash_value_cannot_escape_cache():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        assert download_cache.store(cache, os.path.join(dirname, "data.csv"), 'md5', '../../oops') is None
+        assert download_cache.lookup(cache, 'md5', '../../oops') is None
+        assert not os.path.exists(cache)
+
+    with_directory_contents({"data.csv": "hello"}, check)
+
+
+def test_store_and_lookup_by_url():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        filename = os.path.join(dirname, "data.csv")
+        url = "http://example.com/data.csv"
+
+        # no checksum and no etag, nothing to go on
+        assert download_cache.store(cache, filename, url=url) is None
+        assert download_cache.lookup_url(cache, url) is None
+
+        path = download_cache.store(cache, filename, url=url, etag='"v1"')
+        assert path is not None
+        assert download_cache.lookup_url(cache, url) == (path, '"v1"')
+        assert download_cache.lookup_url(cache, "http://example.com/other.csv") is None
+
+        entries = download_cache.entries(cache)
+        assert [path] == [entry.path for entry in entries]
+        assert entries[0].url == url
+        assert entries[0].size == 5
+
+    with_directory_contents({"data.csv": "hello"}, check)
+
+
+def test_modified_file_is_not_used():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        path = download_cache.store(cache, os.path.join(dirname, "data.csv"), 'md5', 'abc123')
+        # a project sharing the file through a hard link changes it in place
+        _write(path, "goodbye, world")
+        assert download_cache.lookup(cache, 'md5', 'abc123') is None
+        assert not os.path.exists(path)
+
+    with_directory_contents({"data.csv": "hello"}, check)
+
+
+def _set_last_used(path, when):
+    os.utime(path + ".json", (when, when))
+
+
+def test_prune_least_recently_used():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        now = time.time()
+        paths = []
+        for (i, name) in enumerate(("a", "b", "c")):
+            paths.append(download_cache.store(cache, os.path.join(dirname, name), 'md5', 'abc12%d' % i))
+            _set_last_used(paths[-1], now - 100 + i)
+
+        # using "a" makes "b" the oldest
+        assert download_cache.lookup(cache, 'md5', 'abc120') == paths[0]
+
+        removed = download_cache.prune(cache, 200)
+        assert [paths[1]] == [entry.path for entry in removed]
+        assert [paths[2], paths[0]] == [entry.path for entry in download_cache.entries(cache)]
+        assert not os.path.exists(paths[1] + ".json")
+
+        assert [] == download_cache.prune(cache, 200)
+
+        removed = download_cache.clear(cache)
+        assert [paths[2], paths[0]] == [entry.path for entry in removed]
+        assert not os.path.exists(cache)
+        # clearing again is fine
+        assert [] == download_cache.clear(cache)
+
+    with_directory_contents(dict(a="x" * 100, b="y" * 100, c="z" * 100), check)
+
+
+def test_prune_removes_leftovers():
+    def check(dirname):
+        cache = os.path.join(dirname, "cache")
+        orphan = os.path.join(cache, "md5", "abc123")
+        sidecar = os.path.join(cache, "md5", "def456.json")
+        old_tmp = os.path.join(cache, "md5", "abc789.tmp-1234")
+        new_tmp = os.path.join(cache, "md5", "abc789.tmp-5678")
+        long_ago = time.time() - 2 * 60 * 60
+        os.utime(old_tmp, (long_ago, long_ago))
+
+        assert [] == download_cache.prune(cache, 1000)
+        for path in (orphan, sidecar, old_tmp):
+            assert not os.path.exists(path)
+        assert os.path.exists(new_tmp)
+
+    with_directory_contents({"cache/md5/abc123": "orphan",
+                             "cache/md5/def456.json": "{}",
+                             "cache/md5/abc789.tmp-1234": "old",
+                             "cache/md5/abc789.tmp-5678": "new"}, check)
+
+
+def test_copy_out_falls_back_to_copy(monkeypatch):
+    def check(dirname):
+        def no_links(src, dest):
+            raise OSError("no links here")
+
+        monkeypatch.setattr('anaconda_project.internal.download_cache._reflink', lambda src, dest: False)
+        monkeypatch.setattr('os.link', no_links)
+        cache = os.path.join(dirname, "cache")
+        path = download_cache.store(cache, os.path.join(dirname, "data.csv"), 'md5', 'abc123')
+        assert path is not None
+        dest = os.path.join(dirname, "copy.csv")
+        assert download_cache.copy_out(path, dest)
+        assert _read(dest) == "hello"
+        assert os.stat(dest).st_ino != os.stat(path).st_ino
+
+    with_directory_contents({"data.csv": "hello"}, check)
+
+
+def test_copy_out_fails():
+    def check(dirname):
+        dest = os.path.join(dirname, "copy.csv")
+        assert not download_cache.copy_out(os.path.join(dirname, "nope"), dest)
+        assert not os.path.exists(dest)
+        assert not os.path.exists(dest + ".part")
+
+    with_directory_contents(dict(), check)
@@ -6,16 +6,19 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function
 
-from anaconda_project.internal.http_client import FileDownloader
+from anaconda_project.internal.http_client import FileDownloader, download_all
 from anaconda_project.internal.test.http_server import HttpServerTestContext
 from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
 
+from tornado import gen
 from tornado.ioloop import IOLoop
 
+import json
 import os
 import sys
 import platform
 import stat
+import threading
 
 
 def _download_file(length, hash_algorithm):
@@ -155,7 +158,7 @@ def test_download_fail_to_write_file(monkeypatch):
             url = server.new_download_url(download_length=(1024 * 1025), hash_algorithm='md5')
             download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
 
-            def mock_open(filename, mode):
+            def mock_open(filename, mode, *args):
                 return _FakeFileFailsToWrite()
 
             if sys.version_info > (3, 0):
@@ -191,3 +194,363 @@ def test_download_fail_to_rename_tmp_file(monkeypatch):
             assert not os.path.isfile(filename + ".part")
 
     with_directory_contents(dict(), inside_directory_fail_to_rename_tmp_file)
+
+
+def _download_all_while_serving(downloaders, max_clients):
+    # the test server runs on the current IOLoop, so download_all()
+    # has to run in another thread while we keep that loop going.
+    results = []
+    thread = threading.Thread(target=lambda: results.append(download_all(downloaders, max_clients=max_clients)))
+    thread.start()
+
+    @gen.coroutine
+    def wait_for_thread():
+        while thread.is_alive():
+            yield gen.sleep(0.01)
+
+    IOLoop.current().run_sync(wait_for_thread)
+    assert len(results) == 1
+    return results[0]
+
+
+def test_download_all():
+    def inside_directory_download_all(dirname):
+        with HttpServerTestContext() as server:
+            urls = [server.new_download_url(download_length=(1024 * i), hash_algorithm='md5') for i in range(0, 5)]
+            urls.append(server.error_url)
+            filenames = [os.path.join(dirname, "file%d" % i) for i in range(0, len(urls))]
+            downloads = [FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+                         for (url, filename) in zip(urls, filenames)]
+
+            responses = _download_all_while_serving(downloads, max_clients=2)
+
+            assert len(responses) == len(downloads)
+            for i in range(0, 5):
+                assert [] == downloads[i].errors
+                assert responses[i].code == 200
+                assert downloads[i].hash == server.server_computed_hash_for_downloaded_url(urls[i])
+                assert os.stat(filenames[i]).st_size == 1024 * i
+
+            assert responses[5] is None
+            assert ['Failed download to %s: HTTP 404: Not Found' % filenames[5]] == downloads[5].errors
+            assert not os.path.isfile(filenames[5])
+
+            # all the downloads shared one client
+            assert len(set([id(download._client) for download in downloads])) == 1
+            assert downloads[0]._client.max_clients == 2
+
+    with_directory_contents(dict(), inside_directory_download_all)
+
+
+def test_download_all_nothing():
+    assert [] == download_all([])
+
+
+def test_download_all_exception_in_run(monkeypatch):
+    @gen.coroutine
+    def mock_run(self, io_loop, client=None):
+        raise Exception("error")
+
+    monkeypatch.setattr('anaconda_project.internal.http_client.FileDownloader.run', mock_run)
+    download = FileDownloader(url="http://localhost/nope", filename="nope", hash_algorithm=None)
+    assert [None] == download_all([download])
+    assert ["Failed download to nope: error"] == download.errors
+
+
+def _write_partial_file(filename, partial, url, validator):
+    with open(filename + ".part", 'wb') as f:
+        f.write(partial)
+    if url is not None:
+        with open(filename + ".part.json", 'w') as f:
+            json.dump(dict(url=url, validator=validator), f)
+
+
+def _download_with_partial_file(length, partial, accept_ranges, same_url=True, validator=None):
+    def inside_directory_resume(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=length, hash_algorithm='md5', accept_ranges=accept_ranges)
+            # the new url's id is its ETag
+            etag = '"%s"' % url.split("id=")[1].split("&")[0]
+            _write_partial_file(filename, partial, url if same_url else url + "&other=1", validator or etag)
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert [] == download.errors
+            assert download.hash == server.server_computed_hash_for_downloaded_url(url)
+            with open(filename, 'rb') as f:
+                assert f.read() == server.download_content(length)
+            assert not os.path.isfile(filename + ".part")
+            assert not os.path.isfile(filename + ".part.json")
+            if len(server.ranges_requested) > 0:
+                assert [validator or etag] == server.if_ranges_requested
+            return response
+
+    return with_directory_contents(dict(), inside_directory_resume)
+
+
+def test_download_resumes_partial_file():
+    length = 1024 * 1024
+    with HttpServerTestContext() as server:
+        partial = server.download_content(length)[:12345]
+    response = _download_with_partial_file(length, partial, accept_ranges=True)
+    assert response.code == 206
+
+
+def test_download_partial_file_when_server_ignores_range():
+    # the server sends the whole file, so we have to replace the junk in the partial file
+    response = _download_with_partial_file(56780, b"not what the server has", accept_ranges=False)
+    assert response.code == 200
+
+
+def test_download_partial_file_larger_than_download():
+    # the server says our range is not satisfiable, so we start over
+    response = _download_with_partial_file(100, b"x" * 200, accept_ranges=True)
+    assert response.code == 200
+
+
+def test_download_partial_file_of_another_version():
+    # If-Range doesn't match, so the server sends the whole file
+    response = _download_with_partial_file(56780, b"from an older version", accept_ranges=True, validator='"older"')
+    assert response.code == 200
+
+
+def test_download_partial_file_from_another_url():
+    # we don't even ask for a range
+    with HttpServerTestContext() as server:
+        partial = server.download_content(1000)[:123]
+    response = _download_with_partial_file(1000, partial, accept_ranges=True, same_url=False)
+    assert response.code == 200
+
+
+def test_download_partial_file_without_info():
+    def inside_directory_no_info(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            _write_partial_file(filename, server.download_content(1000)[:123], url=None, validator=None)
+            url = server.new_download_url(download_length=1000, hash_algorithm='md5', accept_ranges=True)
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response.code == 200
+            assert [] == server.ranges_requested
+            assert download.hash == server.server_computed_hash_for_downloaded_url(url)
+
+    with_directory_contents(dict(), inside_directory_no_info)
+
+
+def test_download_records_partial_file_info(monkeypatch):
+    def inside_directory_record_info(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=100000, hash_algorithm='md5', accept_ranges=True)
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+            seen = []
+
+            def mock_rename(src, dest):
+                with open(src + ".json") as f:
+                    seen.append(json.load(f))
+                raise OSError("FAIL")
+
+            monkeypatch.setattr('anaconda_project.internal.rename.rename_over_existing', mock_rename)
+            IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert [dict(url=url, validator='"%s"' % url.split("id=")[1].split("&")[0])] == seen
+            assert not os.path.isfile(filename + ".part")
+            assert not os.path.isfile(filename + ".part.json")
+
+    with_directory_contents(dict(), inside_directory_record_info)
+
+
+def test_download_keeps_partial_file_on_connection_failure():
+    def inside_directory_connection_failure(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=100, hash_algorithm='md5')
+        _write_partial_file(filename, b"some bytes", url, '"etag"')
+        # the server is gone now
+        download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+        response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+        assert response is None
+        assert len(download.errors) == 1
+        assert download.errors[0].startswith("Failed download to %s: " % filename)
+        assert not os.path.isfile(filename)
+        with open(filename + ".part", 'rb') as f:
+            assert f.read() == b"some bytes"
+        assert os.path.isfile(filename + ".part.json")
+
+    with_directory_contents(dict(), inside_directory_connection_failure)
+
+
+def test_download_removes_partial_file_on_http_error():
+    def inside_directory_http_error(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with open(filename + ".part", 'wb') as f:
+            f.write(b"some bytes")
+        with HttpServerTestContext() as server:
+            download = FileDownloader(url=server.error_url, filename=filename, hash_algorithm='md5')
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response is None
+            assert ['Failed download to %s: HTTP 404: Not Found' % filename] == download.errors
+            assert not os.path.isfile(filename + ".part")
+
+    with_directory_contents(dict(), inside_directory_http_error)
+
+
+def _download_in_segments(monkeypatch, length, segments, accept_ranges):
+    monkeypatch.setattr('anaconda_project.internal.http_client._MIN_SEGMENT_SIZE', 1000)
+
+    def inside_directory_download_in_segments(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=length, hash_algorithm='sha1', accept_ranges=accept_ranges)
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='sha1', segments=segments)
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert [] == download.errors
+            assert response.code == 200
+            assert download.hash == server.server_computed_hash_for_downloaded_url(url)
+            with open(filename, 'rb') as f:
+                assert f.read() == server.download_content(length)
+            assert not os.path.isfile(filename + ".part")
+            # every range is only of the version the probe saw
+            etag = '"%s"' % url.split("id=")[1].split("&")[0]
+            assert [etag] * len(server.ranges_requested) == server.if_ranges_requested
+            return sorted(server.ranges_requested)
+
+    return with_directory_contents(dict(), inside_directory_download_in_segments)
+
+
+def test_download_in_segments(monkeypatch):
+    ranges = _download_in_segments(monkeypatch, 10000, 4, accept_ranges=True)
+    assert ['bytes=0-2499', 'bytes=2500-4999', 'bytes=5000-7499', 'bytes=7500-9999'] == ranges
+
+
+def test_download_in_fewer_segments_when_file_is_small(monkeypatch):
+    ranges = _download_in_segments(monkeypatch, 2500, 4, accept_ranges=True)
+    assert ['bytes=0-1249', 'bytes=1250-2499'] == ranges
+
+
+def test_download_too_small_to_segment(monkeypatch):
+    assert [] == _download_in_segments(monkeypatch, 1500, 4, accept_ranges=True)
+
+
+def test_download_in_segments_without_server_support(monkeypatch):
+    assert [] == _download_in_segments(monkeypatch, 10000, 4, accept_ranges=False)
+
+
+def test_download_in_segments_without_validator(monkeypatch):
+    monkeypatch.setattr('anaconda_project.internal.http_client._if_range_validator', lambda etag, last_modified: None)
+    assert [] == _download_in_segments(monkeypatch, 10000, 4, accept_ranges=True)
+
+
+def test_download_all_in_segments(monkeypatch):
+    monkeypatch.setattr('anaconda_project.internal.http_client._MIN_SEGMENT_SIZE', 1000)
+    from anaconda_project.internal import http_client
+    created_clients = []
+    original_create_client = http_client._create_client
+
+    def mock_create_client(io_loop, max_clients):
+        created_clients.append(max_clients)
+        return original_create_client(io_loop, max_clients)
+
+    monkeypatch.setattr('anaconda_project.internal.http_client._create_client', mock_create_client)
+
+    def inside_directory_download_all_in_segments(dirname):
+        with HttpServerTestContext() as server:
+            urls = [server.new_download_url(download_length=10000, hash_algorithm='md5', accept_ranges=True)
+                    for i in range(0, 2)]
+            filenames = [os.path.join(dirname, "file%d" % i) for i in range(0, len(urls))]
+            downloads = [FileDownloader(url=url, filename=filename, hash_algorithm='md5', segments=4)
+                         for (url, filename) in zip(urls, filenames)]
+
+            responses = _download_all_while_serving(downloads, max_clients=1)
+
+            for (url, download, response) in zip(urls, downloads, responses):
+                assert [] == download.errors
+                assert response.code == 200
+                assert download.hash == server.server_computed_hash_for_downloaded_url(url)
+            assert len(server.ranges_requested) == 8
+
+            # the segments didn't queue up in the one-slot shared client
+            assert [1, 4, 4] == created_clients
+
+    with_directory_contents(dict(), inside_directory_download_all_in_segments)
+
+
+def test_download_in_segments_server_sends_whole_file(monkeypatch):
+    monkeypatch.setattr('anaconda_project.internal.http_client._MIN_SEGMENT_SIZE', 1000)
+
+    def inside_directory_whole_file(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=10000, hash_algorithm='md5')
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='md5', segments=2)
+
+            # the server claims to support ranges but then ignores them
+            @gen.coroutine
+            def mock_probe():
+                response = yield download._client.fetch(url, method='HEAD')
+                raise gen.Return((response, 10000, response.headers['ETag']))
+
+            download._probe = mock_probe
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response is None
+            # the first segment to hear back stops the others
+            assert len(download.errors) == 1
+            assert download.errors[0] in ("Failed download to %s: server did not send bytes 0-4999" % filename,
+                                          "Failed download to %s: server did not send bytes 5000-9999" % filename)
+            assert download.hash is None
+            assert not os.path.isfile(filename)
+            assert not os.path.isfile(filename + ".part")
+
+    with_directory_contents(dict(), inside_directory_whole_file)
+
+
+def test_download_not_modified():
+    def inside_directory_not_modified(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=100, hash_algorithm=None)
+            download = FileDownloader(url=url, filename=filename)
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response.code == 200
+            etag = response.headers['ETag']
+            os.remove(filename)
+
+            download = FileDownloader(url=url, filename=filename, if_none_match=etag)
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert [] == download.errors
+            assert response.code == 304
+            assert not os.path.isfile(filename)
+            assert not os.path.isfile(filename + ".part")
+
+            # a stale etag gets the file
+            download = FileDownloader(url=url, filename=filename, if_none_match='"stale"')
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response.code == 200
+            assert os.path.getsize(filename) == 100
+
+    with_directory_contents(dict(), inside_directory_not_modified)
+
+
+def test_download_does_not_append_to_hard_linked_partial_file():
+    if not hasattr(os, 'link'):
+        return  # no hard links on Windows with Python 2
+
+    def inside_directory_hard_linked(dirname):
+        filename = os.path.join(dirname, "downloaded-file")
+        other = os.path.join(dirname, "other-copy")
+        with open(other, 'wb') as f:
+            f.write(b"someone else's bytes")
+        os.link(other, filename + ".part")
+        with HttpServerTestContext() as server:
+            url = server.new_download_url(download_length=1000, hash_algorithm='md5', accept_ranges=True)
+            # we'd resume it if it weren't a hard link
+            with open(filename + ".part.json", 'w') as f:
+                json.dump(dict(url=url, validator='"%s"' % url.split("id=")[1].split("&")[0]), f)
+            download = FileDownloader(url=url, filename=filename, hash_algorithm='md5')
+            response = IOLoop.current().run_sync(lambda: download.run(IOLoop.current()))
+            assert response.code == 200
+            assert download.hash == server.server_computed_hash_for_downloaded_url(url)
+            assert [] == server.ranges_requested
+        with open(other, 'rb') as f:
+            assert f.read() == b"someone else's bytes"
+
+    with_directory_contents(dict(), inside_directory_hard_linked)
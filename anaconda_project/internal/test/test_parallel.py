@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+
+import pytest
+
+from anaconda_project.internal.parallel import default_max_workers, parallel_map, parallel_imap, OrderedPipeline
+
+
+def test_default_max_workers():
+    assert 1 <= default_max_workers() <= 4
+    assert 1 == default_max_workers(limit=1)
+
+
+def test_parallel_map_keeps_order():
+    def slow_square(x):
+        # later items finish first
+        time.sleep(0.01 * (5 - x))
+        return x * x
+
+    assert [0, 1, 4, 9, 16] == parallel_map(slow_square, range(5), max_workers=5)
+    assert [0, 1, 4, 9, 16] == parallel_map(slow_square, range(5), max_workers=1)
+    assert [] == parallel_map(slow_square, [], max_workers=3)
+
+
+def test_parallel_map_bounds_concurrency():
+    lock = threading.Lock()
+    state = dict(running=0, most=0)
+
+    def track(x):
+        with lock:
+            state['running'] += 1
+            state['most'] = max(state['most'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+        return x
+
+    assert list(range(8)) == parallel_map(track, range(8), max_workers=2)
+    assert state['most'] <= 2
+
+
+def test_parallel_map_single_worker_uses_calling_thread():
+    threads = parallel_map(lambda x: threading.current_thread(), range(3), max_workers=1)
+    assert [threading.current_thread()] * 3 == threads
+
+
+def test_parallel_map_raises_earliest_failure():
+    def fail_on_odd(x):
+        if x % 2 == 1:
+            raise ValueError("failed on %d" % x)
+        return x
+
+    with pytest.raises(ValueError) as excinfo:
+        parallel_map(fail_on_odd, range(6), max_workers=3)
+    assert 'failed on 1' == str(excinfo.value)
+
+
+def test_parallel_imap_keeps_order():
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x))
+        return x * x
+
+    assert [0, 1, 4, 9, 16] == list(parallel_imap(slow_square, range(5), max_workers=3))
+    assert [0, 1, 4, 9, 16] == list(parallel_imap(slow_square, range(5), max_workers=1))
+    assert [] == list(parallel_imap(slow_square, [], max_workers=3))
+
+
+def test_parallel_imap_bounds_pending_items():
+    lock = threading.Lock()
+    state = dict(started=0, consumed=0, most_ahead=0)
+
+    def track(x):
+        with lock:
+            state['started'] += 1
+            state['most_ahead'] = max(state['most_ahead'], state['started'] - state['consumed'])
+        return x
+
+    for x in parallel_imap(track, range(20), max_workers=2, max_pending=3):
+        time.sleep(0.005)
+        with lock:
+            state['consumed'] += 1
+    assert state['most_ahead'] <= 3
+
+
+def test_parallel_imap_raises_in_order():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("failed on 3")
+        return x
+
+    results = []
+    with pytest.raises(ValueError) as excinfo:
+        for x in parallel_imap(fail_on_three, range(10), max_workers=2):
+            results.append(x)
+    assert "failed on 3" in str(excinfo.value)
+    assert [0, 1, 2] == results
+
+
+def test_ordered_pipeline():
+    pipeline = OrderedPipeline(lambda x: x + 1, max_workers=2, max_pending=2)
+    try:
+        results = []
+        for x in range(5):
+            results.extend(pipeline.put(x))
+        results.extend(pipeline.finish())
+        assert [1, 2, 3, 4, 5] == results
+        assert [] == pipeline.finish()
+    finally:
+        pipeline.close()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import gzip
+import io
+import random
+
+import pytest
+
+from anaconda_project.internal.parallel_gzip import ParallelGzipWriter
+
+
+def _gunzip(data):
+    return gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb').read()
+
+
+def _sample_data():
+    rng = random.Random(42)
+    noise = bytes(bytearray(rng.randint(0, 255) for i in range(50000)))
+    return b"hello world\n" * 10000 + noise + b"goodbye\n" * 5000
+
+
+def test_gzip_in_blocks():
+    data = _sample_data()
+    for block_size in (1000, 64 * 1024, 1024 * 1024):
+        out = io.BytesIO()
+        with ParallelGzipWriter(out, max_workers=3, block_size=block_size) as writer:
+            for start in range(0, len(data), 777):
+                writer.write(data[start:start + 777])
+        assert data == _gunzip(out.getvalue())
+        assert not out.closed
+
+
+def test_gzip_empty():
+    out = io.BytesIO()
+    writer = ParallelGzipWriter(out, mtime=0)
+    writer.close()
+    # closing again is harmless
+    writer.close()
+    assert b'' == _gunzip(out.getvalue())
+    assert out.getvalue()[4:8] == b'\x00\x00\x00\x00'
+
+
+def test_gzip_blocks_compress_nearly_as_well_as_one_stream():
+    data = b"abcdefghij" * 100000
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, block_size=16 * 1024) as writer:
+        writer.write(data)
+    assert len(out.getvalue()) < len(data) // 50
+
+
+def test_write_after_close():
+    writer = ParallelGzipWriter(io.BytesIO())
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b"nope")
+
+
+def test_failed_write_in_context_manager_stops_threads():
+    out = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with ParallelGzipWriter(out, block_size=10) as writer:
+            writer.write(b"x" * 100)
+            raise RuntimeError("oops")
+    with pytest.raises(ValueError):
+        writer.write(b"more")
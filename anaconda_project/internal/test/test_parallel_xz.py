@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import io
+import random
+
+import pytest
+
+from anaconda_project.internal import parallel_xz
+from anaconda_project.internal.parallel_xz import ParallelXzWriter
+
+pytestmark = pytest.mark.skipif(not parallel_xz.available(), reason="no lzma module")
+
+
+def _unxz(data):
+    import lzma
+    # a decompressor object stops at the end of the first stream,
+    # so this also checks that we wrote only one
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    result = decompressor.decompress(data)
+    assert decompressor.eof
+    assert decompressor.unused_data == b''
+    return result
+
+
+def _sample_data():
+    rng = random.Random(42)
+    noise = bytes(bytearray(rng.randint(0, 255) for i in range(50000)))
+    return b"hello world\n" * 10000 + noise + b"goodbye\n" * 5000
+
+
+def test_varints():
+    for value in (0, 1, 127, 128, 300, 2**32, 2**63 - 1):
+        encoded = parallel_xz._encode_varint(value)
+        assert (value, len(encoded) + 1) == parallel_xz._decode_varint(b'x' + encoded, 1)
+
+
+def test_xz_in_blocks():
+    data = _sample_data()
+    for block_size in (1000, 64 * 1024, 1024 * 1024):
+        out = io.BytesIO()
+        with ParallelXzWriter(out, preset=1, max_workers=3, block_size=block_size) as writer:
+            for start in range(0, len(data), 777):
+                writer.write(data[start:start + 777])
+        assert data == _unxz(out.getvalue())
+        assert not out.closed
+
+
+def test_xz_empty():
+    out = io.BytesIO()
+    writer = ParallelXzWriter(out)
+    writer.close()
+    writer.close()
+    assert b'' == _unxz(out.getvalue())
+
+
+def test_write_after_close():
+    writer = ParallelXzWriter(io.BytesIO())
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b"nope")
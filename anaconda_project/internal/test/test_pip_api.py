@@ -210,3 +210,76 @@ def test_format_flag(monkeypatch):
         assert len(call_pip_results) == 0
 
     with_directory_contents(dict(), do_test)
+
+
+def _monkeypatch_pip_exists(monkeypatch):
+    def mock_get_pip_command(prefix, extra_args):
+        return ["pip"] + extra_args
+
+    monkeypatch.setattr('anaconda_project.internal.pip_api._get_pip_command', mock_get_pip_command)
+
+
+def _monkeypatch_pip_list_fails(monkeypatch):
+    def mock_call_pip(prefix, extra_args):
+        raise AssertionError("should not have run pip with %r" % (extra_args, ))
+
+    monkeypatch.setattr('anaconda_project.internal.pip_api._call_pip', mock_call_pip)
+
+
+def test_installed_from_site_packages_metadata(monkeypatch):
+    _monkeypatch_pip_exists(monkeypatch)
+    _monkeypatch_pip_list_fails(monkeypatch)
+
+    def do_test(dirname):
+        installed = pip_api.installed(prefix=dirname)
+        assert dict(Flask=('Flask', '0.11.1'),
+                    abc=('abc', '1.2'),
+                    xyz=('xyz', '3.4'),
+                    single=('single', '2.0')) == installed
+
+    site_packages = "lib/python3.5/site-packages/"
+    with_directory_contents(
+        {
+            site_packages + "Flask-0.11.1.dist-info/METADATA": "Metadata-Version: 2.0\nName: Flask\nVersion: 0.11.1\n"
+            "\nName: not-a-header\n",
+            site_packages + "abc-1.2.dist-info/RECORD": "",
+            site_packages + "abc-1.2.dist-info/METADATA": "Metadata-Version: 2.0\r\nName: abc\r\nVersion: 1.2\r\n",
+            site_packages + "xyz-3.4-py3.5.egg-info/PKG-INFO": "Metadata-Version: 1.1\nName: xyz\nVersion: 3.4\n",
+            site_packages + "single-2.0-py3.5.egg-info": "Metadata-Version: 1.1\nName: single\nVersion: 2.0\n",
+            site_packages + "flask/__init__.py": ""
+        }, do_test)
+
+
+def test_installed_falls_back_to_pip_list(monkeypatch):
+    _monkeypatch_pip_exists(monkeypatch)
+    pip_extra_args = []
+
+    def mock_call_pip(prefix, extra_args):
+        pip_extra_args.append(extra_args)
+        if extra_args == ['--version']:
+            return b"pip 9.0.1 from /blah/blah (python 3.5)\n"
+        else:
+            return b"abc (1.2)\nxyz (3.4)\n"
+
+    monkeypatch.setattr('anaconda_project.internal.pip_api._call_pip', mock_call_pip)
+
+    def check(contents):
+        def do_test(dirname):
+            del pip_extra_args[:]
+            installed = pip_api.installed(prefix=dirname)
+            assert dict(abc=('abc', '1.2'), xyz=('xyz', '3.4')) == installed
+            assert [['--version'], ['list', '--format=legacy']] == pip_extra_args
+
+        with_directory_contents(contents, do_test)
+
+    site_packages = "lib/python3.5/site-packages/"
+    # no site-packages
+    check(dict())
+    # develop install
+    check({site_packages + "abc.egg-link": "/somewhere/else\n."})
+    # metadata without a version
+    check({site_packages + "abc-1.2.dist-info/METADATA": "Metadata-Version: 2.0\nName: abc\n"})
+    # metadata is missing
+    check({site_packages + "abc-1.2.dist-info/RECORD": ""})
+    # more than one python in the prefix
+    check({"lib/python2.7/site-packages/foo.py": "", site_packages + "foo.py": ""})
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import codecs
+import os
+
+import anaconda_project.internal.prepare_cache as prepare_cache
+from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
+
+
+def test_fingerprint_ignores_dict_order():
+    assert prepare_cache.fingerprint(dict(a=1, b=2)) == prepare_cache.fingerprint(dict(b=2, a=1))
+    assert prepare_cache.fingerprint(dict(a=1, b=2)) != prepare_cache.fingerprint(dict(a=1, b=3))
+
+
+def test_file_digest():
+    def check(dirname):
+        foo = os.path.join(dirname, "foo")
+        assert prepare_cache.file_digest(foo) == prepare_cache.file_digest(os.path.join(dirname, "bar"))
+        assert prepare_cache.file_digest(foo) != prepare_cache.file_digest(os.path.join(dirname, "baz"))
+        assert prepare_cache.file_digest(os.path.join(dirname, "nope")) is None
+
+    with_directory_contents(dict(foo="hello", bar="hello", baz="world"), check)
+
+
+def test_save_and_load():
+    def check(dirname):
+        foo = os.path.join(dirname, "foo")
+        stamps = prepare_cache.path_stamps([foo])
+        assert stamps == {foo: os.path.getmtime(foo)}
+
+        assert prepare_cache.load(dirname, "key") is None
+        prepare_cache.save(dirname, "key", dict(environ_set=dict(FOO="bar"), stamps=stamps))
+        assert os.path.isfile(prepare_cache.cache_filename(dirname))
+
+        entry = prepare_cache.load(dirname, "key")
+        assert entry['environ_set'] == dict(FOO="bar")
+        assert prepare_cache.load(dirname, "other") is None
+
+        # touching a stamped path makes the entry stale
+        mtime = os.path.getmtime(foo)
+        os.utime(foo, (mtime + 10, mtime + 10))
+        assert prepare_cache.load(dirname, "key") is None
+
+        prepare_cache.invalidate(dirname)
+        assert not os.path.exists(prepare_cache.cache_filename(dirname))
+        # invalidating again is harmless
+        prepare_cache.invalidate(dirname)
+
+    with_directory_contents(dict(foo="hello"), check)
+
+
+def test_stamps_of_missing_path():
+    def check(dirname):
+        assert prepare_cache.path_stamps([os.path.join(dirname, "nope")]) is None
+
+    with_directory_contents(dict(), check)
+
+
+def test_evicts_oldest_entries(monkeypatch):
+    monkeypatch.setattr('anaconda_project.internal.prepare_cache._MAX_ENTRIES', 3)
+
+    def check(dirname):
+        for i in range(0, 5):
+            prepare_cache.save(dirname, "key%d" % i, dict(stamps=dict()))
+        assert prepare_cache.load(dirname, "key0") is None
+        assert prepare_cache.load(dirname, "key1") is None
+        for i in range(2, 5):
+            assert prepare_cache.load(dirname, "key%d" % i) is not None
+
+    with_directory_contents(dict(), check)
+
+
+def test_load_corrupt_cache():
+    def check(dirname):
+        filename = prepare_cache.cache_filename(dirname)
+        assert os.path.isfile(filename)
+        assert prepare_cache.load(dirname, "key") is None
+
+        with codecs.open(filename, 'w', 'utf-8') as f:
+            f.write('{"format": 1, "entries": []}')
+        assert prepare_cache.load(dirname, "key") is None
+
+        # we can replace a corrupt cache
+        prepare_cache.save(dirname, "key", dict(stamps=dict()))
+        assert prepare_cache.load(dirname, "key") is not None
+
+    with_directory_contents({"envs/.prepare-cache.json": "not json"}, check)
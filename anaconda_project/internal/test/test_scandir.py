@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import os
+
+from anaconda_project.internal.scandir import scandir
+from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
+
+
+def test_scandir():
+    def check(dirname):
+        entries = dict([(entry.name, entry) for entry in scandir(dirname)])
+        assert set(['foo', 'bar']) == set(entries.keys())
+        assert entries['foo'].is_file()
+        assert not entries['foo'].is_dir()
+        assert entries['foo'].stat().st_size == 3
+        assert entries['foo'].path == os.path.join(dirname, 'foo')
+        assert entries['bar'].is_dir()
+        assert not entries['bar'].is_file()
+        assert not entries['bar'].is_symlink()
+
+    with_directory_contents(dict(foo="abc", bar=None), check)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import os
+
+from anaconda_project.internal import upload_records
+from anaconda_project.internal.test.tmpfile_utils import with_directory_contents
+
+
+def test_records_directory():
+    assert os.path.join(os.path.abspath("foo"), "uploads") == upload_records.records_directory(
+        dict(ANACONDA_PROJECT_CACHE_DIR="foo"))
+
+
+def test_save_and_load_record():
+    def check(dirname):
+        environ = dict(ANACONDA_PROJECT_CACHE_DIR=os.path.join(dirname, "cache"))
+        project_dir = os.path.join(dirname, "project")
+        assert upload_records.load_record("https://site", "me", project_dir, environ) is None
+
+        upload_records.save_record("https://site", "me", project_dir, "abc", "http://example.com/me/project", environ)
+        assert dict(md5="abc", url="http://example.com/me/project") == upload_records.load_record(
+            "https://site", "me", project_dir, environ)
+
+        # each site, user, and project has its own record
+        assert upload_records.load_record("https://other", "me", project_dir, environ) is None
+        assert upload_records.load_record("https://site", "you", project_dir, environ) is None
+        assert upload_records.load_record("https://site", "me", dirname, environ) is None
+
+        upload_records.save_record("https://site", "me", project_dir, "def", None, environ)
+        assert dict(md5="def", url=None) == upload_records.load_record("https://site", "me", project_dir, environ)
+        assert 1 == len(os.listdir(upload_records.records_directory(environ)))
+
+    with_directory_contents(dict(), check)
+
+
+def test_load_corrupt_record():
+    def check(dirname):
+        environ = dict(ANACONDA_PROJECT_CACHE_DIR=dirname)
+        upload_records.save_record("https://site", "me", dirname, "abc", None, environ)
+        [filename] = os.listdir(upload_records.records_directory(environ))
+        path = os.path.join(upload_records.records_directory(environ), filename)
+        for contents in ("not json", "[1, 2]", "{}"):
+            with open(path, 'w') as f:
+                f.write(contents)
+            assert upload_records.load_record("https://site", "me", dirname, environ) is None
+
+    with_directory_contents(dict(), check)
+
+
+def test_save_record_cannot_write(monkeypatch):
+    def check(dirname):
+        environ = dict(ANACONDA_PROJECT_CACHE_DIR=dirname)
+
+        def mock_rename(src, dest):
+            raise IOError("no rename")
+
+        monkeypatch.setattr('anaconda_project.internal.upload_records.rename_over_existing', mock_rename)
+        upload_records.save_record("https://site", "me", dirname, "abc", None, environ)
+        assert upload_records.load_record("https://site", "me", dirname, environ) is None
+        # the temporary file was cleaned up
+        assert [] == os.listdir(upload_records.records_directory(environ))
+
+    with_directory_contents(dict(), check)
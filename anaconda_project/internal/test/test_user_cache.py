@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import, print_function
+
+import os
+
+from anaconda_project.internal.user_cache import user_cache_directory
+
+
+def test_user_cache_directory_override():
+    assert os.path.abspath("foo") == user_cache_directory(dict(ANACONDA_PROJECT_CACHE_DIR="foo"))
+
+
+def test_user_cache_directory_linux(monkeypatch):
+    monkeypatch.setattr('platform.system', lambda: 'Linux')
+    monkeypatch.setattr('os.path.expanduser', lambda path: path.replace("~", "/home/me"))
+    assert "/xdg/anaconda-project" == user_cache_directory(dict(XDG_CACHE_HOME="/xdg"))
+    assert "/home/me/.cache/anaconda-project" == user_cache_directory(dict())
+
+
+def test_user_cache_directory_mac(monkeypatch):
+    monkeypatch.setattr('platform.system', lambda: 'Darwin')
+    monkeypatch.setattr('os.path.expanduser', lambda path: path.replace("~", "/Users/me"))
+    assert "/Users/me/Library/Caches/anaconda-project" == user_cache_directory(dict())
+
+
+def test_user_cache_directory_windows(monkeypatch):
+    monkeypatch.setattr('platform.system', lambda: 'Windows')
+    monkeypatch.setattr('os.path.expanduser', lambda path: path.replace("~", "/Users/me"))
+    assert os.path.join("/appdata", "anaconda-project", "Cache") == user_cache_directory(dict(LOCALAPPDATA="/appdata"))
+    assert os.path.join("/Users/me", "AppData", "Local", "anaconda-project",
+                        "Cache") == user_cache_directory(dict())
@@ -223,3 +223,46 @@ def test_unzip_bad_zipfile():
         assert [('Failed to unzip %s: File is not a zip file' % zipname)] == errors
 
     with_directory_contents(dict(foo="not a zip file\n"), do_test)
+
+
+def test_unzip_many_files_in_parallel():
+    contents = dict(("dir%d/file%d" % (i % 3, i), "content %d\n" % i * (i + 1)) for i in range(20))
+
+    def do_test(zipname, workingdir):
+        target_path = os.path.join(workingdir, 'boo')
+        errors = []
+        assert unpack_zip(zipname, target_path, errors, max_workers=3)
+        assert [] == errors
+        for (name, content) in contents.items():
+            assert codecs.open(os.path.join(target_path, name), 'r', 'utf-8').read() == content
+        assert [] == [name for name in os.listdir(workingdir) if name != 'boo']
+
+    with_tmp_zipfile(contents, do_test)
+
+
+def test_unzip_does_not_write_outside_target():
+    def do_test(zipname, workingdir):
+        target_path = os.path.join(workingdir, 'boo')
+        errors = []
+        assert unpack_zip(zipname, target_path, errors)
+        assert [] == errors
+        assert codecs.open(os.path.join(target_path, 'evil'), 'r', 'utf-8').read() == "mwahaha\n"
+        assert codecs.open(os.path.join(target_path, 'foo'), 'r', 'utf-8').read() == "hello world\n"
+        assert not os.path.exists(os.path.join(workingdir, 'evil'))
+
+    with_tmp_zipfile({'../evil': "mwahaha\n", 'foo': "hello world\n"}, do_test)
+
+
+def test_unzip_failure_removes_partial_extraction(monkeypatch):
+    def do_test(zipname, workingdir):
+        def mock_copyfileobj(src, dest, length):
+            raise IOError("disk full")
+
+        monkeypatch.setattr('shutil.copyfileobj', mock_copyfileobj)
+        target_path = os.path.join(workingdir, 'boo')
+        errors = []
+        assert not unpack_zip(zipname, target_path, errors)
+        assert ["Failed to unzip %s: disk full" % zipname] == errors
+        assert [] == os.listdir(workingdir)
+
+    with_tmp_zipfile(dict(foo="hello world\n", bar="goodbye world\n"), do_test)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Remember what we last uploaded, so we needn't upload it again.
+
+Uploads archive the project reproducibly, so an unchanged project
+makes an archive with the same hash. We keep one small JSON file
+per site, user, and project directory in the user cache directory;
+the record can't live in the project directory, because then it
+would end up in the next archive and change the hash.
+"""
+from __future__ import absolute_import
+
+import codecs
+import hashlib
+import json
+import os
+import uuid
+
+from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.rename import rename_over_existing
+from anaconda_project.internal.user_cache import user_cache_directory
+
+
+def records_directory(environ=None):
+    """Get the directory holding upload records, which may not exist yet."""
+    return os.path.join(user_cache_directory(environ), "uploads")
+
+
+def _record_path(site, username, project_dir, environ):
+    key = json.dumps([site, username, os.path.realpath(project_dir)])
+    return os.path.join(records_directory(environ), hashlib.sha256(key.encode('utf-8')).hexdigest() + ".json")
+
+
+def load_record(site, username, project_dir, environ=None):
+    """Get the record of the last upload of a project.
+
+    Args:
+        site (str): the server uploaded to
+        username (str): the user uploaded as
+        project_dir (str): the project directory
+        environ (dict): environment to use, defaults to ``os.environ``
+
+    Returns:
+        dict with ``md5`` and ``url`` keys, or None if there's no usable record
+    """
+    try:
+        with codecs.open(_record_path(site, username, project_dir, environ), 'r', 'utf-8') as f:
+            record = json.load(f)
+    except (EnvironmentError, ValueError):
+        return None
+    if not isinstance(record, dict) or 'md5' not in record:
+        return None
+    return record
+
+
+def save_record(site, username, project_dir, md5, url, environ=None):
+    """Remember that we uploaded a project archive with the given hash.
+
+    Failing to save the record isn't an error, we'll just upload
+    again next time.
+
+    Args:
+        site (str): the server uploaded to
+        username (str): the user uploaded as
+        project_dir (str): the project directory
+        md5 (str): hex MD5 of the uploaded archive
+        url (str): where the server says the project is
+        environ (dict): environment to use, defaults to ``os.environ``
+    """
+    path = _record_path(site, username, project_dir, environ)
+    tmp = path + ".tmp-" + str(uuid.uuid4())
+    try:
+        makedirs_ok_if_exists(os.path.dirname(path))
+        with codecs.open(tmp, 'w', 'utf-8') as f:
+            json.dump(dict(md5=md5, url=url), f)
+        rename_over_existing(tmp, path)
+    except EnvironmentError:
+        try:
+            os.remove(tmp)
+        except EnvironmentError:
+            pass
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Location of the per-user cache directory shared by all projects."""
+from __future__ import absolute_import
+
+import os
+import platform
+
+
+def user_cache_directory(environ=None):
+    """Get the directory where we keep per-user caches.
+
+    ``ANACONDA_PROJECT_CACHE_DIR`` overrides the default, which
+    follows the platform convention (``XDG_CACHE_HOME`` or
+    ``~/.cache`` on Linux, ``~/Library/Caches`` on Mac, and
+    ``LOCALAPPDATA`` on Windows). The directory may not exist yet.
+
+    Args:
+        environ (dict): environment to use, defaults to ``os.environ``
+
+    Returns:
+        absolute path of the cache directory
+    """
+    if environ is None:
+        environ = os.environ
+
+    override = environ.get('ANACONDA_PROJECT_CACHE_DIR', '')
+    if override != '':
+        return os.path.abspath(override)
+
+    system = platform.system()
+    if system == 'Windows':
+        base = environ.get('LOCALAPPDATA', '')
+        if base == '':
+            base = os.path.join(os.path.expanduser("~"), "AppData", "Local")
+        return os.path.join(base, "anaconda-project", "Cache")
+    elif system == 'Darwin':
+        return os.path.join(os.path.expanduser("~"), "Library", "Caches", "anaconda-project")
+    else:
+        base = environ.get('XDG_CACHE_HOME', '')
+        if base == '':
+            base = os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "anaconda-project")
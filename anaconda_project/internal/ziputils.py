@@ -12,19 +12,93 @@ import tempfile
 import zipfile
 
 from anaconda_project.internal import rename
+from anaconda_project.internal.makedirs import makedirs_ok_if_exists
+from anaconda_project.internal.parallel import default_max_workers, parallel_map
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _member_path(target_dir, name):
+    # the same sanitizing ZipFile.extract does, so a member
+    # can't be written outside of target_dir
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir)]
+    if len(parts) == 0:
+        return None
+    return os.path.join(target_dir, *parts)
+
+
+def _balance(members, count):
+    # split the members into count groups of about the same total size
+    groups = [[] for i in range(count)]
+    sizes = [0] * count
+    for member in sorted(members, key=lambda member: member[0].file_size, reverse=True):
+        smallest = sizes.index(min(sizes))
+        groups[smallest].append(member)
+        sizes[smallest] += member[0].file_size
+    return [group for group in groups if len(group) > 0]
+
+
+def _extract_members(zip_path, members):
+    # each thread needs its own ZipFile, they can't share a file position
+    with zipfile.ZipFile(zip_path, mode='r') as zf:
+        for (info, path) in members:
+            with zf.open(info.filename) as src:
+                with open(path, 'wb') as dest:
+                    shutil.copyfileobj(src, dest, _COPY_CHUNK_SIZE)
+
+
+def _extract_all(zf, zip_path, target_dir, max_workers):
+    # Directories are made up front so the threads don't race to
+    # make them, then the files are extracted straight into place.
+    files = []
+    for info in zf.infolist():
+        path = _member_path(target_dir, info.filename)
+        if path is None:
+            continue
+        if info.filename.endswith('/'):
+            makedirs_ok_if_exists(path)
+        else:
+            makedirs_ok_if_exists(os.path.dirname(path))
+            files.append((info, path))
+    extract_members(zip_path, files, max_workers)
+
+
+def extract_members(zip_path, members, max_workers=None):
+    """Extract zip members straight to the given paths, up to max_workers at once.
+
+    The directories the members go in must already exist.
+
+    Args:
+        zip_path (str): the zip file
+        members (list): (``ZipInfo``, destination path) pairs
+        max_workers (int): most threads to extract with, None for a default
+    """
+    if max_workers is None:
+        max_workers = default_max_workers()
+    groups = _balance(members, max(1, max_workers))
+    parallel_map(lambda group: _extract_members(zip_path, group), groups, max_workers=max_workers)
 
 
 # we overwrite as long as the zip contains a file and target_path
 # is a file, or the zip is a dir and target_path is a dir, but if
 # they don't match we don't overwrite. Hopefully this will catch
 # most mistaken collisions.
-def unpack_zip(zip_path, target_path, errors):
+def unpack_zip(zip_path, target_path, errors, max_workers=None):
+    """Unzip zip_path to target_path, extracting up to max_workers files at once.
+
+    Returns:
+        True on success, otherwise False with messages added to errors
+    """
     try:
         with zipfile.ZipFile(zip_path, mode='r') as zf:
             target_dir, target_file = os.path.split(target_path)
             tmp_dir = tempfile.mkdtemp(prefix=(target_path + "_tmp"), dir=target_dir)
             try:
-                zf.extractall(tmp_dir)
+                _extract_all(zf, zip_path, tmp_dir, max_workers)
                 extracted = os.listdir(tmp_dir)
                 if len(extracted) == 0:
                     errors.append("Zip archive was empty.")
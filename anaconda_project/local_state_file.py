@@ -18,6 +18,8 @@ DEFAULT_LOCAL_STATE_FILENAME = possible_local_state_file_names[0]
 
 SERVICE_RUN_STATES_SECTION = "service_run_states"
 
+DOWNLOAD_VERIFICATIONS_SECTION = "download_verifications"
+
 
 class LocalStateFile(YamlFile):
     """Represents the locally-configured/user-specific state of the project directory.
@@ -102,3 +104,32 @@ class LocalStateFile(YamlFile):
             a dict from service name to service state dict
         """
         return self.get_value(SERVICE_RUN_STATES_SECTION, default=dict())
+
+    def set_download_verification(self, env_var, verification):
+        """Set a dict value in the ``download_verifications`` section.
+
+        This is used to remember the checksum of a downloaded file
+        along with the file's inode, size, and modification time, so
+        we don't have to compute the checksum again until the file
+        changes.
+
+        This method does not save the file, call ``save()`` to do that.
+
+        Args:
+            env_var (str): environment variable identifying the download
+            verification (dict): the file's checksum and when we computed it
+        """
+        if not isinstance(verification, dict):
+            raise ValueError("download verification should be a dict")
+        self.set_value([DOWNLOAD_VERIFICATIONS_SECTION, env_var], verification)
+
+    def get_download_verification(self, env_var):
+        """Get the remembered checksum of a downloaded file.
+
+        Args:
+            env_var (str): environment variable identifying the download
+
+        Returns:
+            The verification dict (empty dict if none was saved)
+        """
+        return self.get_value([DOWNLOAD_VERIFICATIONS_SECTION, env_var], default=dict())
@@ -11,6 +11,7 @@ from abc import ABCMeta, abstractmethod
 from copy import deepcopy
 import os
 import shutil
+import threading
 
 from anaconda_project.internal import conda_api
 from anaconda_project.internal import logged_subprocess
@@ -19,6 +20,12 @@ from anaconda_project.internal.makedirs import makedirs_ok_if_exists
 from anaconda_project.internal.simple_status import SimpleStatus
 
 
+# providers may run on several threads at once (see
+# prepare_without_interaction's parallel_provide), and they all
+# share one local state file.
+_local_state_lock = threading.RLock()
+
+
 def _service_directory(local_state_file, relative_name):
     return os.path.join(os.path.dirname(local_state_file.filename), "services", relative_name)
 
@@ -68,13 +75,28 @@ class ProvideContext(object):
         Returns:
             Whatever ``func`` returns.
         """
-        old_state = self._local_state_file.get_service_run_state(service_name)
-        modified = deepcopy(old_state)
-        result = func(modified)
-        if modified != old_state:
-            self._local_state_file.set_service_run_state(service_name, modified)
-            self._local_state_file.save()
-        return result
+        with _local_state_lock:
+            old_state = self._local_state_file.get_service_run_state(service_name)
+            modified = deepcopy(old_state)
+            result = func(modified)
+            if modified != old_state:
+                self._local_state_file.set_service_run_state(service_name, modified)
+                self._local_state_file.save()
+            return result
+
+    def save_download_verification(self, env_var, verification):
+        """Remember the checksum of a downloaded file in the local state file, and save it.
+
+        Args:
+            env_var (str): environment variable identifying the download
+            verification (dict): the file's checksum and when we computed it
+        """
+        with _local_state_lock:
+            if self._local_state_file.corrupted:
+                return
+            if self._local_state_file.get_download_verification(env_var) != verification:
+                self._local_state_file.set_download_verification(env_var, verification)
+                self._local_state_file.save()
 
     @property
     def status(self):
@@ -356,6 +378,25 @@ class Provider(with_metaclass(ABCMeta)):
         """
         pass  # pragma: no cover
 
+    def prefetch(self, statuses, environ, mode):
+        """Do work for several requirements at once, before they are provided.
+
+        Called once per provide stage with all the statuses
+        (sharing our class of provider) about to be provided.
+        ``provide()`` is still called for each of them afterward,
+        and is responsible for reporting errors, so this is only
+        an optimization. The default does nothing.
+
+        Args:
+            statuses (list of RequirementStatus): statuses about to be provided
+            environ (dict): current environment, must not be modified
+            mode (str): one of PROVIDE_MODE_PRODUCTION, PROVIDE_MODE_DEVELOPMENT, PROVIDE_MODE_CHECK
+
+        Returns:
+            None
+        """
+        pass
+
     @abstractmethod
     def unprovide(self, requirement, environ, local_state_file, overrides, requirement_status=None):
         """Undo the provide, cleaning up any files or processes we created.
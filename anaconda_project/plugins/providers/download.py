@@ -12,7 +12,8 @@ import shutil
 
 from tornado.ioloop import IOLoop
 
-from anaconda_project.internal.http_client import FileDownloader
+from anaconda_project.internal import download_cache
+from anaconda_project.internal.http_client import FileDownloader, download_all, DEFAULT_MAX_CLIENTS
 from anaconda_project.internal.ziputils import unpack_zip
 from anaconda_project.internal.simple_status import SimpleStatus
 from anaconda_project.plugins.provider import EnvVarProvider, ProviderAnalysis
@@ -25,6 +26,35 @@ class _DownloadProviderAnalysis(ProviderAnalysis):
     def __init__(self, config, missing_to_configure, missing_to_provide, existing_filename):
         super(_DownloadProviderAnalysis, self).__init__(config, missing_to_configure, missing_to_provide)
         self.existing_filename = existing_filename
+        # errors from a failed attempt by prefetch(), for provide() to report
+        self.prefetch_errors = None
+
+
+class _PendingDownload(object):
+    """A download we are about to do, and where it goes."""
+
+    def __init__(self, requirement, project_dir):
+        self.requirement = requirement
+        self.filename = os.path.abspath(os.path.join(project_dir, requirement.filename))
+        if requirement.unzip:
+            self.download_filename = self.filename + ".zip"
+        else:
+            self.download_filename = self.filename
+
+        # without a checksum, we can still ask the server whether
+        # the copy we cached last time is current.
+        self.cached_path = None
+        etag = None
+        if requirement.hash_algorithm is None and download_cache.max_size() > 0:
+            found = download_cache.lookup_url(download_cache.cache_directory(), requirement.url)
+            if found is not None:
+                (self.cached_path, etag) = found
+
+        self.download = FileDownloader(url=requirement.url,
+                                       filename=self.download_filename,
+                                       hash_algorithm=requirement.hash_algorithm,
+                                       segments=requirement.segments,
+                                       if_none_match=etag)
 
 
 class DownloadProvider(EnvVarProvider):
@@ -86,7 +116,7 @@ class DownloadProvider(EnvVarProvider):
         analysis = super(DownloadProvider, self).analyze(requirement, environ, local_state_file, default_env_spec_name,
                                                          overrides)
         filename = os.path.join(environ['PROJECT_DIR'], requirement.filename)
-        if os.path.exists(filename):
+        if os.path.exists(filename) and requirement.verification_problem(filename, local_state_file) is None:
             existing_filename = filename
         else:
             existing_filename = None
@@ -95,49 +125,149 @@ class DownloadProvider(EnvVarProvider):
                                          analysis.missing_env_vars_to_provide,
                                          existing_filename=existing_filename)
 
+    def _from_cache(self, pending):
+        # only files with a checksum can be used without asking the server
+        if download_cache.max_size() == 0:
+            return False
+        path = download_cache.lookup(download_cache.cache_directory(), pending.requirement.hash_algorithm,
+                                     pending.requirement.hash_value)
+        return path is not None and download_cache.copy_out(path, pending.download_filename)
+
+    def _store_in_cache(self, pending, response):
+        max_size = download_cache.max_size()
+        if max_size == 0 or (pending.requirement.unzip and not pending.requirement.keep_zip):
+            return
+        headers = getattr(response, 'headers', None)
+        etag = headers.get('ETag', None) if headers is not None else None
+        directory = download_cache.cache_directory()
+        download_cache.store(directory,
+                             pending.download_filename,
+                             hash_algorithm=pending.requirement.hash_algorithm,
+                             hash_value=pending.requirement.hash_value,
+                             url=pending.requirement.url,
+                             etag=etag)
+        download_cache.prune(directory, max_size)
+
+    def _unpack(self, pending, errors):
+        if pending.requirement.unzip:
+            if unpack_zip(pending.download_filename, pending.filename, errors):
+                os.remove(pending.download_filename)
+                return pending.filename
+            else:
+                return None
+        return pending.filename
+
+    def _finish_download(self, pending, response, errors):
+        requirement = pending.requirement
+        download = pending.download
+        if response is None:
+            for error in download.errors:
+                errors.append(error)
+            return None
+        elif response.code == 304:
+            # the server says our cached copy is current
+            if not download_cache.copy_out(pending.cached_path, pending.download_filename):
+                errors.append("Error downloading {}: failed to copy cached file {}".format(
+                    requirement.url, pending.cached_path))
+                return None
+            return self._unpack(pending, errors)
+        elif response.code in (200, 206):
+            # 206 is what we get when we resumed a partial download
+            if requirement.hash_value is not None and requirement.hash_value != download.hash:
+                errors.append("Error downloading {}: mismatched hashes. Expected: {}, calculated: {}".format(
+                    requirement.url, requirement.hash_value, download.hash))
+                return None
+            self._store_in_cache(pending, response)
+            return self._unpack(pending, errors)
+        else:
+            errors.append("Error downloading {}: response code {}".format(requirement.url, response.code))
+            return None
+
     def _provide_download(self, requirement, context, errors, logs):
         filename = context.status.analysis.existing_filename
         if filename is not None:
             logs.append("Previously downloaded file located at {}".format(filename))
             return filename
 
-        filename = os.path.abspath(os.path.join(context.environ['PROJECT_DIR'], requirement.filename))
-        if requirement.unzip:
-            download_filename = filename + ".zip"
-        else:
-            download_filename = filename
-        download = FileDownloader(url=requirement.url,
-                                  filename=download_filename,
-                                  hash_algorithm=requirement.hash_algorithm)
+        prefetch_errors = context.status.analysis.prefetch_errors
+        if prefetch_errors is not None:
+            # prefetch() already tried and failed, don't download it all again
+            errors.extend(prefetch_errors)
+            return None
+
+        pending = _PendingDownload(requirement, context.environ['PROJECT_DIR'])
+        if os.path.exists(pending.filename) and \
+           requirement.verification_problem(pending.filename, context.local_state_file) is None:
+            # downloaded by prefetch() since we analyzed
+            return pending.filename
+
+        if self._from_cache(pending):
+            logs.append("Using cached download of {}".format(requirement.url))
+            return self._unpack(pending, errors)
 
         try:
             _ioloop = IOLoop(make_current=False)
-            response = _ioloop.run_sync(lambda: download.run(_ioloop))
-            if response is None:
-                for error in download.errors:
-                    errors.append(error)
-                return None
-            elif response.code == 200:
-                if requirement.hash_value is not None and requirement.hash_value != download.hash:
-                    errors.append("Error downloading {}: mismatched hashes. Expected: {}, calculated: {}".format(
-                        requirement.url, requirement.hash_value, download.hash))
-                    return None
-                if requirement.unzip:
-                    if unpack_zip(download_filename, filename, errors):
-                        os.remove(download_filename)
-                        return filename
-                    else:
-                        return None
-                return filename
-            else:
-                errors.append("Error downloading {}: response code {}".format(requirement.url, response.code))
-                return None
+            response = _ioloop.run_sync(lambda: pending.download.run(_ioloop))
+            return self._finish_download(pending, response, errors)
         except Exception as e:
             errors.append("Error downloading {}: {}".format(requirement.url, str(e)))
             return None
         finally:
             _ioloop.close()
 
+    def _max_clients(self, environ):
+        try:
+            return max(1, int(environ.get('ANACONDA_PROJECT_DOWNLOAD_MAX_CLIENTS', DEFAULT_MAX_CLIENTS)))
+        except ValueError:
+            return DEFAULT_MAX_CLIENTS
+
+    def prefetch(self, statuses, environ, mode):
+        """Override superclass to run all the needed downloads at once.
+
+        The downloads share one IOLoop and one HTTP client, with at
+        most ``ANACONDA_PROJECT_DOWNLOAD_MAX_CLIENTS`` (default 8)
+        in progress at a time. Anything which fails here has its
+        errors kept for ``provide()`` to report without downloading
+        it again; we only clean up files the failed download created,
+        never anything that was in the project already.
+        """
+        if mode == PROVIDE_MODE_CHECK:
+            return
+
+        directory = download_cache.cache_directory()
+        pending = []
+        for status in statuses:
+            requirement = status.requirement
+            if status.analysis.existing_filename is None and status.analysis.config['source'] == 'download':
+                # provide() can copy these out of the cache without downloading
+                if download_cache.lookup(directory, requirement.hash_algorithm, requirement.hash_value) is None:
+                    pending.append((status, _PendingDownload(requirement, environ['PROJECT_DIR'])))
+
+        # a single download gains nothing from a batch
+        if len(pending) < 2:
+            return
+
+        # anything already there (say, a file which failed
+        # verification) belongs to the user, not to us
+        created = dict()
+        for (status, item) in pending:
+            created[item] = [path for path in set([item.filename, item.download_filename]) if not os.path.exists(path)]
+
+        responses = download_all([item.download for (status, item) in pending],
+                                 max_clients=self._max_clients(environ))
+        for ((status, item), response) in zip(pending, responses):
+            errors = []
+            if self._finish_download(item, response, errors) is None:
+                status.analysis.prefetch_errors = errors
+                for path in created[item]:
+                    try:
+                        if os.path.isdir(path):
+                            shutil.rmtree(path)
+                        elif os.path.isfile(path):
+                            os.remove(path)
+                    except EnvironmentError:
+                        pass
+
     def provide(self, requirement, context):
         """Override superclass to start a download..
 
@@ -158,8 +288,22 @@ class DownloadProvider(EnvVarProvider):
             if filename is not None:
                 context.environ[requirement.env_var] = filename
 
+        if requirement.env_var in context.environ:
+            self._save_verification(requirement, context.environ[requirement.env_var], context)
+
         return super_result.copy_with_additions(errors=errors, logs=logs)
 
+    def _save_verification(self, requirement, filename, context):
+        # checking status doesn't modify the local state file, so we
+        # remember the checksum here to avoid computing it next time
+        if not requirement.verify or requirement.unzip or not os.path.isfile(filename):
+            return
+        try:
+            verification = requirement.file_verification(filename, context.local_state_file)
+        except EnvironmentError:
+            return
+        context.save_download_verification(requirement.env_var, verification)
+
     def unprovide(self, requirement, environ, local_state_file, overrides, requirement_status=None):
         """Override superclass to delete the downloaded file."""
         project_dir = environ['PROJECT_DIR']
@@ -17,6 +17,7 @@ from anaconda_project.internal.test.tmpfile_utils import (with_directory_content
                                                           with_tmp_zipfile, complete_project_file_content)
 from anaconda_project.test.environ_utils import minimal_environ, strip_environ
 from anaconda_project.internal.test.http_utils import http_get_async, http_post_async
+from anaconda_project.internal import download_cache
 from anaconda_project.local_state_file import DEFAULT_LOCAL_STATE_FILENAME
 from anaconda_project.local_state_file import LocalStateFile
 from anaconda_project.plugins.registry import PluginRegistry
@@ -91,6 +92,29 @@ def test_prepare_and_unprepare_download(monkeypatch):
     with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: DATAFILE_CONTENT}, provide_download)
 
 
+def test_prepare_resumed_download(monkeypatch):
+    def provide_download(dirname):
+        @gen.coroutine
+        def mock_downloader_run(self, loop):
+            class Res:
+                pass
+
+            res = Res()
+            res.code = 206
+            with open(os.path.join(dirname, 'data.csv'), 'w') as out:
+                out.write('data')
+            self._hash = '12345abcdef'
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert result
+        assert result.environ['DATAFILE'] == os.path.join(dirname, 'data.csv')
+
+    with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: DATAFILE_CONTENT}, provide_download)
+
+
 def test_prepare_download_mismatched_checksum_after_download(monkeypatch):
     def provide_download(dirname):
         @gen.coroutine
@@ -220,6 +244,236 @@ def test_provide_no_download_in_check_mode(monkeypatch):
     with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: MIN_DATAFILE_CONTENT}, provide_download)
 
 
+SEVERAL_DATAFILES_CONTENT = ("downloads:\n"
+                             "    DATAFILE1: http://localhost/data1.csv\n"
+                             "    DATAFILE2: http://localhost/data2.csv\n"
+                             "    DATAFILE3:\n"
+                             "        url: http://localhost/data3.csv\n"
+                             "        md5: 12345abcdef\n")
+
+
+def test_provide_several_downloads_at_once(monkeypatch):
+    def provide_download(dirname):
+        clients = []
+
+        @gen.coroutine
+        def mock_downloader_run(self, loop, client=None):
+            class Res:
+                pass
+
+            clients.append(client)
+            res = Res()
+            res.code = 200
+            with open(self._filename, 'w') as out:
+                out.write('data')
+            if self._url.endswith("data3.csv"):
+                self._hash = '12345abcdef'
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project,
+                                             environ=minimal_environ(PROJECT_DIR=dirname,
+                                                                     ANACONDA_PROJECT_DOWNLOAD_MAX_CLIENTS='2'))
+        assert result
+        for i in range(1, 4):
+            assert result.environ['DATAFILE%d' % i] == os.path.join(dirname, 'data%d.csv' % i)
+            assert os.path.isfile(os.path.join(dirname, 'data%d.csv' % i))
+
+        # three downloads shared one client
+        assert len(clients) == 3
+        assert clients[0] is not None
+        assert clients[0] is clients[1]
+        assert clients[0] is clients[2]
+        assert clients[0].max_clients == 2
+
+    with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: SEVERAL_DATAFILES_CONTENT},
+                                                    provide_download)
+
+
+def test_provide_several_downloads_reports_failure_without_retrying(monkeypatch):
+    def provide_download(dirname):
+        clients = []
+
+        @gen.coroutine
+        def mock_downloader_run(self, loop, client=None):
+            class Res:
+                pass
+
+            clients.append(client)
+            res = Res()
+            res.code = 200
+            with open(self._filename, 'w') as out:
+                out.write('data')
+            if self._url.endswith("data3.csv"):
+                self._hash = 'mismatched'
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert not result
+        assert ("Error downloading http://localhost/data3.csv: mismatched hashes. "
+                "Expected: 12345abcdef, calculated: mismatched") in result.errors
+        assert not os.path.exists(os.path.join(dirname, 'data3.csv'))
+
+        # the failed download wasn't repeated by provide()
+        assert len(clients) == 3
+        assert None not in clients
+
+    with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: SEVERAL_DATAFILES_CONTENT},
+                                                    provide_download)
+
+
+def test_provide_several_downloads_failure_keeps_existing_file(monkeypatch):
+    def provide_download(dirname):
+        @gen.coroutine
+        def mock_downloader_run(self, loop, client=None):
+            class Res:
+                pass
+
+            if self._url.endswith("data3.csv"):
+                self._errors.append("Failed download to %s: nope" % self._filename)
+                raise gen.Return(None)
+            res = Res()
+            res.code = 200
+            with open(self._filename, 'w') as out:
+                out.write('data')
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert not result
+        assert ("Failed download to %s: nope" % os.path.join(dirname, 'data3.csv')) in result.errors
+
+        # the file that failed verification is still the user's
+        with open(os.path.join(dirname, 'data3.csv')) as f:
+            assert 'not what we wanted' == f.read()
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: SEVERAL_DATAFILES_CONTENT + "        verify: true\n",
+         'data3.csv': 'not what we wanted'}, provide_download)
+
+
+def test_provide_download_in_segments(monkeypatch):
+    SEGMENTED_DATAFILE_CONTENT = ("downloads:\n"
+                                  "    DATAFILE:\n"
+                                  "        url: http://localhost/data.csv\n"
+                                  "        segments: 3\n")
+
+    def provide_download(dirname):
+        segments = []
+
+        @gen.coroutine
+        def mock_downloader_run(self, loop):
+            class Res:
+                pass
+
+            segments.append(self._segments)
+            res = Res()
+            res.code = 200
+            with open(self._filename, 'w') as out:
+                out.write('data')
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert result
+        assert [3] == segments
+
+    with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: SEGMENTED_DATAFILE_CONTENT},
+                                                    provide_download)
+
+
+def _prepare_twice_sharing_cache(monkeypatch, content, first_run, second_run):
+    results = []
+
+    def provide_download(dirname):
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", first_run)
+        project = project_no_dedicated_env(dirname)
+        first = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert first
+
+        def provide_again(other_dirname):
+            monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", second_run)
+            project = project_no_dedicated_env(other_dirname)
+            second = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=other_dirname))
+            with codecs.open(os.path.join(other_dirname, 'data.csv'), 'r', 'utf-8') as f:
+                results.append((second, f.read()))
+
+        with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: content}, provide_again)
+
+    with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: content}, provide_download)
+    return results[0]
+
+
+class _Res(object):
+    def __init__(self, code, headers=None):
+        self.code = code
+        self.headers = headers if headers is not None else dict()
+
+
+def test_download_with_checksum_is_cached_for_other_projects(monkeypatch):
+    @gen.coroutine
+    def mock_downloader_run(self, loop):
+        with open(self._filename, 'w') as out:
+            out.write('data')
+        self._hash = '12345abcdef'
+        raise gen.Return(_Res(200))
+
+    @gen.coroutine
+    def mock_downloader_run_again(self, loop):
+        raise Exception("should have used the cache")
+
+    (result, content) = _prepare_twice_sharing_cache(monkeypatch, DATAFILE_CONTENT, mock_downloader_run,
+                                                     mock_downloader_run_again)
+    assert result
+    assert "Using cached download of http://localhost/data.csv" in result.logs
+    assert content == 'data'
+
+
+def test_download_without_checksum_is_cached_by_etag(monkeypatch):
+    MIN_DATAFILE_CONTENT = ("downloads:\n" "    DATAFILE: http://localhost/data.csv\n")
+
+    @gen.coroutine
+    def mock_downloader_run(self, loop):
+        assert self._if_none_match is None
+        with open(self._filename, 'w') as out:
+            out.write('data')
+        raise gen.Return(_Res(200, dict(ETag='"v1"')))
+
+    @gen.coroutine
+    def mock_downloader_run_again(self, loop):
+        assert self._if_none_match == '"v1"'
+        raise gen.Return(_Res(304))
+
+    (result, content) = _prepare_twice_sharing_cache(monkeypatch, MIN_DATAFILE_CONTENT, mock_downloader_run,
+                                                     mock_downloader_run_again)
+    assert result
+    assert content == 'data'
+
+
+def test_download_cache_disabled(monkeypatch):
+    monkeypatch.setenv('ANACONDA_PROJECT_DOWNLOAD_CACHE_SIZE', '0')
+    downloads = []
+
+    @gen.coroutine
+    def mock_downloader_run(self, loop):
+        downloads.append(self._url)
+        with open(self._filename, 'w') as out:
+            out.write('data')
+        self._hash = '12345abcdef'
+        raise gen.Return(_Res(200))
+
+    (result, content) = _prepare_twice_sharing_cache(monkeypatch, DATAFILE_CONTENT, mock_downloader_run,
+                                                     mock_downloader_run)
+    assert result
+    assert content == 'data'
+    assert ['http://localhost/data.csv', 'http://localhost/data.csv'] == downloads
+
+
 def test_provide_missing_url(monkeypatch):
     ERR_DATAFILE_CONTENT = ("downloads:\n" "    DATAFILE:\n" "       filename: data.csv\n")
 
@@ -333,6 +587,46 @@ def test_file_exists(monkeypatch):
         }, provide_download)
 
 
+def test_corrupt_file_is_downloaded_again_when_verifying(monkeypatch):
+    def provide_download(dirname):
+        FILENAME = os.path.join(dirname, 'data.csv')
+
+        @gen.coroutine
+        def mock_downloader_run(self, loop):
+            class Res:
+                pass
+
+            res = Res()
+            res.code = 200
+            with open(FILENAME, 'w') as out:
+                out.write('data')
+            self._hash = '8d777f385d3dfec8815d20f7496026dc'
+            raise gen.Return(res)
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert result
+        assert result.environ['DATAFILE'] == FILENAME
+        with codecs.open(FILENAME, 'r', 'utf-8') as f:
+            assert f.read() == 'data'
+        # the provider remembers the new file's checksum
+        local_state_file = LocalStateFile.load_for_directory(dirname)
+        verification = local_state_file.get_download_verification('DATAFILE')
+        assert '8d777f385d3dfec8815d20f7496026dc' == verification['hash']
+        assert os.path.getsize(FILENAME) == verification['size']
+
+    with_directory_contents_completing_project_file(
+        {
+            DEFAULT_PROJECT_FILENAME: ("downloads:\n"
+                                       "    DATAFILE:\n"
+                                       "        url: http://localhost/data.csv\n"
+                                       "        md5: 8d777f385d3dfec8815d20f7496026dc\n"
+                                       "        verify: true\n"),
+            'data.csv': 'corrupted'
+        }, provide_download)
+
+
 def test_prepare_download_of_zip_file(monkeypatch):
     def provide_download_of_zip(zipname, dirname):
         with codecs.open(os.path.join(dirname, DEFAULT_PROJECT_FILENAME), 'w', 'utf-8') as f:
@@ -364,6 +658,29 @@ def test_prepare_download_of_zip_file(monkeypatch):
     with_tmp_zipfile(dict(foo='hello\n'), provide_download_of_zip)
 
 
+def test_prepare_download_of_zip_file_without_keeping_zip(monkeypatch):
+    def provide_download_of_zip(zipname, dirname):
+        with codecs.open(os.path.join(dirname, DEFAULT_PROJECT_FILENAME), 'w', 'utf-8') as f:
+            f.write(complete_project_file_content(ZIPPED_DATAFILE_CONTENT_CHECKSUM + "        keep_zip: false\n"))
+
+        @gen.coroutine
+        def mock_downloader_run(self, loop):
+            shutil.copyfile(zipname, self._filename)
+            self._hash = '12345abcdef'
+            raise gen.Return(_Res(200))
+
+        monkeypatch.setattr("anaconda_project.internal.http_client.FileDownloader.run", mock_downloader_run)
+
+        project = project_no_dedicated_env(dirname)
+        result = prepare_without_interaction(project, environ=minimal_environ(PROJECT_DIR=dirname))
+        assert result
+        assert codecs.open(os.path.join(dirname, 'data', 'foo')).read() == 'hello\n'
+        assert not os.path.exists(os.path.join(dirname, 'data.zip'))
+        assert [] == download_cache.entries(download_cache.cache_directory())
+
+    with_tmp_zipfile(dict(foo='hello\n'), provide_download_of_zip)
+
+
 def test_prepare_download_of_zip_file_checksum(monkeypatch):
     def provide_download_of_zip(zipname, dirname):
         with codecs.open(os.path.join(dirname, DEFAULT_PROJECT_FILENAME), 'w', 'utf-8') as f:
@@ -8,6 +8,7 @@
 
 from __future__ import absolute_import, print_function
 
+import hashlib
 import os
 
 from anaconda_project.plugins.requirement import EnvVarRequirement
@@ -17,6 +18,29 @@ from anaconda_project.internal.py2_compat import is_string
 
 _hash_algorithms = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
 
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_fingerprint(filename):
+    # if none of these change, we assume the contents didn't either
+    st = os.stat(filename)
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        # python 2
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return dict(filename=filename, inode=st.st_ino, size=st.st_size, mtime_ns=mtime_ns)
+
+
+def _hash_file(filename, hash_algorithm):
+    hasher = hashlib.new(hash_algorithm)
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
 
 class DownloadRequirement(EnvVarRequirement):
     """A requirement for ``env_var`` to point to a downloaded file."""
@@ -29,6 +53,9 @@ class DownloadRequirement(EnvVarRequirement):
         hash_algorithm = None
         hash_value = None
         unzip = None
+        keep_zip = None
+        segments = None
+        verify = None
         description = None
         if is_string(item):
             url = item
@@ -66,6 +93,28 @@ class DownloadRequirement(EnvVarRequirement):
                                                                                                             unzip))
                 return
 
+            keep_zip = item.get('keep_zip', None)
+            if keep_zip is not None and not isinstance(keep_zip, bool):
+                problems.append("Value of 'keep_zip' for download item {} should be a boolean, not {}.".format(
+                    varname, keep_zip))
+                return
+
+            segments = item.get('segments', None)
+            if segments is not None and (isinstance(segments, bool) or not isinstance(segments, int) or
+                                         segments < 1):
+                problems.append("Value of 'segments' for download item {} should be a positive integer, not {}."
+                                .format(varname, segments))
+                return
+
+            verify = item.get('verify', None)
+            if verify is not None and not isinstance(verify, bool):
+                problems.append("Value of 'verify' for download item {} should be a boolean, not {}.".format(varname,
+                                                                                                             verify))
+                return
+            if verify and hash_algorithm is None:
+                problems.append("Download item {} has 'verify' set but no checksum to verify against.".format(varname))
+                return
+
         if url is None or not is_string(url):
             problems.append(("Download name {} should be followed by a URL string or a dictionary " +
                              "describing the download.").format(varname))
@@ -103,6 +152,15 @@ class DownloadRequirement(EnvVarRequirement):
         if unzip is None:
             unzip = False
 
+        if keep_zip is None:
+            keep_zip = True
+
+        if segments is None:
+            segments = 1
+
+        if verify is None:
+            verify = False
+
         requirements.append(DownloadRequirement(registry,
                                                 env_var=varname,
                                                 url=url,
@@ -110,6 +168,9 @@ class DownloadRequirement(EnvVarRequirement):
                                                 hash_algorithm=hash_algorithm,
                                                 hash_value=hash_value,
                                                 unzip=unzip,
+                                                keep_zip=keep_zip,
+                                                segments=segments,
+                                                verify=verify,
                                                 description=description))
 
     def __init__(self,
@@ -120,6 +181,9 @@ class DownloadRequirement(EnvVarRequirement):
                  hash_algorithm=None,
                  hash_value=None,
                  unzip=False,
+                 keep_zip=True,
+                 segments=1,
+                 verify=False,
                  description=None):
         """Extend init to accept url and hash parameters."""
         options = None
@@ -136,6 +200,16 @@ class DownloadRequirement(EnvVarRequirement):
         self.hash_algorithm = hash_algorithm
         self.hash_value = hash_value
         self.unzip = unzip
+        # whether the download cache may hold on to the zip once it's unpacked
+        self.keep_zip = keep_zip
+        assert segments >= 1
+        # number of byte ranges to fetch at once, if the server allows it
+        self.segments = segments
+        assert not verify or hash_algorithm is not None
+        # check the checksum of files we already have, not only new downloads
+        self.verify = verify
+        # the last checksum we computed, until the provider saves it
+        self._last_verification = dict()
 
     @property
     def description(self):
@@ -145,18 +219,69 @@ class DownloadRequirement(EnvVarRequirement):
     @property
     def ignore_patterns(self):
         """Override superclass with our ignore patterns."""
-        return set(['/' + self.filename, '/' + self.filename + ".part"])
+        return set(['/' + self.filename, '/' + self.filename + ".part", '/' + self.filename + ".part.json"])
+
+    def file_verification(self, filename, local_state_file):
+        """Get the checksum of an existing file, along with what we knew about the file when we computed it.
+
+        Hashing a big file is slow, so this uses the checksum
+        remembered in the local state file (or computed earlier by
+        this requirement) if the file hasn't changed since. It
+        doesn't modify the local state file; the provider saves the
+        result with ``ProvideContext.save_download_verification()``.
+
+        Args:
+            filename (str): the downloaded file
+            local_state_file (LocalStateFile): where we remember files we've already checked
+
+        Returns:
+            a dict for ``LocalStateFile.set_download_verification()``, with the checksum in its ``hash`` key
+
+        Raises:
+            EnvironmentError if the file can't be read
+        """
+        fingerprint = _file_fingerprint(filename)
+        for saved in (local_state_file.get_download_verification(self.env_var), self._last_verification):
+            if saved.get('hash_algorithm') == self.hash_algorithm and \
+               all(saved.get(key) == value for (key, value) in fingerprint.items()):
+                return saved
+
+        digest = _hash_file(filename, self.hash_algorithm)
+        self._last_verification = dict(fingerprint, hash_algorithm=self.hash_algorithm, hash=digest)
+        return self._last_verification
+
+    def verification_problem(self, filename, local_state_file):
+        """Check an existing file against our checksum, if we were asked to verify it.
+
+        Args:
+            filename (str): the downloaded file
+            local_state_file (LocalStateFile): where we remember files we've already checked
+
+        Returns:
+            a message describing the problem, or None if the file is fine or we don't verify it
+        """
+        # unzipped downloads are a directory, and the zip we had a checksum for is gone
+        if not self.verify or self.unzip or not os.path.isfile(filename):
+            return None
+        try:
+            digest = self.file_verification(filename, local_state_file)['hash']
+        except EnvironmentError as e:
+            return "Failed to verify {}: {}".format(filename, str(e))
+        if digest != self.hash_value.lower():
+            return "File {} does not match its {} checksum.".format(filename, self.hash_algorithm)
+        return None
 
-    def _why_not_provided(self, environ):
+    def _why_not_provided(self, environ, local_state_file):
         if self.env_var not in environ:
             return self._unset_message()
         filename = environ[self.env_var]
         if not os.path.exists(filename):
             return 'File not found: {}'.format(filename)
+        return self.verification_problem(filename, local_state_file)
 
     def check_status(self, environ, local_state_file, default_env_spec_name, overrides, latest_provide_result=None):
         """Override superclass to get our status."""
-        why_not_provided = self._why_not_provided(environ)
+        why_not_provided = self._why_not_provided(environ, local_state_file)
 
         has_been_provided = why_not_provided is None
         if has_been_provided:
@@ -7,8 +7,10 @@
 import hashlib
 import os
 
-from anaconda_project.local_state_file import LocalStateFile
+from anaconda_project.local_state_file import LocalStateFile, DEFAULT_LOCAL_STATE_FILENAME
+from anaconda_project.plugins.provider import ProvideContext
 from anaconda_project.plugins.registry import PluginRegistry
+from anaconda_project.provide import PROVIDE_MODE_DEVELOPMENT
 from anaconda_project.plugins.requirement import UserConfigOverrides
 from anaconda_project.plugins.requirements.download import DownloadRequirement
 
@@ -181,6 +183,193 @@ def test_unzip_is_not_a_bool():
     assert len(requirements) == 0
 
 
+def test_segments():
+    problems = []
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item=dict(url='http://example.com/bar',
+                                         segments=4),
+                               problems=problems,
+                               requirements=requirements)
+    assert [] == problems
+    assert len(requirements) == 1
+    assert requirements[0].segments == 4
+
+
+def test_segments_default_to_one():
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item='http://example.com/bar',
+                               problems=[],
+                               requirements=requirements)
+    assert requirements[0].segments == 1
+
+
+def test_segments_is_not_a_positive_integer():
+    for segments in (0, -1, True, "4", 1.5):
+        problems = []
+        requirements = []
+        DownloadRequirement._parse(PluginRegistry(),
+                                   varname='FOO',
+                                   item=dict(url='http://example.com/',
+                                             segments=segments),
+                                   problems=problems,
+                                   requirements=requirements)
+        assert ["Value of 'segments' for download item FOO should be a positive integer, not {}.".format(segments)
+                ] == problems
+        assert len(requirements) == 0
+
+
+def test_keep_zip():
+    for (item, expected) in ((dict(url='http://example.com/bar.zip'), True),
+                             (dict(url='http://example.com/bar.zip', keep_zip=False), False)):
+        requirements = []
+        DownloadRequirement._parse(PluginRegistry(),
+                                   varname='FOO',
+                                   item=item,
+                                   problems=[],
+                                   requirements=requirements)
+        assert requirements[0].keep_zip is expected
+
+
+def test_keep_zip_is_not_a_bool():
+    problems = []
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item=dict(url='http://example.com/bar.zip',
+                                         keep_zip=[]),
+                               problems=problems,
+                               requirements=requirements)
+    assert ["Value of 'keep_zip' for download item FOO should be a boolean, not []."] == problems
+    assert len(requirements) == 0
+
+
+def test_verify():
+    problems = []
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item=dict(url='http://example.com/bar',
+                                         md5='12345abcdef',
+                                         verify=True),
+                               problems=problems,
+                               requirements=requirements)
+    assert [] == problems
+    assert len(requirements) == 1
+    assert requirements[0].verify
+
+
+def test_verify_is_not_a_bool():
+    problems = []
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item=dict(url='http://example.com/bar',
+                                         md5='12345abcdef',
+                                         verify=[]),
+                               problems=problems,
+                               requirements=requirements)
+    assert ["Value of 'verify' for download item FOO should be a boolean, not []."] == problems
+    assert len(requirements) == 0
+
+
+def test_verify_without_checksum():
+    problems = []
+    requirements = []
+    DownloadRequirement._parse(PluginRegistry(),
+                               varname='FOO',
+                               item=dict(url='http://example.com/bar',
+                                         verify=True),
+                               problems=problems,
+                               requirements=requirements)
+    assert ["Download item FOO has 'verify' set but no checksum to verify against."] == problems
+    assert len(requirements) == 0
+
+
+def _verifying_requirement(digest):
+    return DownloadRequirement(registry=PluginRegistry(),
+                               env_var=ENV_VAR,
+                               url='http://localhost/data.csv',
+                               filename='data.csv',
+                               hash_algorithm='md5',
+                               hash_value=digest,
+                               verify=True)
+
+
+def test_verify_existing_file_checksum(monkeypatch):
+    datafile, digest = make_file_with_checksum()
+
+    def check(dirname):
+        from anaconda_project.plugins.requirements import download
+
+        hashed = []
+        real_hash_file = download._hash_file
+
+        def mock_hash_file(filename, hash_algorithm):
+            hashed.append(filename)
+            return real_hash_file(filename, hash_algorithm)
+
+        monkeypatch.setattr('anaconda_project.plugins.requirements.download._hash_file', mock_hash_file)
+
+        local_state = LocalStateFile.load_for_directory(dirname)
+        filename = os.path.join(dirname, 'data.csv')
+        environ = {ENV_VAR: filename, 'PROJECT_DIR': dirname}
+        requirement = _verifying_requirement(digest)
+        status = requirement.check_status(environ, local_state, 'default', UserConfigOverrides())
+        assert status
+        assert 'File downloaded to {}'.format(filename) == status.status_description
+        assert [filename] == hashed
+
+        # checking status doesn't modify the local state file
+        assert dict() == LocalStateFile.load_for_directory(dirname).get_download_verification(ENV_VAR)
+
+        # but the requirement remembers the checksum
+        assert requirement.check_status(environ, local_state, 'default', UserConfigOverrides())
+        assert [filename] == hashed
+
+        # and once the provider saves it, so does a fresh load of the local state
+        context = ProvideContext(environ, local_state, 'default', status, PROVIDE_MODE_DEVELOPMENT)
+        context.save_download_verification(ENV_VAR, requirement.file_verification(filename, local_state))
+        local_state = LocalStateFile.load_for_directory(dirname)
+        assert digest == local_state.get_download_verification(ENV_VAR)['hash']
+        requirement = _verifying_requirement(digest)
+        assert requirement.check_status(environ, local_state, 'default', UserConfigOverrides())
+        assert [filename] == hashed
+
+        # until the file changes
+        with open(filename, 'w') as f:
+            f.write("corrupted")
+        status = requirement.check_status(environ, local_state, 'default', UserConfigOverrides())
+        assert not status
+        assert 'File {} does not match its md5 checksum.'.format(filename) == status.status_description
+        assert [filename, filename] == hashed
+
+    with_directory_contents({'data.csv': datafile}, check)
+
+
+def test_verify_does_not_remember_checksum_in_corrupted_local_state():
+    datafile, digest = make_file_with_checksum()
+
+    def check(dirname):
+        local_state = LocalStateFile.load_for_directory(dirname)
+        assert local_state.corrupted
+        filename = os.path.join(dirname, 'data.csv')
+        requirement = _verifying_requirement(digest)
+        environ = {ENV_VAR: filename, 'PROJECT_DIR': dirname}
+        status = requirement.check_status(environ, local_state, 'default', UserConfigOverrides())
+        assert status
+
+        context = ProvideContext(environ, local_state, 'default', status, PROVIDE_MODE_DEVELOPMENT)
+        context.save_download_verification(ENV_VAR, requirement.file_verification(filename, local_state))
+        with open(os.path.join(dirname, DEFAULT_LOCAL_STATE_FILENAME)) as f:
+            assert "[not: valid" == f.read()
+
+    with_directory_contents({'data.csv': datafile, DEFAULT_LOCAL_STATE_FILENAME: "[not: valid"}, check)
+
+
 def test_use_unzip_if_url_ends_in_zip():
     problems = []
     requirements = []
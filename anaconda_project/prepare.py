@@ -15,14 +15,18 @@ from copy import deepcopy
 
 from anaconda_project.internal.metaclass import with_metaclass
 from anaconda_project.internal import prepare_ui
+from anaconda_project.internal.parallel import parallel_map
 from anaconda_project.internal.simple_status import SimpleStatus
 from anaconda_project.internal.toposort import toposort_from_dependency_info
 from anaconda_project.internal import conda_api
+from anaconda_project.internal import prepare_cache
 from anaconda_project.internal.py2_compat import is_string
-from anaconda_project.local_state_file import LocalStateFile
+from anaconda_project.local_state_file import LocalStateFile, possible_local_state_file_names
 from anaconda_project.provide import (_all_provide_modes, PROVIDE_MODE_DEVELOPMENT)
 from anaconda_project.plugins.provider import ProvideContext
 from anaconda_project.plugins.requirement import EnvVarRequirement, UserConfigOverrides
+from anaconda_project.project_commands import CommandExecInfo
+from anaconda_project.version import version
 
 
 def _update_environ(dest, src):
@@ -443,8 +447,73 @@ def _in_provide_whitelist(provide_whitelist, requirement):
     return False
 
 
+def _prefetch(environ, mode, statuses):
+    # give each kind of provider one chance to work on all of its statuses at once
+    groups = []
+    for status in statuses:
+        for group in groups:
+            if type(group[0].provider) is type(status.provider):
+                group.append(status)
+                break
+        else:
+            groups.append([status])
+
+    for group in groups:
+        group[0].provider.prefetch(group, environ, mode)
+
+
+def _provide_concurrently(environ, local_state, default_env_spec_name, mode, statuses):
+    """Call provide() for the statuses, running independent ones at the same time.
+
+    The statuses must be sorted so dependencies come first. We run
+    them in waves; a status runs in the first wave after all the
+    statuses providing its missing env vars. Each provider gets its
+    own copy of the environment, and the changes it makes are merged
+    back in the original order once its wave is done, so the
+    resulting environ, logs, and errors don't depend on timing.
+
+    Returns:
+        tuple of (logs, errors, dict from status to ProvideResult)
+    """
+    wave_of = dict()
+    waves = []
+    for status in statuses:
+        wave = 0
+        for env_var in status.analysis.missing_env_vars_to_provide:
+            if env_var in wave_of:
+                wave = max(wave, wave_of[env_var] + 1)
+        wave_of[status.requirement.env_var] = wave
+        while len(waves) <= wave:
+            waves.append([])
+        waves[wave].append(status)
+
+    logs = []
+    errors = []
+    results_by_status = dict()
+    for wave in waves:
+
+        def provide(status):
+            context = ProvideContext(dict(environ), local_state, default_env_spec_name, status, mode)
+            result = status.provider.provide(status.requirement, context)
+            return (context.environ, result)
+
+        before = dict(environ)
+        for (status, (provided_environ, result)) in zip(wave, parallel_map(provide, wave)):
+            for (key, value) in provided_environ.items():
+                if before.get(key) != value:
+                    environ[key] = value
+            for key in before.keys():
+                if key not in provided_environ:
+                    environ.pop(key, None)
+            logs.extend(result.logs)
+            errors.extend(result.errors)
+            results_by_status[status] = result
+
+    return (logs, errors, results_by_status)
+
+
 def _configure_and_provide(project, environ, local_state, statuses, all_statuses, keep_going_until_success, mode,
-                           provide_whitelist, overrides, command, extra_command_args):
+                           provide_whitelist, overrides, command, extra_command_args, parallel_provide=False):
 
     default_env_spec_name = project.default_env_spec_name_for_command(command)
 
@@ -459,18 +528,25 @@ def _configure_and_provide(project, environ, local_state, statuses, all_statuses
         for status in sorted:
             rechecked.append(status.recheck(environ, local_state, default_env_spec_name, overrides))
 
-        logs = []
-        errors = []
-        did_any_providing = False
-        results_by_status = dict()
-
+        to_provide = []
         for status in rechecked:
             if not _in_provide_whitelist(provide_whitelist, status.requirement):
                 continue
             elif status.has_been_provided:
                 continue
             else:
-                did_any_providing = True
+                to_provide.append(status)
+
+        did_any_providing = len(to_provide) > 0
+        _prefetch(environ, mode, to_provide)
+        if parallel_provide:
+            (logs, errors, results_by_status) = _provide_concurrently(environ, local_state, default_env_spec_name, mode,
+                                                                      to_provide)
+        else:
+            logs = []
+            errors = []
+            results_by_status = dict()
+            for status in to_provide:
                 context = ProvideContext(environ, local_state, default_env_spec_name, status, mode)
                 result = status.provider.provide(status.requirement, context)
                 logs.extend(result.logs)
@@ -566,9 +642,18 @@ def _partition_first_group_to_configure(environ, local_state, statuses):
     return (head, tail)
 
 
-def _process_requirement_statuses(project, environ, local_state, current_statuses, all_statuses,
-                                  keep_going_until_success, mode, provide_whitelist, overrides, command,
-                                  extra_command_args):
+def _process_requirement_statuses(project,
+                                  environ,
+                                  local_state,
+                                  current_statuses,
+                                  all_statuses,
+                                  keep_going_until_success,
+                                  mode,
+                                  provide_whitelist,
+                                  overrides,
+                                  command,
+                                  extra_command_args,
+                                  parallel_provide=False):
     (initial, remaining) = _partition_first_group_to_configure(environ, local_state, current_statuses)
 
     # a surprising thing here is that the "stages" from
@@ -580,17 +665,36 @@ def _process_requirement_statuses(project, environ, local_state, current_statuse
     # but we always want at least one _configure_and_provide()
 
     def _stages_for(statuses):
-        return _configure_and_provide(project, environ, local_state, statuses, all_statuses, keep_going_until_success,
-                                      mode, provide_whitelist, overrides, command, extra_command_args)
+        return _configure_and_provide(project,
+                                      environ,
+                                      local_state,
+                                      statuses,
+                                      all_statuses,
+                                      keep_going_until_success,
+                                      mode,
+                                      provide_whitelist,
+                                      overrides,
+                                      command,
+                                      extra_command_args,
+                                      parallel_provide=parallel_provide)
 
     if len(initial) > 0 and len(remaining) > 0:
 
         def process_remaining(updated_all_statuses):
             # get the new status for each remaining requirement
             updated = _refresh_status_list(remaining, updated_all_statuses)
-            return _process_requirement_statuses(project, environ, local_state, updated, updated_all_statuses,
-                                                 keep_going_until_success, mode, provide_whitelist, overrides, command,
-                                                 extra_command_args)
+            return _process_requirement_statuses(project,
+                                                 environ,
+                                                 local_state,
+                                                 updated,
+                                                 updated_all_statuses,
+                                                 keep_going_until_success,
+                                                 mode,
+                                                 provide_whitelist,
+                                                 overrides,
+                                                 command,
+                                                 extra_command_args,
+                                                 parallel_provide=parallel_provide)
 
         return _after_stage_success(_stages_for(initial), process_remaining)
     elif len(initial) > 0:
@@ -640,15 +744,33 @@ def _assert_no_missing_env_var_requirements(project, environ, local_state, overr
     #     _add_missing_env_var_requirements(project, environ, local_state, overrides, command, statuses)
 
 
-def _first_stage(project, environ, local_state, statuses, keep_going_until_success, mode, provide_whitelist, overrides,
-                 command, extra_command_args):
+def _first_stage(project,
+                 environ,
+                 local_state,
+                 statuses,
+                 keep_going_until_success,
+                 mode,
+                 provide_whitelist,
+                 overrides,
+                 command,
+                 extra_command_args,
+                 parallel_provide=False):
     assert 'PROJECT_DIR' in environ
 
     _assert_no_missing_env_var_requirements(project, environ, local_state, overrides, command, statuses)
 
-    first_stage = _process_requirement_statuses(project, environ, local_state, statuses, statuses,
-                                                keep_going_until_success, mode, provide_whitelist, overrides, command,
-                                                extra_command_args)
+    first_stage = _process_requirement_statuses(project,
+                                                environ,
+                                                local_state,
+                                                statuses,
+                                                statuses,
+                                                keep_going_until_success,
+                                                mode,
+                                                provide_whitelist,
+                                                overrides,
+                                                command,
+                                                extra_command_args,
+                                                parallel_provide=parallel_provide)
 
     return first_stage
 
@@ -692,8 +814,16 @@ def _prepare_environ_and_overrides(project, environ=None, env_spec_name=None):
     return (environ_copy, overrides)
 
 
-def _internal_prepare_in_stages(project, environ_copy, overrides, keep_going_until_success, mode, provide_whitelist,
-                                command_name, command, extra_command_args):
+def _internal_prepare_in_stages(project,
+                                environ_copy,
+                                overrides,
+                                keep_going_until_success,
+                                mode,
+                                provide_whitelist,
+                                command_name,
+                                command,
+                                extra_command_args,
+                                parallel_provide=False):
     assert not project.problems
     if mode not in _all_provide_modes:
         raise ValueError("invalid provide mode " + mode)
@@ -718,8 +848,17 @@ def _internal_prepare_in_stages(project, environ_copy, overrides, keep_going_unt
                                           latest_provide_result=None)
         statuses.append(status)
 
-    return _first_stage(project, environ_copy, local_state, statuses, keep_going_until_success, mode, provide_whitelist,
-                        overrides, command, extra_command_args)
+    return _first_stage(project,
+                        environ_copy,
+                        local_state,
+                        statuses,
+                        keep_going_until_success,
+                        mode,
+                        provide_whitelist,
+                        overrides,
+                        command,
+                        extra_command_args,
+                        parallel_provide=parallel_provide)
 
 
 def prepare_in_stages(project,
@@ -730,7 +869,8 @@ def prepare_in_stages(project,
                       env_spec_name=None,
                       command_name=None,
                       command=None,
-                      extra_command_args=None):
+                      extra_command_args=None,
+                      parallel_provide=False):
     """Get a chain of all steps needed to get a project ready to execute.
 
     This function does not immediately do anything; it returns a
@@ -757,6 +897,7 @@ def prepare_in_stages(project,
         command_name (str): which named command to choose from the project, None for default
         command (ProjectCommand): command object, None for default
         extra_command_args (list of str): extra args for the command we prepare
+        parallel_provide (bool): provide independent requirements at the same time
 
     Returns:
         The first ``PrepareStage`` in the chain of steps.
@@ -772,7 +913,8 @@ def prepare_in_stages(project,
                                        provide_whitelist=provide_whitelist,
                                        command_name=command_name,
                                        command=command,
-                                       extra_command_args=extra_command_args)
+                                       extra_command_args=extra_command_args,
+                                       parallel_provide=parallel_provide)
 
 
 def _project_problems_to_prepare_failure(project, environ, overrides):
@@ -814,6 +956,126 @@ def _check_prepare_prerequisites(project, env_spec_name, command_name, command,
     return failed
 
 
+def _prepare_cache_stamped_paths(project, environ):
+    """Get paths whose modification invalidates a cached prepare, or None if we can't cache.
+
+    Services can't be cached because the service process may
+    have gone away, and we never want to write encrypted values
+    to disk.
+    """
+    from anaconda_project.plugins.requirements.conda_env import CondaEnvRequirement
+    from anaconda_project.plugins.requirements.download import DownloadRequirement
+    from anaconda_project.plugins.requirements.service import ServiceRequirement
+
+    paths = []
+    for requirement in project.requirements:
+        if isinstance(requirement, ServiceRequirement) or requirement.encrypted:
+            return None
+        value = environ.get(requirement.env_var, None)
+        if value is None:
+            continue
+        if isinstance(requirement, CondaEnvRequirement):
+            # installing or removing packages modifies conda-meta
+            paths.append(os.path.join(value, 'conda-meta'))
+        elif isinstance(requirement, DownloadRequirement):
+            paths.append(value)
+    return paths
+
+
+def _prepare_cache_key(project, environ, overrides, mode, provide_whitelist, command_name, command,
+                       extra_command_args):
+    """Fingerprint everything that can affect a prepare, or None if this prepare can't be cached."""
+    if provide_whitelist is not None:
+        return None
+
+    if command is None:
+        command = project.command_for_name(command_name)
+
+    env_spec_name = overrides.env_spec_name
+    if env_spec_name is None:
+        env_spec_name = project.default_env_spec_name_for_command(command)
+    env_spec = project.env_specs.get(env_spec_name, None)
+
+    project_file_digest = prepare_cache.file_digest(project.project_file.filename)
+    if project_file_digest is None:
+        return None
+
+    local_state_digests = [prepare_cache.file_digest(os.path.join(project.directory_path, name))
+                           for name in possible_local_state_file_names]
+
+    # we apply the cached changes on top of the current environ, so
+    # we only need the variables that could change how we prepare
+    env_var_names = set(['PATH'] + list(conda_api._all_prefix_variables))
+    for requirement in project.requirements:
+        env_var_names.add(requirement.env_var)
+    inherited = dict([(name, environ.get(name, None)) for name in env_var_names])
+
+    if command is None:
+        command_info = None
+    else:
+        command_info = dict(name=command.name, attributes=command._attributes)
+
+    return prepare_cache.fingerprint(dict(version=version,
+                                          directory=project.directory_path,
+                                          project_file=project_file_digest,
+                                          local_state=local_state_digests,
+                                          env_spec_name=env_spec_name,
+                                          env_spec_hash=(env_spec.channels_and_packages_hash
+                                                         if env_spec is not None else None),
+                                          inherited=inherited,
+                                          mode=mode,
+                                          command=command_info,
+                                          extra_command_args=extra_command_args))
+
+
+def _load_cached_prepare_result(project, cache_key, environ_copy, overrides):
+    entry = prepare_cache.load(project.directory_path, cache_key)
+    if entry is None:
+        return None
+
+    for name in entry.get('environ_unset', []):
+        environ_copy.pop(name, None)
+    environ_copy.update(entry.get('environ_set', dict()))
+
+    exec_info = entry.get('exec_info', None)
+    if exec_info is not None:
+        exec_info = CommandExecInfo(cwd=exec_info['cwd'],
+                                    args=exec_info['args'],
+                                    shell=exec_info['shell'],
+                                    env=environ_copy)
+
+    return PrepareSuccess(logs=["Using cached prepare result for %s." % project.directory_path],
+                          statuses=(),
+                          command_exec_info=exec_info,
+                          environ=environ_copy,
+                          overrides=overrides)
+
+
+def _save_cached_prepare_result(project, cache_key, initial_environ, result):
+    paths = _prepare_cache_stamped_paths(project, result.environ)
+    if paths is None:
+        return
+    stamps = prepare_cache.path_stamps(paths)
+    if stamps is None:
+        return
+
+    environ_set = dict()
+    for (name, value) in result.environ.items():
+        if initial_environ.get(name, None) != value:
+            environ_set[name] = value
+    environ_unset = [name for name in initial_environ if name not in result.environ]
+
+    exec_info = result.command_exec_info
+    if exec_info is not None:
+        exec_info = dict(cwd=exec_info.cwd, args=exec_info.args, shell=exec_info.shell)
+
+    prepare_cache.save(project.directory_path, cache_key,
+                       dict(environ_set=environ_set,
+                            environ_unset=environ_unset,
+                            exec_info=exec_info,
+                            stamps=stamps))
+
+
 def prepare_without_interaction(project,
                                 environ=None,
                                 mode=PROVIDE_MODE_DEVELOPMENT,
@@ -821,7 +1083,9 @@ def prepare_without_interaction(project,
                                 env_spec_name=None,
                                 command_name=None,
                                 command=None,
-                                extra_command_args=None):
+                                extra_command_args=None,
+                                use_cache=False,
+                                parallel_provide=False):
     """Prepare a project to run one of its commands.
 
     This method doesn't ask the user any questions, so the
@@ -853,6 +1117,19 @@ def prepare_without_interaction(project,
     result. So ``project.problems`` does not need to be checked in
     advance.
 
+    If ``use_cache`` is True, a successful result is recorded on
+    disk, and a later prepare with the same project file, local
+    state, env spec, command, and relevant environment variables
+    returns the recorded result without checking or providing
+    any requirements. A cached result has an empty ``statuses``
+    list. Projects with services or encrypted variables are never
+    cached.
+
+    If ``parallel_provide`` is True, requirements which don't
+    depend on one another are provided at the same time, for
+    example several downloads and a service. Everything else
+    still needs the project's environment first.
+
     Args:
         project (Project): from the ``load_project`` method
         environ (dict): os.environ or the previously-prepared environ; not modified in-place
@@ -862,6 +1139,8 @@ def prepare_without_interaction(project,
         command_name (str): which named command to choose from the project, None for default
         command (ProjectCommand): command object, None for default
         extra_command_args (list): extra args to include in the returned command argv
+        use_cache (bool): reuse a previous identical successful prepare, and record this one
+        parallel_provide (bool): provide independent requirements at the same time
 
     Returns:
         a ``PrepareResult`` instance, which has a ``failed`` flag
@@ -873,6 +1152,17 @@ def prepare_without_interaction(project,
     if failure is not None:
         return failure
 
+    if use_cache:
+        if environ is None:
+            environ = os.environ
+        cache_key = _prepare_cache_key(project, environ, overrides, mode, provide_whitelist, command_name, command,
+                                       extra_command_args)
+        if cache_key is not None:
+            cached = _load_cached_prepare_result(project, cache_key, environ_copy, overrides)
+            if cached is not None:
+                return cached
+        initial_environ = dict(environ_copy)
+
     stage = _internal_prepare_in_stages(project,
                                         environ_copy=environ_copy,
                                         overrides=overrides,
@@ -881,9 +1171,20 @@ def prepare_without_interaction(project,
                                         provide_whitelist=provide_whitelist,
                                         command_name=command_name,
                                         command=command,
-                                        extra_command_args=extra_command_args)
+                                        extra_command_args=extra_command_args,
+                                        parallel_provide=parallel_provide)
 
-    return prepare_execute_without_interaction(stage)
+    result = prepare_execute_without_interaction(stage)
+
+    if use_cache and not result.failed:
+        # prepare may have saved the local state file, so we
+        # recompute the key to match what the next prepare sees
+        cache_key = _prepare_cache_key(project, environ, overrides, mode, provide_whitelist, command_name, command,
+                                       extra_command_args)
+        if cache_key is not None:
+            _save_cached_prepare_result(project, cache_key, initial_environ, result)
+
+    return result
 
 
 def prepare_with_browser_ui(project,
@@ -26,6 +26,8 @@ from anaconda_project.plugins.providers.conda_env import _remove_env_path
 from anaconda_project.internal.simple_status import SimpleStatus
 import anaconda_project.conda_manager as conda_manager
 from anaconda_project.internal.conda_api import parse_spec
+from anaconda_project.internal.parallel import parallel_map
+from anaconda_project.internal.toposort import toposort_from_dependency_info
 import anaconda_project.internal.notebook_analyzer as notebook_analyzer
 
 _default_projectignore = """
@@ -615,6 +617,120 @@ def remove_packages(project, env_spec_name, packages):
     return status
 
 
+def _env_spec_groups(env_specs):
+    """Group env specs which inherit from each other, parents first.
+
+    Every named env spec inherits from the global base env spec,
+    so that doesn't link specs; two specs are in the same group if
+    one of them inherits from the other, directly or indirectly.
+
+    Returns:
+        list of lists of env spec names
+    """
+    group_of = dict((name, set([name])) for name in env_specs.keys())
+
+    def ancestor_names(spec):
+        for parent in spec.inherit_from:
+            if parent.name is not None and parent.name in env_specs:
+                yield parent.name
+                for name in ancestor_names(parent):
+                    yield name
+
+    for (name, spec) in env_specs.items():
+        for ancestor in ancestor_names(spec):
+            merged = group_of[name] | group_of[ancestor]
+            for member in merged:
+                group_of[member] = merged
+
+    groups = []
+    seen = set()
+    for name in sorted(env_specs.keys()):
+        if name in seen:
+            continue
+        members = sorted(group_of[name])
+        seen.update(members)
+        groups.append(toposort_from_dependency_info(members,
+                                                    get_node_key=lambda member: member,
+                                                    get_dependency_keys=lambda member: list(ancestor_names(
+                                                        env_specs[member]))))
+    return groups
+
+
+def prepare_all_env_specs(project, max_workers=None):
+    """Create or update the environments for every env spec in the project.
+
+    Deviations are computed for all env specs up front. Env specs
+    which inherit from one another are provisioned in order,
+    parents first, while unrelated env specs are provisioned in
+    parallel, with at most ``max_workers`` conda operations
+    running at once.
+
+    This is useful on a build machine, to provision a project for
+    any command it might run; ``prepare_without_interaction()``
+    only sets up the env spec for a single command.
+
+    Args:
+        project (Project): the project
+        max_workers (int): maximum number of environments to update at once, None for a default
+
+    Returns:
+        a ``Status`` instance, if failed has ``errors``
+    """
+    failed = project.problems_status()
+    if failed is not None:
+        return failed
+
+    manager = conda_manager.new_conda_manager()
+    env_specs = project.env_specs
+    prefixes = dict((name, spec.path(project.directory_path)) for (name, spec) in env_specs.items())
+
+    def find_deviations(name):
+        try:
+            return (manager.find_environment_deviations(prefixes[name], env_specs[name]), None)
+        except conda_manager.CondaManagerError as e:
+            return (None, str(e))
+
+    names = sorted(env_specs.keys())
+    deviations = dict(zip(names, parallel_map(find_deviations, names, max_workers=max_workers)))
+
+    def provision_group(group):
+        logs = []
+        errors = []
+        for name in group:
+            (found, error) = deviations[name]
+            if error is not None:
+                errors.append(error)
+            elif found.ok:
+                logs.append("Environment '%s' is up to date in %s." % (name, prefixes[name]))
+            else:
+                logs.append("Updating environment '%s' in %s: %s" % (name, prefixes[name], found.summary))
+                try:
+                    manager.fix_environment_deviations(prefixes[name], env_specs[name], found)
+                except conda_manager.CondaManagerError as e:
+                    errors.append(str(e))
+        return (logs, errors)
+
+    logs = []
+    errors = []
+    # the results come back in group order, so the logs don't depend on timing
+    for (group_logs, group_errors) in parallel_map(provision_group,
+                                                   _env_spec_groups(env_specs),
+                                                   max_workers=max_workers):
+        logs.extend(group_logs)
+        errors.extend(group_errors)
+
+    if len(errors) > 0:
+        return SimpleStatus(success=False,
+                            description="Failed to prepare all environments.",
+                            logs=logs,
+                            errors=errors)
+    else:
+        return SimpleStatus(success=True,
+                            description="Prepared %d environments." % len(env_specs),
+                            logs=logs,
+                            errors=errors)
+
+
 def _prepare_env_prefix(project, env_spec_name):
     failed = project.problems_status()
     if failed is not None:
@@ -1144,27 +1260,61 @@ def clean(project, prepare_result):
         return SimpleStatus(success=False, description="Failed to clean everything up.", logs=logs, errors=errors)
 
 
-def archive(project, filename):
+def archive(project,
+            filename,
+            compression_level=None,
+            threads=None,
+            fileobj=None,
+            reproducible=False,
+            delta=False,
+            record_manifest=False):
     """Make an archive of the non-ignored files in the project.
 
+    Files which are already compressed, such as images or zip files,
+    are stored in zip archives without compressing them again.
+
     Args:
         project (``Project``): the project
-        filename (str): name of a zip, tar.gz, or tar.bz2 archive file
+        filename (str): name of a zip, tar.gz, tar.bz2, or tar.xz archive file
+        compression_level (int): 0 (fastest) to 9 (smallest), None for the format's default
+        threads (int): most threads to compress with, None for a default
+        fileobj (file): write the archive here, such as to a pipe, rather than to filename;
+            filename then only picks the format
+        reproducible (bool): give every file the same time, owner, and permissions (but for
+            being executable), so unchanged files always make the same archive
+        delta (bool): only archive the files changed or added since the last archive of
+            the project with a recorded manifest, and a list of the files deleted since;
+            ``unarchive`` with apply_delta applies it on top of the project unpacked from
+            that last archive
+        record_manifest (bool): remember which files were archived, so the next archive
+            can be a delta; this hashes every file changed since the last recorded manifest
 
     Returns:
         a ``Status``, if failed has ``errors``
     """
-    return archiver._archive_project(project, filename)
+    return archiver._archive_project(project,
+                                     filename,
+                                     compression_level=compression_level,
+                                     threads=threads,
+                                     fileobj=fileobj,
+                                     reproducible=reproducible,
+                                     delta=delta,
+                                     record_manifest=record_manifest)
 
 
-def unarchive(filename, project_dir, parent_dir=None):
+def unarchive(filename, project_dir, parent_dir=None, apply_delta=False):
     """Unpack an archive of the project.
 
+    With apply_delta, a delta archive (see ``archive``) is applied
+    to the existing project_dir instead of unpacking a fresh copy.
+    Without it, delta archives are refused.
+
     The archive can be untrusted (we will safely defeat attempts
     to put evil links in it, for example), but this function
     doesn't load or validate the unpacked project.
 
-    The target directory must not exist or it's an error.
+    The target directory must not exist or it's an error, unless
+    applying a delta archive.
 
     project_dir can be None to auto-choose one.
 
@@ -1172,28 +1322,36 @@ def unarchive(filename, project_dir, parent_dir=None):
     if project_dir is None.
 
     Args:
-        filename (str): name of a zip, tar.gz, or tar.bz2 archive file
+        filename (str): name of a zip, tar.gz, tar.bz2, or tar.xz archive file
         project_dir (str): the directory to place the project inside
         parent_dir (str): directory to place project_dir within
+        apply_delta (bool): apply a delta archive to the existing project_dir
 
     Returns:
         a ``Status``, if failed has ``errors``, on success has ``project_dir`` property.
 
     """
-    return archiver._unarchive_project(filename, project_dir=project_dir, parent_dir=parent_dir)
+    return archiver._unarchive_project(filename,
+                                       project_dir=project_dir,
+                                       parent_dir=parent_dir,
+                                       apply_delta=apply_delta)
 
 
-def upload(project, site=None, username=None, token=None, log_level=None):
+def upload(project, site=None, username=None, token=None, log_level=None, force=False):
     """Upload the project to the Anaconda server.
 
     The returned status; if successful, has a 'url' attribute with the project URL.
 
+    If the project hasn't changed since it was last uploaded from
+    this directory, it isn't uploaded again unless force is True.
+
     Args:
         project (``Project``): the project
         site (str): site alias from Anaconda config
         username (str): Anaconda username
         token (str): Anaconda auth token
         log_level (str): Anaconda log level
+        force (bool): upload even if the project hasn't changed since the last upload
 
     Returns:
         a ``Status``, if failed has ``errors``
@@ -1209,16 +1367,22 @@ def upload(project, site=None, username=None, token=None, log_level=None):
     tmp_tarfile = tempfile.NamedTemporaryFile(delete=False, prefix="anaconda_upload_", suffix=suffix)
     tmp_tarfile.close()  # immediately un-use it to avoid file-in-use errors on Windows
     try:
-        status = archive(project, tmp_tarfile.name)
+        # a reproducible archive has the same hash if nothing changed,
+        # so we can tell whether the last upload is still current
+        status = archiver._archive_project(project, tmp_tarfile.name, reproducible=True)
         if not status:
             return status
+        # the archiver already counted and hashed what it wrote
         status = client._upload(project,
                                 tmp_tarfile.name,
                                 uploaded_basename=(project.name + suffix),
                                 site=site,
                                 username=username,
                                 token=token,
-                                log_level=log_level)
+                                log_level=log_level,
+                                file_count=len(status.manifest),
+                                md5=status.md5,
+                                force=force)
         return status
     finally:
         os.remove(tmp_tarfile.name)
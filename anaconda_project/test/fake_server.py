@@ -6,6 +6,8 @@
 # ----------------------------------------------------------------------------
 from __future__ import absolute_import, print_function
 
+import base64
+import hashlib
 import json
 import socket
 import sys
@@ -74,8 +76,12 @@ class ProjectViewHandler(RequestHandler):
             else:
                 self.set_status(status_code=404)
         elif path == 'fake_s3':
+            self.application.server.s3_attempts += 1
             if 's3' in self.application.server.fail_these:
                 self.set_status(501)
+            elif 's3_busy' in self.application.server.fail_these and self.application.server.s3_attempts == 1:
+                # a problem worth trying again for
+                self.set_status(503)
             else:
                 if self.get_body_argument('x-should-be-passed-back-to-us') != '12345':
                     print("form_data for s3 wasn't sent", file=sys.stderr)
@@ -86,6 +92,10 @@ class ProjectViewHandler(RequestHandler):
                     fileinfo = self.request.files['file'][0]
                     assert fileinfo['filename'] == self.application.server.expected_basename
                     assert len(fileinfo['body']) > 100  # shouldn't be some tiny or empty thing
+                    md5 = base64.b64encode(hashlib.md5(fileinfo['body']).digest()).decode('ascii')
+                    if self.get_body_argument('Content-MD5') != md5:
+                        print("Content-MD5 doesn't match the file", file=sys.stderr)
+                        self.set_status(status_code=400)
         else:
             self.set_status(status_code=404)
 
@@ -105,6 +115,7 @@ class FakeAnacondaServer(object):
 
         self.fail_these = fail_these
         self.expected_basename = expected_basename
+        self.s3_attempts = 0
         self._application = FakeAnacondaApplication(server=self, io_loop=io_loop)
         self._http = HTTPServer(self._application, io_loop=io_loop)
 
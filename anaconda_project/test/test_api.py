@@ -83,7 +83,9 @@ def _test_prepare_without_interaction(monkeypatch, api_method, provide_mode):
                   env_spec_name='someenv',
                   command_name='foo',
                   command=1234,
-                  extra_command_args=['1', '2'])
+                  extra_command_args=['1', '2'],
+                  use_cache=True,
+                  parallel_provide=True)
     result = getattr(p, api_method)(**kwargs)
     assert 42 == result
     assert params['kwargs']['mode'] == provide_mode
@@ -390,6 +392,26 @@ def test_remove_packages(monkeypatch):
     assert kwargs == params['kwargs']
 
 
+def test_prepare_all_env_specs(monkeypatch):
+    import anaconda_project.project_ops as project_ops
+    _verify_args_match(api.AnacondaProject.prepare_all_env_specs, project_ops.prepare_all_env_specs)
+
+    params = dict(args=(), kwargs=dict())
+
+    def mock_prepare_all_env_specs(*args, **kwargs):
+        params['args'] = args
+        params['kwargs'] = kwargs
+        return 42
+
+    monkeypatch.setattr('anaconda_project.project_ops.prepare_all_env_specs', mock_prepare_all_env_specs)
+
+    p = api.AnacondaProject()
+    kwargs = dict(project=43, max_workers=3)
+    result = p.prepare_all_env_specs(**kwargs)
+    assert 42 == result
+    assert kwargs == params['kwargs']
+
+
 def test_add_command(monkeypatch):
     import anaconda_project.project_ops as project_ops
     _verify_args_match(api.AnacondaProject.add_command, project_ops.add_command)
@@ -532,7 +554,14 @@ def test_archive(monkeypatch):
     monkeypatch.setattr('anaconda_project.project_ops.archive', mock_archive)
 
     p = api.AnacondaProject()
-    kwargs = dict(project=43, filename=123)
+    kwargs = dict(project=43,
+                  filename=123,
+                  compression_level=1,
+                  threads=2,
+                  fileobj=44,
+                  reproducible=True,
+                  delta=True,
+                  record_manifest=True)
     result = p.archive(**kwargs)
     assert 42 == result
     assert kwargs == params['kwargs']
@@ -552,7 +581,7 @@ def test_unarchive(monkeypatch):
     monkeypatch.setattr('anaconda_project.project_ops.unarchive', mock_unarchive)
 
     p = api.AnacondaProject()
-    kwargs = dict(filename=43, project_dir=123, parent_dir=456)
+    kwargs = dict(filename=43, project_dir=123, parent_dir=456, apply_delta=True)
     result = p.unarchive(**kwargs)
     assert 42 == result
     assert kwargs == params['kwargs']
@@ -572,7 +601,7 @@ def test_upload(monkeypatch):
     monkeypatch.setattr('anaconda_project.project_ops.upload', mock_upload)
 
     p = api.AnacondaProject()
-    kwargs = dict(project=43, site=123, token=456, username=789, log_level='LOTS')
+    kwargs = dict(project=43, site=123, token=456, username=789, log_level='LOTS', force=True)
     result = p.upload(**kwargs)
     assert 42 == result
     assert kwargs == params['kwargs']
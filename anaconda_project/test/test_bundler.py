@@ -7,6 +7,8 @@
 from __future__ import absolute_import, print_function
 
 import os
+import subprocess
+import zipfile
 
 from anaconda_project import archiver
 from anaconda_project import project_ops
@@ -159,3 +161,247 @@ def test_file_pattern_matcher_with_directories():
     tests['/foo/'] = tests['/foo']
 
     _test_file_pattern_matcher(tests, is_directory=True)
+
+
+def test_file_pattern_matcher_glob_characters():
+    tests = {
+        'fo?': {
+            'yes': ['foo', 'bar/fox', 'fox/bar'],
+            'no': ['fo', 'fooo', 'fo/o']
+        },
+        '*.py[cod]': {
+            'yes': ['foo.pyc', 'bar/foo.pyo', 'foo.pyd/bar'],
+            'no': ['foo.py', 'foo.pyx', 'foo.pyc.txt']
+        },
+        '/data[!0-9]': {
+            'yes': ['datax', 'datax/foo'],
+            'no': ['data1', 'data', 'foo/datax']
+        },
+        '/a*c': {
+            'yes': ['abc', 'ab/c', 'ab/c/d'],
+            'no': ['abcd', 'x/abc']
+        },
+        '[oops': {
+            'yes': ['[oops', 'foo/[oops'],
+            'no': ['oops']
+        }
+    }
+
+    _test_file_pattern_matcher(tests, is_directory=False)
+
+
+def test_pattern_matcher_combines_patterns():
+    class FakeInfo(object):
+        def __init__(self, path, is_directory):
+            self.unixified_relative_path = path
+            self.is_directory = is_directory
+
+    patterns = [archiver._FilePattern(s) for s in ('/envs', '__pycache__/', '*.pyc', '/data/*.csv')]
+    matcher = archiver._PatternMatcher(patterns)
+
+    matched = ['envs', 'envs/default/bin/python', 'foo.pyc', 'src/foo.pyc', 'data/big.csv', 'data/x/big.csv']
+    not_matched = ['foo.py', 'src/envs', 'csv/data/big.csv', 'data.csv', 'src/__pycache__']
+    assert matched == [path for path in matched if matcher.matches(FakeInfo(path, False))]
+    assert [] == [path for path in not_matched if matcher.matches(FakeInfo(path, False))]
+    assert matcher.matches(FakeInfo('src/__pycache__', True))
+
+    assert not archiver._PatternMatcher([]).matches(FakeInfo('foo', True))
+    assert not archiver._PatternMatcher([archiver._FilePattern('foo/')]).matches(FakeInfo('foo', False))
+
+
+def test_walk_project():
+    def check(dirname):
+        if hasattr(os, 'symlink'):
+            os.symlink(os.path.join(dirname, 'a'), os.path.join(dirname, 'link'))
+        os.makedirs(os.path.join(dirname, 'empty'))
+
+        walked = []
+
+        def ignore_filter(info):
+            walked.append(info.relative_path)
+            return info.basename == 'ignored'
+
+        infos = list(archiver._walk_project(dirname, ignore_filter))
+        by_path = dict((info.unixified_relative_path, info) for info in infos)
+
+        expected = ['a', 'a/b', 'a/b/c.txt', 'a/d.txt', 'empty', 'top.txt']
+        if hasattr(os, 'symlink'):
+            expected.append('link')
+            # not followed, and archived as a leaf
+            assert by_path['link'].is_directory
+            assert by_path['link'].is_leaf
+        assert sorted(expected) == sorted(by_path.keys())
+        assert len(infos) == len(by_path)
+
+        # we never looked inside the ignored directory
+        assert os.path.join('ignored', 'x.txt') not in walked
+
+        # directories come after their contents
+        paths = [info.unixified_relative_path for info in infos]
+        assert paths.index('a/b/c.txt') < paths.index('a/b') < paths.index('a')
+
+        assert by_path['empty'].is_leaf
+        assert not by_path['a'].is_leaf
+        assert not by_path['a/b'].is_leaf
+        assert by_path['a/d.txt'].is_leaf
+        assert not by_path['a/d.txt'].is_directory
+        assert by_path['a/d.txt'].stat.st_size == 5
+        assert by_path['a/d.txt'].full_path == os.path.join(dirname, 'a', 'd.txt')
+
+        assert ['a/b/c.txt', 'a/d.txt', 'empty', 'top.txt'] == [
+            info.unixified_relative_path for info in archiver._leaf_infos(infos) if info.basename != 'link'
+        ]
+
+    with_directory_contents({'top.txt': 'top',
+                             'a/d.txt': 'hello',
+                             'a/b/c.txt': 'hi',
+                             'ignored/x.txt': 'nope'}, check)
+
+
+def test_walk_project_directory_with_only_ignored_contents_is_a_leaf():
+    def check(dirname):
+        infos = list(archiver._walk_project(dirname, lambda info: info.basename.endswith('.pyc')))
+        assert ['a'] == [info.relative_path for info in archiver._leaf_infos(infos)]
+
+    with_directory_contents({'a/foo.pyc': ''}, check)
+
+
+def test_walk_project_skips_unreadable_subdirectory(monkeypatch):
+    def check(dirname):
+        real_scandir = archiver.scandir
+
+        def mock_scandir(path):
+            if path.endswith('secret'):
+                raise OSError("NOPE")
+            return real_scandir(path)
+
+        monkeypatch.setattr('anaconda_project.archiver.scandir', mock_scandir)
+        infos = list(archiver._walk_project(dirname, lambda info: False))
+        assert ['public.txt', 'secret'] == sorted(info.relative_path for info in infos)
+
+    with_directory_contents({'public.txt': '', 'secret/private.txt': ''}, check)
+
+
+def test_git_pathspec_excludes():
+    patterns = [archiver._FilePattern(s)
+                for s in ('/envs', '/services', '*.pyc', '__pycache__/', '/data/', '/a*', 'foo', '/')]
+    assert [':(exclude)envs', ':(exclude)services'] == archiver._git_pathspec_excludes(patterns)
+
+
+def test_iterate_project_uses_git_files(monkeypatch):
+    # give git the empty directory candidates a couple at a time
+    monkeypatch.setattr('anaconda_project.archiver._GIT_PATHSPECS_PER_COMMAND', 2)
+
+    def check(dirname):
+        subprocess.check_output(['git', 'init', '-q'], cwd=dirname)
+        subprocess.check_output(['git', 'add', 'tracked.py', 'deleted.py'], cwd=dirname)
+        os.remove(os.path.join(dirname, 'deleted.py'))
+        for empty in ('empty/nested', 'sub/empty', 'logs', 'bigdata/empty'):
+            os.makedirs(os.path.join(dirname, empty))
+
+        errors = []
+        infos = list(archiver._iterate_project(dirname, errors, requirements=[]))
+        assert [] == errors
+        paths = sorted(info.unixified_relative_path for info in infos)
+        # the .projectignore ignores __pycache__ dirs, even though git only lists files,
+        # and we find the empty directories git doesn't ignore
+        assert ['.gitignore', '.projectignore', 'empty', 'empty/nested', 'sub', 'sub/empty', 'sub/untracked.py',
+                'tracked.py'] == paths
+        assert ['.gitignore', '.projectignore', 'empty/nested', 'sub/empty', 'sub/untracked.py',
+                'tracked.py'] == [info.unixified_relative_path for info in archiver._leaf_infos(infos)]
+        # directories come after everything inside them
+        order = [info.unixified_relative_path for info in infos]
+        assert order.index('sub') > order.index('sub/empty')
+        assert order.index('sub') > order.index('sub/untracked.py')
+        assert order.index('empty') > order.index('empty/nested')
+
+    with_directory_contents(
+        {
+            '.gitignore': "/ignored.py\n/bigdata\n/logs/\n",
+            '.projectignore': "__pycache__/\n",
+            'tracked.py': '',
+            'deleted.py': '',
+            'ignored.py': '',
+            'bigdata/huge.csv': '',
+            'sub/untracked.py': '',
+            'sub/__pycache__/untracked.pyc': ''
+        }, check)
+
+
+def test_iterate_project_walks_directories_git_lists(monkeypatch):
+    def check(dirname):
+        monkeypatch.setattr('anaconda_project.archiver._git_project_files',
+                            lambda project_directory, patterns, errors: ['module', 'top.py'])
+        errors = []
+        infos = list(archiver._iterate_project(dirname, errors, requirements=[]))
+        assert [] == errors
+        assert ['module/inside.py', 'top.py'] == [info.unixified_relative_path for info in archiver._leaf_infos(infos)]
+
+    with_directory_contents({'.git/config': '', 'top.py': '', 'module/inside.py': ''}, check)
+
+
+def _write_zip_and_read_back(dirname):
+    errors = []
+    infos = archiver._enumerate_archive_files(os.path.join(dirname, 'proj'), errors, requirements=[])
+    assert [] == errors
+    filename = os.path.join(dirname, 'out.zip')
+    with open(filename, 'wb') as f:
+        archiver._write_zip('proj', infos, archiver._HashingWriter(f), logs=[])
+    with zipfile.ZipFile(filename) as zf:
+        assert zf.testzip() is None
+        return dict((info.filename, (info.compress_type, zf.read(info.filename))) for info in zf.infolist())
+
+
+_ZIP_WRITER_PROJECT = {
+    'proj/text.txt': 'hello ' * 1000,
+    'proj/picture.png': 'not really a png',
+    'proj/tiny.txt': 'x',
+    'proj/empty/.keep': ''
+}
+
+
+def _check_zip_writer_members(members):
+    assert {
+        'proj/text.txt': (zipfile.ZIP_DEFLATED, b'hello ' * 1000),
+        'proj/picture.png': (zipfile.ZIP_STORED, b'not really a png'),
+        'proj/tiny.txt': (zipfile.ZIP_STORED, b'x'),
+        'proj/empty/': (zipfile.ZIP_STORED, b'')
+    } == members
+
+
+def test_write_zip():
+    def check(dirname):
+        os.remove(os.path.join(dirname, 'proj', 'empty', '.keep'))
+        _check_zip_writer_members(_write_zip_and_read_back(dirname))
+
+        # readers which don't seek, such as Java's ZipInputStream, need
+        # the CRC and sizes in the local header, not a data descriptor
+        with zipfile.ZipFile(os.path.join(dirname, 'out.zip')) as zf:
+            with open(os.path.join(dirname, 'out.zip'), 'rb') as f:
+                for info in zf.infolist():
+                    assert 0 == info.flag_bits & 0x08
+                    f.seek(info.header_offset)
+                    header = archiver._ZIP_LOCAL_HEADER.unpack(f.read(archiver._ZIP_LOCAL_HEADER.size))
+                    assert (info.CRC, info.compress_size, info.file_size) == header[7:10]
+
+    with_directory_contents(_ZIP_WRITER_PROJECT, check)
+
+
+def test_zip_encoded_filename():
+    assert (b'proj/a.txt', 0) == archiver._zip_encoded_filename(zipfile.ZipInfo(u'proj/a.txt'))
+    name = u'proj/café.txt'
+    assert (name.encode('utf-8'), 0x800) == archiver._zip_encoded_filename(zipfile.ZipInfo(name))
+
+
+def test_write_zip64(monkeypatch):
+    # make every size, offset and count need the zip64 extensions
+    monkeypatch.setattr('anaconda_project.archiver._ZIP64_LIMIT', 10)
+    monkeypatch.setattr('anaconda_project.archiver._ZIP_COUNT_LIMIT', 1)
+
+    def check(dirname):
+        os.remove(os.path.join(dirname, 'proj', 'empty', '.keep'))
+        _check_zip_writer_members(_write_zip_and_read_back(dirname))
+        with open(os.path.join(dirname, 'out.zip'), 'rb') as f:
+            assert b'PK\x06\x06' in f.read()
+
+    with_directory_contents(_ZIP_WRITER_PROJECT, check)
@@ -8,6 +8,9 @@ from __future__ import absolute_import, print_function
 
 import os
 
+import pytest
+import requests
+
 import anaconda_project.project_ops as project_ops
 from anaconda_project.client import _upload, _Client
 from anaconda_project.test.fake_server import fake_server
@@ -129,3 +132,87 @@ def test_upload_failing_commit(monkeypatch):
             assert '501' in status.errors[0]
 
     with_directory_contents(dict(), check)
+
+
+def test_upload_with_manifest_and_md5_from_archiver(monkeypatch):
+    def check(dirname):
+        with fake_server(monkeypatch, expected_basename='foo.zip'):
+            project = project_ops.create(dirname)
+            archivefile = os.path.join(dirname, "tmp.zip")
+            archive_status = project_ops.archive(project, archivefile)
+            assert archive_status
+
+            def no_rereading(*args, **kwargs):
+                raise AssertionError("the archive shouldn't be read again")
+
+            monkeypatch.setattr('binstar_client.utils.compute_hash', no_rereading)
+            monkeypatch.setattr('anaconda_project.client._Client._file_count', no_rereading)
+
+            # the fake server checks the Content-MD5
+            status = _upload(project,
+                             archivefile,
+                             "foo.zip",
+                             site='unit_test',
+                             file_count=len(archive_status.manifest),
+                             md5=archive_status.md5)
+            assert status
+
+    with_directory_contents(dict(), check)
+
+
+def test_upload_retries_busy_s3(monkeypatch):
+    def check(dirname):
+        monkeypatch.setattr('anaconda_project.client._S3_RETRY_DELAYS', (0, 0))
+        with fake_server(monkeypatch, expected_basename='foo.zip', fail_these=('s3_busy', )):
+            project = project_ops.create(dirname)
+            archivefile = os.path.join(dirname, "tmp.zip")
+            project_ops.archive(project, archivefile)
+
+            status = _upload(project, archivefile, "foo.zip", site='unit_test')
+            assert status
+
+    with_directory_contents(dict(), check)
+
+
+def test_upload_retries_dropped_connection(monkeypatch):
+    def check(dirname):
+        monkeypatch.setattr('anaconda_project.client._S3_RETRY_DELAYS', (0, 0))
+        real_post = _Client._post_to_s3
+        attempts = []
+
+        def flaky_post(self, *args, **kwargs):
+            attempts.append(args)
+            if len(attempts) < 3:
+                raise requests.exceptions.ConnectionError("connection reset")
+            return real_post(self, *args, **kwargs)
+
+        monkeypatch.setattr('anaconda_project.client._Client._post_to_s3', flaky_post)
+        with fake_server(monkeypatch, expected_basename='foo.zip'):
+            project = project_ops.create(dirname)
+            archivefile = os.path.join(dirname, "tmp.zip")
+            project_ops.archive(project, archivefile)
+
+            status = _upload(project, archivefile, "foo.zip", site='unit_test')
+            assert status
+            assert len(attempts) == 3
+
+    with_directory_contents(dict(), check)
+
+
+def test_upload_gives_up_after_retries(monkeypatch):
+    def check(dirname):
+        monkeypatch.setattr('anaconda_project.client._S3_RETRY_DELAYS', (0, ))
+
+        def dead_post(self, *args, **kwargs):
+            raise requests.exceptions.ConnectionError("connection reset")
+
+        monkeypatch.setattr('anaconda_project.client._Client._post_to_s3', dead_post)
+        with fake_server(monkeypatch, expected_basename='foo.zip'):
+            project = project_ops.create(dirname)
+            archivefile = os.path.join(dirname, "tmp.zip")
+            project_ops.archive(project, archivefile)
+
+            with pytest.raises(requests.exceptions.ConnectionError):
+                _upload(project, archivefile, "foo.zip", site='unit_test')
+
+    with_directory_contents(dict(), check)
@@ -110,3 +110,20 @@ def test_run_state_must_be_dict():
         assert "service state should be a dict" in repr(excinfo.value)
 
     with_directory_contents(dict(), check_cannot_use_non_dict)
+
+
+def test_modify_download_verification():
+    def check_file(dirname):
+        local_state_file = LocalStateFile.load_for_directory(dirname)
+        assert dict() == local_state_file.get_download_verification("DATAFILE")
+        local_state_file.set_download_verification("DATAFILE", dict(size=4, hash="abc"))
+        local_state_file.save()
+
+        local_state_file2 = LocalStateFile.load_for_directory(dirname)
+        assert dict(size=4, hash="abc") == local_state_file2.get_download_verification("DATAFILE")
+
+        with pytest.raises(ValueError) as excinfo:
+            local_state_file.set_download_verification("DATAFILE", 42)
+        assert "download verification should be a dict" in repr(excinfo.value)
+
+    with_directory_contents(dict(), check_file)
@@ -12,6 +12,8 @@ import platform
 import pytest
 import subprocess
 import sys
+import threading
+import time
 
 from anaconda_project.test.environ_utils import minimal_environ, strip_environ
 from anaconda_project.test.project_utils import project_no_dedicated_env
@@ -380,6 +382,138 @@ commands:
 """}, check)
 
 
+def test_prepare_use_cache():
+    def check(dirname):
+        project = project_no_dedicated_env(dirname)
+        environ = minimal_environ(FOO='bar')
+        result = prepare_without_interaction(project, environ=environ, command_name='foo', use_cache=True)
+        assert result.errors == []
+        assert result
+        assert len(result.statuses) > 0
+        assert os.path.isfile(os.path.join(dirname, "envs", ".prepare-cache.json"))
+
+        cached = prepare_without_interaction(project, environ=environ, command_name='foo', use_cache=True)
+        assert cached
+        assert cached.statuses == ()
+        assert cached.logs == ["Using cached prepare result for %s." % dirname]
+        assert cached.environ == result.environ
+        assert cached.command_exec_info.args == result.command_exec_info.args
+        assert cached.command_exec_info.cwd == result.command_exec_info.cwd
+        assert cached.command_exec_info.env is cached.environ
+        assert dict(FOO='bar') == strip_environ(environ)
+
+        # a relevant env var change is a cache miss
+        environ = minimal_environ(FOO='baz')
+        result = prepare_without_interaction(project, environ=environ, command_name='foo', use_cache=True)
+        assert len(result.statuses) > 0
+        assert result.environ['FOO'] == 'baz'
+
+        # a different command is a cache miss
+        result = prepare_without_interaction(project, environ=environ, command_name='bar', use_cache=True)
+        assert len(result.statuses) > 0
+
+        # not using the cache doesn't use it
+        result = prepare_without_interaction(project, environ=environ, command_name='bar')
+        assert len(result.statuses) > 0
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: """
+variables:
+  FOO: {}
+commands:
+  foo:
+    unix: echo foo
+    windows: echo foo
+  bar:
+    unix: echo bar
+    windows: echo bar
+"""}, check)
+
+
+def test_prepare_use_cache_not_with_encrypted_variable():
+    def check(dirname):
+        project = project_no_dedicated_env(dirname)
+        environ = minimal_environ(FOO_PASSWORD='bar')
+        result = prepare_without_interaction(project, environ=environ, use_cache=True)
+        assert result
+        assert not os.path.exists(os.path.join(dirname, "envs", ".prepare-cache.json"))
+
+        result = prepare_without_interaction(project, environ=environ, use_cache=True)
+        assert len(result.statuses) > 0
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: """
+variables:
+  FOO_PASSWORD: {}
+"""}, check)
+
+
+def test_prepare_use_cache_project_file_changed():
+    def check(dirname):
+        project = project_no_dedicated_env(dirname)
+        environ = minimal_environ(FOO='bar')
+        result = prepare_without_interaction(project, environ=environ, use_cache=True)
+        assert len(result.statuses) > 0
+
+        project.project_file.set_value(['variables', 'BAR'], dict())
+        project.project_file.save()
+        environ = minimal_environ(FOO='bar', BAR='baz')
+        result = prepare_without_interaction(project, environ=environ, use_cache=True)
+        assert result
+        assert len(result.statuses) > 0
+        assert result.environ['BAR'] == 'baz'
+
+        result = prepare_without_interaction(project, environ=environ, use_cache=True)
+        assert result.statuses == ()
+        assert result.environ['BAR'] == 'baz'
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: """
+variables:
+  FOO: {}
+"""}, check)
+
+
+def test_prepare_parallel_provide(monkeypatch):
+    from anaconda_project.plugins.provider import EnvVarProvider
+    monkeypatch.setattr('anaconda_project.internal.parallel.default_max_workers', lambda: 4)
+    real_provide = EnvVarProvider.provide
+    threads_by_env_var = dict()
+
+    def mock_provide(self, requirement, context):
+        threads_by_env_var[requirement.env_var] = threading.current_thread()
+        time.sleep(0.05)
+        return real_provide(self, requirement, context)
+
+    monkeypatch.setattr('anaconda_project.plugins.provider.EnvVarProvider.provide', mock_provide)
+
+    def check(dirname):
+        project = project_no_dedicated_env(dirname)
+        environ = minimal_environ()
+        sequential = prepare_without_interaction(project, environ=environ)
+        assert sequential
+        assert threading.current_thread() == threads_by_env_var['FOO']
+        threads_by_env_var.clear()
+
+        result = prepare_without_interaction(project, environ=environ, parallel_provide=True)
+        assert result.errors == []
+        assert result
+        # independent variables were provided on different threads
+        assert threads_by_env_var['FOO'] != threads_by_env_var['BAR']
+        # and we end up with the same thing we get sequentially
+        assert sequential.environ == result.environ
+        assert sequential.logs == result.logs
+        assert dict(FOO='a', BAR='b', BAZ='c', PROJECT_DIR=dirname) == strip_environ(result.environ)
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: """
+variables:
+  FOO: { default: "a" }
+  BAR: { default: "b" }
+  BAZ: { default: "c" }
+"""}, check)
+
+
 def test_update_environ():
     def prepare_then_update_environ(dirname):
         project = project_no_dedicated_env(dirname)
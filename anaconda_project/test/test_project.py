@@ -243,10 +243,10 @@ def test_project_dir_not_readable(monkeypatch):
         project_dir = os.path.join(dirname, 'foo')
         os.makedirs(project_dir)
 
-        def mock_os_walk(dirname):
+        def mock_scandir(dirname):
             raise OSError("NOPE")
 
-        monkeypatch.setattr('os.walk', mock_os_walk)
+        monkeypatch.setattr('anaconda_project.archiver.scandir', mock_scandir)
 
         project = Project(project_dir)
 
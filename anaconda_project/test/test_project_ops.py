@@ -7,10 +7,13 @@
 from __future__ import absolute_import, print_function
 
 import codecs
+import gzip
+import io
 import os
 from tornado import gen
 import platform
 import pytest
+import sys
 import tarfile
 import zipfile
 
@@ -1738,6 +1741,120 @@ name: broken
 """}, check)
 
 
+def _with_recording_conda_manager(f, ok=(), fix_errors=None):
+    calls = []
+
+    class RecordingCondaManager(CondaManager):
+        def find_environment_deviations(self, prefix, spec):
+            calls.append(('find', spec.name))
+            if fix_errors is not None and fix_errors.get(spec.name) == 'find':
+                raise CondaManagerError("cannot look at %s" % spec.name)
+            return CondaEnvironmentDeviations(summary=("OK" if spec.name in ok else "missing stuff"),
+                                              missing_packages=(() if spec.name in ok else ('foo', )),
+                                              wrong_version_packages=(),
+                                              missing_pip_packages=(),
+                                              wrong_version_pip_packages=())
+
+        def fix_environment_deviations(self, prefix, spec, deviations=None, create=True):
+            assert deviations is not None
+            calls.append(('fix', spec.name))
+            if fix_errors is not None and fix_errors.get(spec.name) == 'fix':
+                raise CondaManagerError("cannot fix %s" % spec.name)
+
+        def remove_packages(self, prefix, packages):
+            pass
+
+    push_conda_manager_class(RecordingCondaManager)
+    try:
+        f(calls)
+    finally:
+        pop_conda_manager_class()
+
+
+_inheriting_env_specs_project = {
+    DEFAULT_PROJECT_FILENAME: """
+name: inheriting
+packages: [python]
+env_specs:
+  base: {}
+  child:
+    inherit_from: base
+  grandchild:
+    inherit_from: child
+  other: {}
+"""
+}
+
+
+def test_env_spec_groups():
+    def check(dirname):
+        project = project_no_dedicated_env(dirname)
+        assert [] == project.problems
+        assert [['base', 'child', 'grandchild'], ['other']] == project_ops._env_spec_groups(project.env_specs)
+
+    with_directory_contents(_inheriting_env_specs_project, check)
+
+
+def test_prepare_all_env_specs():
+    def check(dirname):
+        def attempt(calls):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.prepare_all_env_specs(project, max_workers=2)
+            assert status
+            assert "Prepared 4 environments." == status.status_description
+            assert [] == status.errors
+            # all deviations are found before we fix anything
+            assert set([('find', name) for name in ('base', 'child', 'grandchild', 'other')]) == set(calls[:4])
+            fixes = [call[1] for call in calls[4:]]
+            assert ['child', 'grandchild', 'other'] == sorted(fixes)
+            # parents are fixed before children
+            assert fixes.index('child') < fixes.index('grandchild')
+            # logs come out in a stable order
+            envs = os.path.join(dirname, "envs")
+            assert [
+                "Environment 'base' is up to date in %s." % os.path.join(envs, "base"),
+                "Updating environment 'child' in %s: missing stuff" % os.path.join(envs, "child"),
+                "Updating environment 'grandchild' in %s: missing stuff" % os.path.join(envs, "grandchild"),
+                "Updating environment 'other' in %s: missing stuff" % os.path.join(envs, "other")
+            ] == status.logs
+
+        _with_recording_conda_manager(attempt, ok=('base', ))
+
+    with_directory_contents(_inheriting_env_specs_project, check)
+
+
+def test_prepare_all_env_specs_with_errors():
+    def check(dirname):
+        def attempt(calls):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.prepare_all_env_specs(project)
+            assert not status
+            assert "Failed to prepare all environments." == status.status_description
+            assert ["cannot look at child", "cannot fix other"] == status.errors
+            assert ('fix', 'child') not in calls
+            assert ('fix', 'grandchild') in calls
+
+        _with_recording_conda_manager(attempt, fix_errors=dict(child='find', other='fix'))
+
+    with_directory_contents(_inheriting_env_specs_project, check)
+
+
+def test_prepare_all_env_specs_broken_project():
+    def check(dirname):
+        def attempt(calls):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.prepare_all_env_specs(project)
+            assert not status
+            assert status.status_description == 'Unable to load the project.'
+            assert [] == calls
+
+        _with_recording_conda_manager(attempt)
+
+    with_directory_contents({DEFAULT_PROJECT_FILENAME: """
+name: broken
+"""}, check)
+
+
 def _monkeypatch_can_connect_to_socket_on_standard_redis_port(monkeypatch):
     from anaconda_project.plugins.network_util import can_connect_to_socket as real_can_connect_to_socket
 
@@ -2055,6 +2172,122 @@ services:
     with_directory_contents_completing_project_file(dict(), archivetest)
 
 
+def test_archive_zip_compresses_members():
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.zip")
+
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.archive(project, archivefile)
+            assert status
+
+            with zipfile.ZipFile(archivefile, mode='r') as zf:
+                assert zf.testzip() is None
+                big = zf.getinfo('archivedproj/big.txt')
+                assert big.compress_type == zipfile.ZIP_DEFLATED
+                assert big.compress_size < big.file_size // 10
+                assert zf.read('archivedproj/big.txt') == (("all work and no play\n" * 20000).encode('utf-8'))
+                assert zf.read('archivedproj/empty.txt') == b''
+                assert zf.getinfo('archivedproj/emptydir/').file_size == 0
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "big.txt": "all work and no play\n" * 20000,
+             "empty.txt": "",
+             "emptydir": None}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
+def test_archive_tar_gz_readable_by_gzip():
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.tar.gz")
+
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.archive(project, archivefile)
+            assert status
+
+            with gzip.open(archivefile, 'rb') as f:
+                with tarfile.open(fileobj=f, mode='r|') as tf:
+                    for member in tf:
+                        if member.name == 'archivedproj/big.txt':
+                            assert tf.extractfile(member).read() == (("all work and no play\n" * 20000
+                                                                      ).encode('utf-8'))
+                            break
+                    else:
+                        assert False, "big.txt not found"
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "big.txt": "all work and no play\n" * 20000}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
+def test_archive_zip_stores_incompressible_members():
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.zip")
+
+        def check(dirname):
+            random_bytes = os.urandom(100000)
+            with open(os.path.join(dirname, "random.bin"), 'wb') as f:
+                f.write(random_bytes)
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.archive(project, archivefile)
+            assert status
+            assert status.logs[-1].startswith("Compressed 3 files from ")
+            assert status.logs[-1].endswith("; stored 2 files (97.7K) that wouldn't compress.")
+
+            with zipfile.ZipFile(archivefile, mode='r') as zf:
+                assert zf.testzip() is None
+                # by extension, even though it would compress
+                assert zf.getinfo('archivedproj/picture.png').compress_type == zipfile.ZIP_STORED
+                # by looking at it
+                assert zf.getinfo('archivedproj/random.bin').compress_type == zipfile.ZIP_STORED
+                assert zf.read('archivedproj/random.bin') == random_bytes
+                assert zf.getinfo('archivedproj/big.txt').compress_type == zipfile.ZIP_DEFLATED
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n" + ("#" * 1000) + "\n",
+             "big.txt": "all work and no play\n" * 20000,
+             "picture.png": "not really a png"}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
+def test_archive_with_compression_level():
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            sizes = dict()
+            for level in (0, 1, 9):
+                for suffix in ("zip", "tar.gz", "tar.bz2"):
+                    archivefile = os.path.join(archive_dest_dir, "foo%d.%s" % (level, suffix))
+                    status = project_ops.archive(project, archivefile, compression_level=level)
+                    assert status
+                    sizes[(level, suffix)] = os.path.getsize(archivefile)
+            for suffix in ("zip", "tar.gz"):
+                assert sizes[(0, suffix)] > sizes[(1, suffix)]
+                assert sizes[(1, suffix)] >= sizes[(9, suffix)]
+
+            with zipfile.ZipFile(os.path.join(archive_dest_dir, "foo0.zip"), mode='r') as zf:
+                assert zf.getinfo('archivedproj/big.txt').compress_type == zipfile.ZIP_STORED
+            with tarfile.open(os.path.join(archive_dest_dir, "foo0.tar.gz"), mode='r:gz') as tf:
+                assert tf.extractfile('archivedproj/big.txt').read() == (("all work and no play\n" * 20000
+                                                                          ).encode('utf-8'))
+
+            status = project_ops.archive(project, os.path.join(archive_dest_dir, "foo.zip"), compression_level=10)
+            assert not status
+            assert status.errors == ["Compression level should be from 0 to 9, not 10."]
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "big.txt": "all work and no play\n" * 20000}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
 def test_archive_tar():
     def archivetest(archive_dest_dir):
         archivefile = os.path.join(archive_dest_dir, "foo.tar")
@@ -2172,14 +2405,347 @@ services:
     with_directory_contents_completing_project_file(dict(), archivetest)
 
 
+@pytest.mark.skipif(sys.version_info < (3, 3), reason="no lzma module")
+def test_archive_reproducible(monkeypatch):
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            assert [] == project.problems
+            foo = os.path.join(dirname, 'foo.py')
+            results = {}
+            for suffix in ('zip', 'tar.gz', 'tar.bz2', 'tar.xz'):
+                for (mtime, mode) in ((1000000000, 0o600), (1500000000, 0o664)):
+                    os.utime(foo, (mtime, mtime))
+                    os.chmod(foo, mode)
+                    archivefile = os.path.join(archive_dest_dir, 'foo.' + suffix)
+                    status = project_ops.archive(project, archivefile, reproducible=True)
+                    assert status
+                    with open(archivefile, 'rb') as f:
+                        results.setdefault(suffix, []).append(f.read())
+                assert results[suffix][0] == results[suffix][1]
+
+            with tarfile.open(os.path.join(archive_dest_dir, 'foo.tar.gz'), 'r:gz') as tf:
+                member = tf.getmember('archivedproj/foo.py')
+                assert (0, 0, '', '') == (member.uid, member.gid, member.uname, member.gname)
+                assert 0o644 == member.mode
+                assert 315532800 == member.mtime
+
+            with zipfile.ZipFile(os.path.join(archive_dest_dir, 'foo.zip'), 'r') as zf:
+                zinfo = zf.getinfo('archivedproj/foo.py')
+                assert (1980, 1, 1, 0, 0, 0) == zinfo.date_time
+                assert 0o644 == (zinfo.external_attr >> 16) & 0o777
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "foo.py": "print('hello')\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_archive_reproducible_uses_source_date_epoch(monkeypatch):
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            os.chmod(os.path.join(dirname, 'foo.py'), 0o700)
+            monkeypatch.setenv('SOURCE_DATE_EPOCH', '1500000000')
+            archivefile = os.path.join(archive_dest_dir, 'foo.tar')
+            status = project_ops.archive(project, archivefile + '.gz', reproducible=True)
+            assert status
+
+            with tarfile.open(archivefile + '.gz', 'r:gz') as tf:
+                member = tf.getmember('archivedproj/foo.py')
+                assert 1500000000 == member.mtime
+                assert 0o755 == member.mode
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "foo.py": "print('hello')\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def _test_archive_delta(suffix):
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            assert [] == project.problems
+            fullfile = os.path.join(archive_dest_dir, "full" + suffix)
+            status = project_ops.archive(project, fullfile, record_manifest=True)
+            assert status
+            unpacked = os.path.join(archive_dest_dir, "unpacked")
+            assert project_ops.unarchive(fullfile, unpacked)
+            # the unpacked project knows which version it is
+            assert os.path.isfile(os.path.join(unpacked, ".anaconda-project-manifest-digest.json"))
+
+            with open(os.path.join(dirname, "a", "b.py"), 'w') as f:
+                f.write("print('changed')\n")
+            with open(os.path.join(dirname, "new.py"), 'w') as f:
+                f.write("print('new')\n")
+            os.remove(os.path.join(dirname, "c", "d.py"))
+            os.rmdir(os.path.join(dirname, "emptydir"))
+            # a new mtime alone doesn't put a file in the delta
+            os.utime(os.path.join(dirname, "unchanged.py"), (1000000000, 1000000000))
+
+            deltafile = os.path.join(archive_dest_dir, "delta" + suffix)
+            status = project_ops.archive(project, deltafile, delta=True)
+            assert status
+            # c is now an empty directory, which is new
+            assert "Delta archive has 3 changed or new files and 2 deletions." in status.logs
+            assert sorted(status.manifest) == [os.path.join("a", "b.py"), "c", "new.py"]
+            if suffix == ".zip":
+                _assert_zip_contains(deltafile, ['.anaconda-project-delta.json', 'a/b.py', 'c/', 'new.py'])
+            else:
+                _assert_tar_contains(deltafile, ['.anaconda-project-delta.json', 'a/b.py', 'c', 'new.py'])
+
+            # we only delete files when asked to apply a delta
+            status = project_ops.unarchive(deltafile, unpacked)
+            assert not status
+            assert status.errors == [
+                "This is a delta archive, which can only be applied on top of an existing project."
+            ]
+            assert os.path.isfile(os.path.join(unpacked, "c", "d.py"))
+
+            expected_files = ['.anaconda-project-manifest-digest.json', 'a/b.py', 'anaconda-project-local.yml',
+                              'anaconda-project.yml', 'c', 'new.py', 'unchanged.py']
+            status = project_ops.unarchive(deltafile, unpacked, apply_delta=True)
+            assert status.errors == []
+            assert status
+            assert status.status_description == "Delta archive applied to %s." % os.path.realpath(unpacked)
+            _assert_dir_contains(unpacked, expected_files)
+            with open(os.path.join(unpacked, "a", "b.py")) as f:
+                assert f.read() == "print('changed')\n"
+
+            # the delta doesn't go on top of itself
+            status = project_ops.unarchive(deltafile, unpacked, apply_delta=True)
+            assert not status
+            assert status.errors == [
+                "The delta archive was made from another version of the project than the one in '%s'." %
+                os.path.realpath(unpacked)
+            ]
+
+            # nothing changed since the delta
+            status = project_ops.archive(project, deltafile, delta=True)
+            assert status
+            assert "Delta archive has 0 changed or new files and 0 deletions." in status.logs
+            assert project_ops.unarchive(deltafile, unpacked, apply_delta=True)
+            _assert_dir_contains(unpacked, expected_files)
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "a/b.py": "print('hello')\n",
+             "c/d.py": "print('goodbye')\n",
+             "emptydir": None,
+             "unchanged.py": "print('same')\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_archive_delta_zip():
+    _test_archive_delta(".zip")
+
+
+def test_archive_delta_tar_gz():
+    _test_archive_delta(".tar.gz")
+
+
+@pytest.mark.skipif(platform.system() == 'Windows', reason='Windows has no chmod permission bits')
+def test_archive_delta_has_mode_changes():
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            script = os.path.join(dirname, "sub", "deep", "a.py")
+            os.chmod(script, 0o755)
+            project = project_no_dedicated_env(dirname)
+            for suffix in (".zip", ".tar.gz"):
+                fullfile = os.path.join(archive_dest_dir, "full" + suffix)
+                assert project_ops.archive(project, fullfile, record_manifest=True)
+                unpacked = os.path.join(archive_dest_dir, "unpacked" + suffix)
+                assert project_ops.unarchive(fullfile, unpacked)
+                unpacked_script = os.path.join(unpacked, "sub", "deep", "a.py")
+                assert os.stat(unpacked_script).st_mode & 0o777 == 0o755
+
+                # chmod leaves the contents and mtime alone
+                os.chmod(script, 0o644)
+                deltafile = os.path.join(archive_dest_dir, "delta" + suffix)
+                status = project_ops.archive(project, deltafile, delta=True)
+                assert status
+                assert "Delta archive has 1 changed or new files and 0 deletions." in status.logs
+                assert status.manifest == [os.path.join("sub", "deep", "a.py")]
+
+                assert project_ops.unarchive(deltafile, unpacked, apply_delta=True)
+                assert os.stat(unpacked_script).st_mode & 0o777 == 0o644
+
+                os.chmod(script, 0o755)
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "sub/deep/a.py": "print('hello')\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_archive_delta_only_hashes_modified_files(monkeypatch):
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            import anaconda_project.archiver as archiver
+            real_hash_file = archiver._hash_file
+            hashed = []
+
+            def counting_hash_file(full_path):
+                hashed.append(os.path.basename(full_path))
+                return real_hash_file(full_path)
+
+            monkeypatch.setattr('anaconda_project.archiver._hash_file', counting_hash_file)
+            project = project_no_dedicated_env(dirname)
+            archivefile = os.path.join(archive_dest_dir, "foo.zip")
+            # an ordinary archive doesn't hash anything
+            assert project_ops.archive(project, archivefile)
+            assert [] == hashed
+
+            assert project_ops.archive(project, archivefile, record_manifest=True)
+            assert 'foo.py' in hashed
+
+            del hashed[:]
+            assert project_ops.archive(project, archivefile, record_manifest=True)
+            assert [] == hashed
+
+            os.utime(os.path.join(dirname, "foo.py"), (1000000000, 1000000000))
+            assert project_ops.archive(project, archivefile, delta=True)
+            assert ['foo.py'] == hashed
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "foo.py": "print('hello')\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_archive_delta_without_earlier_archive():
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            # an ordinary archive doesn't count
+            assert project_ops.archive(project, os.path.join(archive_dest_dir, "foo.zip"))
+            status = project_ops.archive(project, os.path.join(archive_dest_dir, "foo.zip"), delta=True)
+            assert not status
+            assert status.status_description == "Can't create an archive."
+            assert status.errors == ["There's no earlier archive of this project to make a delta archive from."]
+
+        with_directory_contents_completing_project_file({DEFAULT_PROJECT_FILENAME: "name: archivedproj\n"}, check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_upload_is_not_a_delta_base(monkeypatch):
+    def check(dirname):
+        with fake_server(monkeypatch, expected_basename='foo.tar.bz2'):
+            project = project_no_dedicated_env(dirname)
+            assert project_ops.upload(project, site='unit_test')
+            status = project_ops.archive(project, os.path.join(dirname, "foo.zip"), delta=True)
+            assert not status
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: "name: foo\n",
+         "foo.py": "print('hello')\n"}, check)
+
+
+def test_archive_tar_xz():
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.tar.xz")
+
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.archive(project, archivefile, threads=2)
+
+            assert status
+            _assert_tar_contains(archivefile,
+                                 ['foo.py', 'big.txt', 'anaconda-project.yml', 'anaconda-project-local.yml'])
+
+            # one xz stream, so it can be read in stream mode too
+            with tarfile.open(archivefile, mode='r|xz') as tf:
+                assert 'archivedproj/big.txt' in [member.name for member in tf]
+
+            unpacked = os.path.join(archive_dest_dir, "unpacked")
+            status = project_ops.unarchive(archivefile, unpacked)
+            assert status
+            with codecs.open(os.path.join(unpacked, "big.txt"), 'r', 'utf-8') as f:
+                assert f.read() == "all work and no play\n" * 20000
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "foo.py": "print('hello')\n",
+             "big.txt": "all work and no play\n" * 20000}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
+class _Pipe(object):
+    # a file object we can only write to, like a pipe
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def test_archive_to_fileobj():
+    def archivetest(archive_dest_dir):
+        def check(dirname):
+            project = project_no_dedicated_env(dirname)
+            suffixes = ["zip", "tar", "tar.gz", "tar.bz2"]
+            if sys.version_info >= (3, 3):
+                suffixes.append("tar.xz")
+            for suffix in suffixes:
+                pipe = _Pipe()
+                status = project_ops.archive(project, os.path.join(archive_dest_dir, "foo." + suffix), fileobj=pipe)
+                assert status
+                assert status.status_description == "Wrote .%s project archive." % suffix
+                data = io.BytesIO(b''.join(pipe.chunks))
+                if suffix == "zip":
+                    with zipfile.ZipFile(data, mode='r') as zf:
+                        assert zf.read('archivedproj/foo.py') == b"print('hello')\n"
+                else:
+                    with tarfile.open(fileobj=data, mode='r') as tf:
+                        assert tf.extractfile('archivedproj/foo.py').read() == b"print('hello')\n"
+            # nothing was written next to the archive names
+            assert os.listdir(archive_dest_dir) == [DEFAULT_PROJECT_FILENAME]
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "foo.py": "print('hello')\n"}, check)
+
+    with_directory_contents_completing_project_file(dict(), archivetest)
+
+
+def test_archive_to_broken_fileobj():
+    def check(dirname):
+        class BrokenPipe(object):
+            def write(self, data):
+                raise IOError("broken pipe")
+
+            def flush(self):
+                pass
+
+        project = project_no_dedicated_env(dirname)
+        status = project_ops.archive(project, "foo.tar.gz", fileobj=BrokenPipe())
+        assert not status
+        assert status.status_description == "Failed to write .tar.gz project archive."
+        assert status.errors == ["broken pipe"]
+
+    with_directory_contents_completing_project_file({"foo.py": "print('hello')\n"}, check)
+
+
 def test_archive_cannot_write_destination_path(monkeypatch):
     def archivetest(archive_dest_dir):
         archivefile = os.path.join(archive_dest_dir, "foo.zip")
 
-        def mock_ZipFile(*args, **kwargs):
+        def mock_ZipWriter(*args, **kwargs):
             raise IOError("NOPE")
 
-        monkeypatch.setattr('zipfile.ZipFile', mock_ZipFile)
+        monkeypatch.setattr('anaconda_project.archiver._ZipWriter', mock_ZipWriter)
 
         def check(dirname):
             # be sure we ignore this
@@ -2281,7 +2847,7 @@ def test_archive_zip_with_failing_git_command(monkeypatch):
             assert not status
             assert not os.path.exists(archivefile)
             # before the "." is the command output, but "false" has no output.
-            assert status.errors == ["'git ls-files' failed to list ignored files: ."]
+            assert status.errors == ["'git ls-files' failed to list project files: ."]
 
         with_directory_contents_completing_project_file(
             _add_empty_git({DEFAULT_PROJECT_FILENAME: """
@@ -2337,10 +2903,10 @@ def test_archive_zip_with_inability_to_walk_directory(monkeypatch):
             project = project_no_dedicated_env(dirname)
             assert project.problems == []
 
-            def mock_os_walk(dirname):
+            def mock_scandir(dirname):
                 raise OSError("NOPE")
 
-            monkeypatch.setattr('os.walk', mock_os_walk)
+            monkeypatch.setattr('anaconda_project.archiver.scandir', mock_scandir)
 
             status = project_ops.archive(project, archivefile)
 
@@ -2351,10 +2917,10 @@ def test_archive_zip_with_inability_to_walk_directory(monkeypatch):
             assert status.errors[0].startswith("Could not list files in")
 
         with_directory_contents_completing_project_file(
-            _add_empty_git({DEFAULT_PROJECT_FILENAME: """
+            {DEFAULT_PROJECT_FILENAME: """
 name: archivedproj
         """,
-                            "foo.py": "print('hello')\n"}), check)
+             "foo.py": "print('hello')\n"}, check)
 
     with_directory_contents_completing_project_file(dict(), archivetest)
 
@@ -2410,7 +2976,8 @@ def test_archive_with_bogus_filename(monkeypatch):
 
             assert not status
             assert not os.path.exists(archivefile)
-            assert status.status_description == "Project archive filename must be a .zip, .tar.gz, or .tar.bz2."
+            assert status.status_description == ("Project archive filename must be a .zip, .tar.gz, .tar.bz2, " +
+                                                 "or .tar.xz.")
             assert status.errors == ["Unsupported archive filename %s." % archivefile]
 
         with_directory_contents_completing_project_file(
@@ -2581,6 +3148,9 @@ def _make_tar(archive_dest_dir, contents, compression=None):
     elif compression == 'bz2':
         mode = mode + ':bz2'
         extension = extension + '.bz2'
+    elif compression == 'xz':
+        mode = mode + ':xz'
+        extension = extension + '.xz'
 
     # the tarfile API only lets us put in files, so we need
     # files to put in
@@ -2652,6 +3222,171 @@ def test_unarchive_tar_bz2():
     _test_unarchive_tar(compression='bz2')
 
 
+@pytest.mark.skipif(sys.version_info < (3, 3), reason="no lzma module")
+def test_unarchive_tar_xz():
+    _test_unarchive_tar(compression='xz')
+
+
+def _make_delta_zip(archive_dest_dir, deleted, base_digest="abc"):
+    archivefile = os.path.join(archive_dest_dir, "delta.zip")
+    delta = '{"deleted": %s, "base_manifest_digest": "%s", "manifest_digest": "def"}' % (deleted, base_digest)
+    with zipfile.ZipFile(archivefile, 'w') as zf:
+        zf.writestr("a/.anaconda-project-delta.json", delta)
+        zf.writestr("a/b.txt", "hello")
+    return archivefile
+
+
+def _make_delta_base(dirname, digest="abc"):
+    os.makedirs(dirname)
+    with open(os.path.join(dirname, ".anaconda-project-manifest-digest.json"), 'w') as f:
+        f.write('{"manifest_digest": "%s"}' % digest)
+
+
+def test_unarchive_delta():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '["x.txt"]')
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            _make_delta_base(unpacked)
+            with open(os.path.join(unpacked, "x.txt"), 'w') as f:
+                f.write("hello")
+            status = project_ops.unarchive(archivefile, unpacked, apply_delta=True)
+            assert status
+            _assert_dir_contains(unpacked, ['.anaconda-project-manifest-digest.json', 'b.txt'])
+            with open(os.path.join(unpacked, ".anaconda-project-manifest-digest.json")) as f:
+                assert '{"manifest_digest": "def"}' == f.read()
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_delta_needs_apply_delta():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '["x.txt"]')
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            _make_delta_base(unpacked)
+            with open(os.path.join(unpacked, "x.txt"), 'w') as f:
+                f.write("hello")
+            status = project_ops.unarchive(archivefile, unpacked)
+            assert not status
+            assert status.errors == [
+                "This is a delta archive, which can only be applied on top of an existing project."
+            ]
+            _assert_dir_contains(unpacked, ['.anaconda-project-manifest-digest.json', 'x.txt'])
+
+            # not even into a new directory
+            status = project_ops.unarchive(archivefile, os.path.join(dirname, "bar"))
+            assert not status
+            assert not os.path.exists(os.path.join(dirname, "bar"))
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_apply_delta_of_ordinary_archive():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_zip(archive_dest_dir, {'a/a.txt': _CONTENTS_FILE})
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            _make_delta_base(unpacked)
+            status = project_ops.unarchive(archivefile, unpacked, apply_delta=True)
+            assert not status
+            assert status.errors == ["This is not a delta archive."]
+            _assert_dir_contains(unpacked, ['.anaconda-project-manifest-digest.json'])
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_delta_onto_another_version():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '["x.txt"]')
+
+        def check(dirname):
+            for (name, digest) in (("other", "not abc"), ("unrecorded", None)):
+                unpacked = os.path.join(dirname, name)
+                if digest is None:
+                    os.makedirs(unpacked)
+                else:
+                    _make_delta_base(unpacked, digest)
+                with open(os.path.join(unpacked, "x.txt"), 'w') as f:
+                    f.write("hello")
+                status = project_ops.unarchive(archivefile, unpacked, apply_delta=True)
+                assert not status
+                assert status.errors == [
+                    "The delta archive was made from another version of the project than the one in '%s'." %
+                    os.path.realpath(unpacked)
+                ]
+                # nothing was touched
+                assert os.path.isfile(os.path.join(unpacked, "x.txt"))
+                assert not os.path.exists(os.path.join(unpacked, "b.txt"))
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_delta_needs_existing_directory():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '[]')
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            status = project_ops.unarchive(archivefile, unpacked, apply_delta=True)
+            assert not status
+            assert status.errors == ["Directory '%s' doesn't exist, so there's nothing to apply the delta archive to." %
+                                     os.path.realpath(unpacked)]
+            assert not os.path.exists(unpacked)
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_delta_deleting_outside_project():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '["x.txt", "../precious.txt"]')
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            _make_delta_base(unpacked)
+            for path in (os.path.join(unpacked, "x.txt"), os.path.join(dirname, "precious.txt")):
+                with open(path, 'w') as f:
+                    f.write("hello")
+            status = project_ops.unarchive(archivefile, unpacked, apply_delta=True)
+            assert not status
+            assert status.errors == ["Archive deletes '../precious.txt' which is outside '%s'." %
+                                     os.path.realpath(unpacked)]
+            # nothing was touched
+            _assert_dir_contains(unpacked, ['.anaconda-project-manifest-digest.json', 'x.txt'])
+            assert os.path.exists(os.path.join(dirname, "precious.txt"))
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
+def test_unarchive_broken_delta():
+    def archivetest(archive_dest_dir):
+        archivefile = _make_delta_zip(archive_dest_dir, '[42]')
+
+        def check(dirname):
+            status = project_ops.unarchive(archivefile, dirname, apply_delta=True)
+            assert not status
+            assert status.errors[0].startswith("Archive has a broken .anaconda-project-delta.json: ")
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
 def test_unarchive_zip():
     def archivetest(archive_dest_dir):
         archivefile = _make_zip(archive_dest_dir, {'a/a.txt': _CONTENTS_FILE,
@@ -2677,6 +3412,49 @@ def test_unarchive_zip():
     with_directory_contents(dict(), archivetest)
 
 
+def test_unarchive_zip_restores_mtime_and_permissions(monkeypatch):
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.zip")
+
+        def check(dirname):
+            script = os.path.join(dirname, "bin", "run.sh")
+            os.chmod(script, 0o755)
+            long_ago = 1000000000
+            for path in (script, os.path.join(dirname, "bin")):
+                os.utime(path, (long_ago, long_ago))
+            project = project_no_dedicated_env(dirname)
+            assert project_ops.archive(project, archivefile)
+
+        with_directory_contents_completing_project_file(
+            {DEFAULT_PROJECT_FILENAME: "name: archivedproj\n",
+             "bin/run.sh": "echo hello\n",
+             "data/big.txt": "all work and no play\n" * 20000}, check)
+
+        def no_extractall(*args, **kwargs):
+            raise AssertionError("should stream members instead")
+
+        monkeypatch.setattr('zipfile.ZipFile.extractall', no_extractall)
+
+        def check_unpacked(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            status = project_ops.unarchive(archivefile, unpacked)
+            assert status
+
+            script = os.path.join(unpacked, "bin", "run.sh")
+            with codecs.open(script, 'r', 'utf-8') as f:
+                assert f.read() == "echo hello\n"
+            with codecs.open(os.path.join(unpacked, "data", "big.txt"), 'r', 'utf-8') as f:
+                assert f.read() == "all work and no play\n" * 20000
+            if platform.system() != 'Windows':
+                assert os.stat(script).st_mode & 0o777 == 0o755
+            # zip times have two second resolution
+            assert abs(os.path.getmtime(script) - 1000000000) <= 2
+
+        with_directory_contents(dict(), check_unpacked)
+
+    with_directory_contents(dict(), archivetest)
+
+
 def test_unarchive_zip_to_current_directory():
     def archivetest(archive_dest_dir):
         archivefile = _make_zip(archive_dest_dir, {'a/a.txt': _CONTENTS_FILE,
@@ -2805,7 +3583,7 @@ def test_unarchive_error_on_bad_extension():
             unpacked = os.path.join(dirname, "foo")
             status = project_ops.unarchive(archivefile, unpacked)
 
-            message = "Unsupported archive filename %s, must be a .zip, .tar.gz, or .tar.bz2" % archivefile
+            message = "Unsupported archive filename %s, must be a .zip, .tar.gz, .tar.bz2, or .tar.xz" % archivefile
             assert status.errors == [message]
             assert not status
             assert not os.path.isdir(unpacked)
@@ -2845,7 +3623,8 @@ def test_unarchive_error_on_corrupt_tar():
             unpacked = os.path.join(dirname, "foo")
             status = project_ops.unarchive(archivefile, unpacked)
 
-            message = "file could not be opened successfully"
+            # what tarfile says when streaming something that isn't a tar
+            message = "truncated header"
             assert status.errors == [message]
             assert not status
             assert not os.path.isdir(unpacked)
@@ -2920,6 +3699,64 @@ def test_unarchive_tar_ignores_symlink():
     with_directory_contents(dict(), archivetest)
 
 
+def test_unarchive_tar_in_one_pass(monkeypatch):
+    def archivetest(archive_dest_dir):
+        archivefile = os.path.join(archive_dest_dir, "foo.tar.gz")
+        long_ago = 1000000000
+        with tarfile.open(archivefile, 'w:gz') as tf:
+            for name in ('a', 'a/q'):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                info.mtime = long_ago
+                tf.addfile(info)
+            for name in ('a/q/b.txt', 'a/a.txt'):
+                info = tarfile.TarInfo(name)
+                info.size = 5
+                info.mtime = long_ago
+                tf.addfile(info, io.BytesIO(b"hello"))
+            # a link with the same name as a file we want is still not a file we want
+            info = tarfile.TarInfo('a/a.txt')
+            info.type = tarfile.SYMTYPE
+            info.linkname = '/etc/passwd'
+            tf.addfile(info)
+
+        def no_getmember(*args, **kwargs):
+            raise AssertionError("getmember searches all the members")
+
+        monkeypatch.setattr('tarfile.TarFile.getmember', no_getmember)
+
+        modes = []
+        real_open = tarfile.open
+
+        def recording_open(*args, **kwargs):
+            modes.append(kwargs.get('mode'))
+            return real_open(*args, **kwargs)
+
+        monkeypatch.setattr('tarfile.open', recording_open)
+
+        def check(dirname):
+            unpacked = os.path.join(dirname, "foo")
+            status = project_ops.unarchive(archivefile, unpacked)
+            # one pass to list the names and one to extract, both streaming
+            assert ['r|*', 'r|*'] == modes
+
+            assert status.errors == []
+            assert status
+            _assert_dir_contains(unpacked, ['a.txt', 'q/b.txt'])
+            assert not os.path.islink(os.path.join(unpacked, 'a.txt'))
+            with codecs.open(os.path.join(unpacked, 'a.txt'), 'r', 'utf-8') as f:
+                assert f.read() == "hello"
+            # directory times are restored after their contents are written
+            assert os.path.getmtime(os.path.join(unpacked, 'q')) == long_ago
+            assert os.path.getmtime(os.path.join(unpacked, 'q', 'b.txt')) == long_ago
+            assert status.logs[0] == "Unpacking a/q to %s" % os.path.join(unpacked, 'q')
+
+        with_directory_contents(dict(), check)
+
+    with_directory_contents(dict(), archivetest)
+
+
 def test_unarchive_tar_error_on_relative_path():
     def archivetest(archive_dest_dir):
         archivefile = _make_tar(archive_dest_dir, {'a/../a.txt': _CONTENTS_FILE})
@@ -3198,6 +4035,55 @@ def test_upload(monkeypatch):
          "foo.py": "print('hello')\n"}, check)
 
 
+def _count_uploads(monkeypatch):
+    from anaconda_project.client import _Client
+    real_upload = _Client.upload
+    uploads = []
+
+    def counting_upload(self, *args, **kwargs):
+        uploads.append(args)
+        return real_upload(self, *args, **kwargs)
+
+    monkeypatch.setattr('anaconda_project.client._Client.upload', counting_upload)
+    return uploads
+
+
+def test_upload_skips_unchanged_project(monkeypatch):
+    def check(dirname):
+        uploads = _count_uploads(monkeypatch)
+        with fake_server(monkeypatch, expected_basename='foo.tar.bz2'):
+            project = project_no_dedicated_env(dirname)
+            status = project_ops.upload(project, site='unit_test')
+            assert status
+            assert status.status_description == "Upload successful."
+            assert len(uploads) == 1
+
+            # touching a file doesn't change a reproducible archive
+            os.utime(os.path.join(dirname, "foo.py"), (1000000000, 1000000000))
+            status = project_ops.upload(project, site='unit_test')
+            assert status
+            assert status.status_description == ("Project is unchanged since it was last uploaded, "
+                                                 "not uploading it again.")
+            assert status.url == 'http://example.com/whatevs'
+            assert len(uploads) == 1
+
+            status = project_ops.upload(project, site='unit_test', force=True)
+            assert status
+            assert status.status_description == "Upload successful."
+            assert len(uploads) == 2
+
+            with open(os.path.join(dirname, "foo.py"), 'w') as f:
+                f.write("print('goodbye')\n")
+            status = project_ops.upload(project, site='unit_test')
+            assert status
+            assert status.status_description == "Upload successful."
+            assert len(uploads) == 3
+
+    with_directory_contents_completing_project_file(
+        {DEFAULT_PROJECT_FILENAME: "name: foo\n",
+         "foo.py": "print('hello')\n"}, check)
+
+
 def test_upload_with_project_file_problems():
     def check(dirname):
         project = Project(dirname)
@@ -3214,10 +4100,10 @@ def test_upload_cannot_walk_directory(monkeypatch):
         project = project_no_dedicated_env(dirname)
         assert [] == project.problems
 
-        def mock_os_walk(dirname):
+        def mock_scandir(dirname):
             raise OSError("NOPE")
 
-        monkeypatch.setattr('os.walk', mock_os_walk)
+        monkeypatch.setattr('anaconda_project.archiver.scandir', mock_scandir)
 
         status = project_ops.upload(project, site='unit_test')
         assert not status
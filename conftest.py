@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Copyright © 2016, Continuum Analytics, Inc. All rights reserved.
+#
+# The full license is in the file LICENSE.txt, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import absolute_import
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _private_user_cache(monkeypatch, tmpdir):
+    # keep tests from sharing downloads (and everything else) through the real per-user cache
+    monkeypatch.setenv('ANACONDA_PROJECT_CACHE_DIR', str(tmpdir.join("user-cache")))